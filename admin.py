@@ -3,6 +3,8 @@ from typing import ClassVar
 from sqladmin import Admin, ModelView
 from sqladmin.authentication import AuthenticationBackend
 from sqladmin.filters import ForeignKeyFilter
+from sqlalchemy import Select
+from sqlalchemy.orm import undefer
 from starlette.requests import Request
 
 from config import config
@@ -47,6 +49,8 @@ class ChatAdmin(ModelView, model=Chat):
         Chat.id,
         Chat.chat_type,
         Chat.title,
+        Chat.messages_count,
+        Chat.enriched_messages_count,
         Chat.created_at,
         Chat.updated_at,
     ]
@@ -57,7 +61,14 @@ class ChatAdmin(ModelView, model=Chat):
     can_edit = True
     can_delete = False
 
-    form_excluded_columns: ClassVar = ["raw_data", "created_at", "updated_at"]
+    form_excluded_columns: ClassVar = ["raw_data", "messages_count", "enriched_messages_count", "created_at", "updated_at"]
+
+    def list_query(self, request: Request) -> Select:
+        # Counters are deferred on the model, load them with the page instead of one query per row
+        return super().list_query(request).options(undefer(Chat.messages_count), undefer(Chat.enriched_messages_count))
+
+    def details_query(self, request: Request) -> Select:
+        return super().details_query(request).options(undefer(Chat.messages_count), undefer(Chat.enriched_messages_count))
 
 
 class UserAdmin(ModelView, model=User):
@@ -274,12 +285,12 @@ class EnrichedMessageAdmin(ModelView, model=EnrichedMessage):
     can_edit = True
     can_delete = False
 
-    form_excluded_columns: ClassVar = ["embeddings"]
-    column_details_exclude_list: ClassVar = ["embeddings"]
+    form_excluded_columns: ClassVar = ["embedding", "embeddings"]
+    column_details_exclude_list: ClassVar = ["embedding", "embeddings"]
 
     def has_embeddings(self, obj: EnrichedMessage) -> str:
         """Check if message has embeddings"""
-        return "Yes" if obj.embeddings is not None else "No"
+        return "Yes" if obj.embedding is not None else "No"
 
 
 class AdminAuth(AuthenticationBackend):
@@ -300,8 +311,8 @@ class AdminAuth(AuthenticationBackend):
         return request.session.get("admin_auth", False)
 
 
-def setup_admin(app, engine):
-    """Setup admin panel with authentication"""
+def setup_admin(app, engine, session_maker=None):
+    """Setup admin panel with authentication, session_maker takes precedence over engine when given"""
     # Create authentication backend
     auth_backend = AdminAuth(secret_key=config.secret_key)
 
@@ -309,6 +320,7 @@ def setup_admin(app, engine):
     admin = Admin(
         app,
         engine,
+        session_maker=session_maker,
         title="Superchromia Admin",
         authentication_backend=auth_backend,
         base_url="/admin" if config.force_https else None,
@@ -0,0 +1,53 @@
+"""add_chat_sync_state_table
+
+Revision ID: 3f2a9c1d7e45
+Revises: b4e332b18255
+Create Date: 2026-10-18 09:12:41.532118
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f2a9c1d7e45"
+down_revision: Union[str, Sequence[str], None] = "b4e332b18255"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "chat_sync_state",
+        sa.Column("chat_id", sa.BigInteger(), nullable=False),
+        sa.Column("high_watermark", sa.BigInteger(), nullable=True),
+        sa.Column("low_watermark", sa.BigInteger(), nullable=True),
+        sa.Column("top_message", sa.BigInteger(), nullable=True),
+        sa.Column("backfill_status", sa.String(length=20), nullable=False, server_default="pending"),
+        sa.Column("last_synced_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.ForeignKeyConstraint(["chat_id"], ["chats.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("chat_id"),
+    )
+
+    # Seed only the high watermark from already fetched messages. The old fetcher may have left gaps
+    # below it, so the backfill of the first run verifies the whole history from there downwards
+    op.execute(
+        """
+        INSERT INTO chat_sync_state (chat_id, high_watermark, backfill_status)
+        SELECT chat_id, MAX(message_id), 'pending'
+        FROM messages
+        WHERE chat_id IN (SELECT id FROM chats)
+        GROUP BY chat_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("chat_sync_state")
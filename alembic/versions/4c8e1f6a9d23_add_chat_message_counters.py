@@ -0,0 +1,80 @@
+"""add_chat_message_counters
+
+Revision ID: 4c8e1f6a9d23
+Revises: 6d3f9a2e7b14
+Create Date: 2026-10-18 17:41:09.215873
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4c8e1f6a9d23"
+down_revision: Union[str, Sequence[str], None] = "6d3f9a2e7b14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, chats counter column) pairs kept in sync by the triggers
+COUNTED_TABLES = (
+    ("messages", "messages_count"),
+    ("messages_enriched", "enriched_messages_count"),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("chats", sa.Column("messages_count", sa.BigInteger(), server_default="0", nullable=False))
+    op.add_column("chats", sa.Column("enriched_messages_count", sa.BigInteger(), server_default="0", nullable=False))
+
+    # One UPDATE of chats per statement instead of per row. Transition tables of INSERT ... ON CONFLICT DO UPDATE
+    # only hold the rows that were actually inserted, so upserts of existing messages leave the counters alone
+    op.execute(
+        """
+        CREATE FUNCTION chats_count_rows() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                EXECUTE format(
+                    'UPDATE chats SET %1$I = chats.%1$I + d.n '
+                    'FROM (SELECT chat_id, count(*) AS n FROM new_rows GROUP BY chat_id) d WHERE chats.id = d.chat_id',
+                    TG_ARGV[0]
+                );
+            ELSE
+                EXECUTE format(
+                    'UPDATE chats SET %1$I = chats.%1$I - d.n '
+                    'FROM (SELECT chat_id, count(*) AS n FROM old_rows GROUP BY chat_id) d WHERE chats.id = d.chat_id',
+                    TG_ARGV[0]
+                );
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    for table, column in COUNTED_TABLES:
+        op.execute(
+            f"CREATE TRIGGER {table}_count_insert AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION chats_count_rows('{column}')"
+        )
+        op.execute(
+            f"CREATE TRIGGER {table}_count_delete AFTER DELETE ON {table} REFERENCING OLD TABLE AS old_rows "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION chats_count_rows('{column}')"
+        )
+        # The triggers lock out concurrent writes until commit, so the backfill cannot miss rows
+        op.execute(
+            f"UPDATE chats SET {column} = c.n FROM (SELECT chat_id, count(*) AS n FROM {table} GROUP BY chat_id) c "
+            "WHERE chats.id = c.chat_id"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, _ in COUNTED_TABLES:
+        op.execute(f"DROP TRIGGER {table}_count_delete ON {table}")
+        op.execute(f"DROP TRIGGER {table}_count_insert ON {table}")
+    op.execute("DROP FUNCTION chats_count_rows()")
+    op.drop_column("chats", "enriched_messages_count")
+    op.drop_column("chats", "messages_count")
@@ -0,0 +1,55 @@
+"""add_processing_jobs_retry_state
+
+Revision ID: 6d3f9a2e7b14
+Revises: e2b7c4d91a06
+Create Date: 2026-10-18 15:12:44.902317
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "6d3f9a2e7b14"
+down_revision: Union[str, Sequence[str], None] = "e2b7c4d91a06"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("processing_jobs", sa.Column("kind", sa.String(length=20), server_default="enrich_message", nullable=False))
+    op.add_column("processing_jobs", sa.Column("attempts", sa.Integer(), server_default="0", nullable=False))
+    op.add_column(
+        "processing_jobs",
+        sa.Column("next_attempt_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+    )
+    op.add_column("processing_jobs", sa.Column("locked_until", sa.DateTime(timezone=True), nullable=True))
+    # Jobs that failed before retries existed get another chance
+    op.execute("UPDATE processing_jobs SET status = 'pending', attempts = 1 WHERE status = 'failed'")
+
+    op.drop_constraint("processing_jobs_pkey", "processing_jobs", type_="primary")
+    op.create_primary_key("processing_jobs_pkey", "processing_jobs", ["kind", "chat_id", "message_id"])
+    op.drop_index("ix_processing_jobs_status", table_name="processing_jobs")
+    op.create_index("ix_processing_jobs_claim", "processing_jobs", ["kind", "status", "next_attempt_at"], unique=False)
+    op.create_index("ix_processing_jobs_chat_message", "processing_jobs", ["chat_id", "message_id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_processing_jobs_chat_message", table_name="processing_jobs")
+    op.drop_index("ix_processing_jobs_claim", table_name="processing_jobs")
+    op.create_index("ix_processing_jobs_status", "processing_jobs", ["status"], unique=False)
+    op.execute("DELETE FROM processing_jobs WHERE kind <> 'enrich_message'")
+    op.drop_constraint("processing_jobs_pkey", "processing_jobs", type_="primary")
+    op.create_primary_key("processing_jobs_pkey", "processing_jobs", ["chat_id", "message_id"])
+    op.execute("UPDATE processing_jobs SET status = 'pending' WHERE status = 'running'")
+    op.execute("UPDATE processing_jobs SET status = 'failed' WHERE status = 'dead'")
+
+    op.drop_column("processing_jobs", "locked_until")
+    op.drop_column("processing_jobs", "next_attempt_at")
+    op.drop_column("processing_jobs", "attempts")
+    op.drop_column("processing_jobs", "kind")
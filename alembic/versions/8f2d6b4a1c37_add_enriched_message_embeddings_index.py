@@ -0,0 +1,46 @@
+"""add_enriched_message_embeddings_index
+
+Revision ID: 8f2d6b4a1c37
+Revises: 4c8e1f6a9d23
+Create Date: 2026-10-18 19:02:51.634190
+
+"""
+
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8f2d6b4a1c37"
+down_revision: Union[str, Sequence[str], None] = "4c8e1f6a9d23"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # binary_quantize and HNSW over bit need pgvector 0.7. Updating the extension is left to the database
+    # administrator, migrations run at app start and must not change the server
+    with op.get_context().autocommit_block():
+        version = op.get_bind().execute(sa.text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        if tuple(int(part) for part in version.split(".")[:2]) < (0, 7):
+            # Search falls back to an exact scan without the index
+            logger.warning(f"pgvector {version} cannot index 4096 dimensional embeddings, skipping the search index, pgvector 0.7 is required")
+            return
+
+        # Vector indexes are limited to 2000 dimensions, bit allows 64000. Search re-ranks the candidates exactly
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_enriched_embeddings_bq_hnsw ON messages_enriched "
+            "USING hnsw ((binary_quantize(embeddings)::bit(4096)) bit_hamming_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_enriched_embeddings_bq_hnsw")
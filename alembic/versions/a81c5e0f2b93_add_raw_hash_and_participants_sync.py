@@ -0,0 +1,35 @@
+"""add_raw_hash_and_participants_sync
+
+Revision ID: a81c5e0f2b93
+Revises: 3f2a9c1d7e45
+Create Date: 2026-10-18 11:40:03.118204
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a81c5e0f2b93"
+down_revision: Union[str, Sequence[str], None] = "3f2a9c1d7e45"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("chats", sa.Column("raw_hash", sa.String(length=64), nullable=True))
+    op.add_column("chats", sa.Column("participants_synced_count", sa.Integer(), nullable=True))
+    op.add_column("chats", sa.Column("participants_synced_at", sa.DateTime(timezone=True), nullable=True))
+    op.add_column("users", sa.Column("raw_hash", sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "raw_hash")
+    op.drop_column("chats", "participants_synced_at")
+    op.drop_column("chats", "participants_synced_count")
+    op.drop_column("chats", "raw_hash")
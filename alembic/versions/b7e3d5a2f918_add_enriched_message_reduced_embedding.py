@@ -0,0 +1,70 @@
+"""add_enriched_message_reduced_embedding
+
+Revision ID: b7e3d5a2f918
+Revises: 8f2d6b4a1c37
+Create Date: 2026-10-18 20:26:37.508412
+
+"""
+
+import logging
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from pgvector.sqlalchemy import HALFVEC, Vector
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b7e3d5a2f918"
+down_revision: Union[str, Sequence[str], None] = "8f2d6b4a1c37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+# Fixed here instead of read from the environment so that every database ends up with the same column.
+# EMBEDDING_DIMENSIONS and EMBEDDING_HALF_PRECISION must describe it, the app refuses to start otherwise
+EMBEDDING_DIMENSIONS = 1024
+
+
+def pgvector_version() -> tuple[int, ...]:
+    version = op.get_bind().execute(sa.text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return tuple(int(part) for part in version.split(".")[:2])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # halfvec needs pgvector 0.7, older servers keep full precision
+    half = pgvector_version() >= (0, 7)
+    if not half:
+        logger.warning("pgvector has no halfvec, storing embeddings as vector, run the app with EMBEDDING_HALF_PRECISION=false")
+
+    # Filled for existing rows by the reproject_embeddings job
+    op.add_column("messages_enriched", sa.Column("embedding", (HALFVEC if half else Vector)(EMBEDDING_DIMENSIONS), nullable=True))
+
+    with op.get_context().autocommit_block():
+        # Search moves to the new column
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_enriched_embeddings_bq_hnsw")
+        # Lets the job find rows left to re-project without scanning the table, empty once it is done
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_enriched_embedding_pending ON messages_enriched (chat_id, message_id) "
+            "WHERE embedding IS NULL AND embeddings IS NOT NULL"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_enriched_embedding_hnsw ON messages_enriched "
+            f"USING hnsw (embedding {'halfvec' if half else 'vector'}_cosine_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Embeddings whose full vectors were already dropped stay unsearchable
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_enriched_embedding_hnsw")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_enriched_embedding_pending")
+        if pgvector_version() >= (0, 7):
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_enriched_embeddings_bq_hnsw ON messages_enriched "
+                "USING hnsw ((binary_quantize(embeddings)::bit(4096)) bit_hamming_ops)"
+            )
+    op.drop_column("messages_enriched", "embedding")
@@ -0,0 +1,37 @@
+"""add_messages_chat_message_index
+
+Revision ID: c5d7e2a4f016
+Revises: a81c5e0f2b93
+Create Date: 2026-10-18 13:05:27.604913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c5d7e2a4f016"
+down_revision: Union[str, Sequence[str], None] = "a81c5e0f2b93"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Primary key is (message_id, chat_id), keyset scans per chat need chat_id first.
+    # Built concurrently so ingest is not blocked on large tables
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_chat_message",
+            "messages",
+            ["chat_id", "message_id"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_messages_chat_message", table_name="messages", postgresql_concurrently=True, if_exists=True)
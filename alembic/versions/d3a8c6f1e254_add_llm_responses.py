@@ -0,0 +1,39 @@
+"""add_llm_responses
+
+Revision ID: d3a8c6f1e254
+Revises: b7e3d5a2f918
+Create Date: 2026-10-18 21:12:44.906137
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d3a8c6f1e254"
+down_revision: Union[str, Sequence[str], None] = "b7e3d5a2f918"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "llm_responses",
+        sa.Column("key", sa.String(length=64), nullable=False),
+        sa.Column("model", sa.String(length=100), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.Column("last_used_at", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+    )
+    op.create_index("ix_llm_responses_last_used_at", "llm_responses", ["last_used_at"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_llm_responses_last_used_at", table_name="llm_responses")
+    op.drop_table("llm_responses")
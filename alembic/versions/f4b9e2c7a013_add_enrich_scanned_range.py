@@ -0,0 +1,31 @@
+"""add_enrich_scanned_range
+
+Revision ID: f4b9e2c7a013
+Revises: d3a8c6f1e254
+Create Date: 2026-10-18 23:05:17.402861
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f4b9e2c7a013"
+down_revision: Union[str, Sequence[str], None] = "d3a8c6f1e254"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("chat_sync_state", sa.Column("enrich_scanned_low", sa.BigInteger(), nullable=True))
+    op.add_column("chat_sync_state", sa.Column("enrich_scanned_high", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("chat_sync_state", "enrich_scanned_high")
+    op.drop_column("chat_sync_state", "enrich_scanned_low")
@@ -1,6 +1,10 @@
 from fastapi import APIRouter
 
 from .health import router as health_router
+from .metrics import router as metrics_router
+from .search import router as search_router
 
 router = APIRouter(prefix="/api/v1")
 router.include_router(health_router)
+router.include_router(metrics_router)
+router.include_router(search_router)
@@ -0,0 +1,16 @@
+from datetime import UTC, datetime
+
+from fastapi import APIRouter, HTTPException, Request
+
+from external.llm_gateway import llm_gateway
+from utils.db_pool import pool_stats
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(request: Request):
+    """Database pool usage and checkout waits, LLM concurrency, latency and token usage per model, requires an admin panel session"""
+    if not request.session.get("admin_auth", False):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return {"db_pools": pool_stats(), "llm": llm_gateway.stats(), "timestamp": datetime.now(UTC).isoformat()}
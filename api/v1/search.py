@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel
+
+from config import config
+from processing.search import semantic_search
+
+router = APIRouter()
+
+
+class SearchResult(BaseModel):
+    chat_id: int
+    message_id: int
+    sender_id: int | None
+    date: datetime
+    text: str | None
+    context: str | None
+    meaning: str | None
+    distance: float
+
+
+@router.get("/search", response_model=list[SearchResult])
+async def search(
+    request: Request,
+    q: str = Query(min_length=1, max_length=2000, description="What the messages should be about"),
+    limit: int = Query(default=10, ge=1, le=config.search_max_limit),
+    chat_id: int | None = Query(default=None),
+    date_from: datetime | None = Query(default=None, description="Only messages sent at or after this time"),
+    date_to: datetime | None = Query(default=None, description="Only messages sent before this time"),
+):
+    """Semantic search over enriched messages, requires an admin panel session"""
+    if not request.session.get("admin_auth", False):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await semantic_search(q, limit=limit, chat_id=chat_id, date_from=date_from, date_to=date_to)
@@ -22,10 +22,19 @@ import jobs.telethon_hook  # noqa: F401
 from admin import setup_admin
 from api import v1_router
 from config import config
-from dependency import dependency
+from dependency import Workload, dependency
+from external.http_session import http_session
 from jobs.enrich_old_messages import enrich_old_messages_job
 from jobs.fetch_messages import fetch_all_messages_job
+from jobs.prune_llm_responses import prune_llm_responses_job
+from jobs.reconcile_chat_counters import reconcile_chat_counters_job
+from jobs.reproject_embeddings import reproject_embeddings_job
 from jobs.sync_dialogs import sync_dialogs_job
+from jobs.sync_participants import sync_participants_job
+from processing.ingest_buffer import ingest_buffer
+from processing.queue import enrichment_queue
+from processing.read_acks import read_ack_coalescer
+from repositories.enriched_message_repository import check_embedding_column
 
 logger = logging.getLogger("app")
 
@@ -44,6 +53,8 @@ async def lifespan(app: FastAPI):
 
     command.upgrade(alembic_cfg, "head")
     logger.info("Alembic migrations applied successfully")
+    async with dependency.async_session() as session:
+        await check_embedding_column(session)
 
     scheduler.add_job(
         fetch_all_messages_job,
@@ -53,24 +64,47 @@ async def lifespan(app: FastAPI):
         sync_dialogs_job,
         CronTrigger.from_crontab("3/10 * * * *"),
     )
+    scheduler.add_job(
+        sync_participants_job,
+        CronTrigger.from_crontab("7 * * * *"),
+    )
     scheduler.add_job(
         enrich_old_messages_job,
         CronTrigger.from_crontab("*/5 * * * *"),
     )
+    scheduler.add_job(
+        reconcile_chat_counters_job,
+        CronTrigger.from_crontab("43 4 * * *"),
+    )
+    scheduler.add_job(
+        prune_llm_responses_job,
+        CronTrigger.from_crontab("17 5 * * *"),
+    )
+    scheduler.add_job(
+        reproject_embeddings_job,
+        CronTrigger.from_crontab("9/30 * * * *"),
+    )
 
     scheduler.start()
+    await enrichment_queue.start(config.enrich_queue_workers)
     await dependency.init_telegram_client()
 
     yield
 
     # Shutdown
     scheduler.shutdown()
+    # Write buffered realtime events while the client is still connected to mark them as read
+    await ingest_buffer.close()
+    await read_ack_coalescer.close()
+    await enrichment_queue.stop()
+    await http_session.close()
     if dependency.telegram_client:
         await dependency.telegram_client.disconnect()
 
 
 app = FastAPI(title="Superchromia API", version="1.0.0", lifespan=lifespan)
-scheduler = AsyncIOScheduler()
+# Never run two instances of the same job, missed runs collapse into one
+scheduler = AsyncIOScheduler(job_defaults={"max_instances": 1, "coalesce": True})
 
 
 class HTTPSRedirectMiddleware(BaseHTTPMiddleware):
@@ -111,7 +145,7 @@ async def root():
 
 
 # Setup SQLAdmin
-admin = setup_admin(app, dependency.engine)
+admin = setup_admin(app, dependency.engines[Workload.ADMIN], session_maker=dependency.session_makers[Workload.ADMIN])
 
 # Mount static files
 static_dir = Path(__file__).parent / "static"
@@ -0,0 +1,134 @@
+"""
+Benchmark: chat completion latency with a new aiohttp session per request vs the shared HTTP session
+
+Starts a local stub of the chat completions endpoint and sends the same requests through the previous
+NebiusAIStudioClient behaviour, one ClientSession and so one TCP and TLS setup per call, and through the client
+on a SharedHTTPSession that keeps connections alive. With --tls the stub serves HTTPS with a throwaway
+self-signed certificate made by the openssl command, which is closer to the real API:
+
+    python -m benchmarks.bench_http_session --requests 500 --concurrency 1 8 --tls
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import ssl
+import statistics
+import subprocess
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+from external.http_session import SharedHTTPSession
+from external.nebius import NebiusAIStudioClient
+
+RESPONSE = {"choices": [{"message": {"content": '{"context": "stub", "meaning": "stub"}'}}]}
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost", "-keyout", key, "-out", cert],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+async def start_stub(port: int, delay: float, server_ssl: ssl.SSLContext | None) -> web.AppRunner:
+    async def chat_completions(request: web.Request) -> web.Response:
+        await request.read()
+        if delay:
+            await asyncio.sleep(delay)
+        return web.json_response(RESPONSE)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "localhost", port, ssl_context=server_ssl).start()
+    return runner
+
+
+async def fresh_session_completion(base_url: str, client_ssl: ssl.SSLContext | bool, messages: list[dict]) -> dict:
+    """The request as NebiusAIStudioClient sent it before the shared session"""
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            base_url + "chat/completions",
+            headers={"Authorization": "Bearer stub", "Content-Type": "application/json"},
+            json={"model": "stub", "messages": messages, "max_tokens": 256, "temperature": 0.7},
+            timeout=aiohttp.ClientTimeout(total=30),
+            ssl=client_ssl,
+        ) as resp:
+            resp.raise_for_status()
+            return await resp.json()
+
+
+async def measure(send, requests: int, concurrency: int) -> tuple[list[float], float]:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await send()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies, time.perf_counter() - started
+
+
+def report(name: str, latencies: list[float], elapsed: float) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(
+        f"{name:>22}: p50 {statistics.median(latencies) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms  "
+        f"{len(latencies) / elapsed:8.0f} req/s"
+    )
+
+
+async def main(requests: int, concurrencies: list[int], delay_ms: float, tls: bool, port: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        server_ssl, client_ssl = None, True
+        if tls:
+            cert, key = make_certificate(directory)
+            server_ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            server_ssl.load_cert_chain(cert, key)
+            client_ssl = ssl.create_default_context(cafile=cert)
+        runner = await start_stub(port, delay_ms / 1000, server_ssl)
+        base_url = f"{'https' if tls else 'http'}://localhost:{port}/v1/"
+        numbers = itertools.count()
+
+        def messages() -> list[dict]:
+            # Distinct prompts, identical ones in flight together would share one call in the LLM gateway
+            return [{"role": "system", "content": f"stub {next(numbers)}"}, {"role": "user", "content": "ping " * 200}]
+
+        try:
+            for concurrency in concurrencies:
+                print(f"{requests} requests, concurrency {concurrency}{', TLS' if tls else ''}")
+                latencies, elapsed = await measure(lambda: fresh_session_completion(base_url, client_ssl, messages()), requests, concurrency)
+                report("session per request", latencies, elapsed)
+
+                shared = SharedHTTPSession(ssl=client_ssl)
+                client = NebiusAIStudioClient("stub", api_key="stub", base_url=base_url, session=shared.get())
+                latencies, elapsed = await measure(lambda client=client: client.chat_completion(messages(), max_tokens=256, temperature=0.7), requests, concurrency)
+                report("shared session", latencies, elapsed)
+                await shared.close()
+        finally:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="Requests in flight to compare")
+    parser.add_argument("--delay-ms", type=float, default=0, help="Simulated processing time of the stub")
+    parser.add_argument("--tls", action="store_true", help="Serve the stub over HTTPS")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.delay_ms, args.tls, args.port))
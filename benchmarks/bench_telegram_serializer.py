@@ -0,0 +1,145 @@
+"""
+Benchmark: json.dumps probing _clean_dict vs type-dispatch safe_telegram_to_dict
+
+Serializes a corpus of Telethon messages (text, formatting entities, replies, forwards,
+reactions, photos and link previews) with both implementations, checks the output is identical
+and reports the throughput:
+
+    python -m benchmarks.bench_telegram_serializer --messages 5000 --rounds 5
+"""
+
+import argparse
+import json
+import time
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from telethon.tl import types
+
+from utils.telegram_serializer import safe_telegram_to_dict
+
+CHAT_ID = 1
+
+
+def clean_dict_probing(data: Any) -> Any:
+    """The pre-dispatch implementation of _clean_dict, kept for comparison"""
+    if isinstance(data, dict):
+        cleaned = {}
+        for key, value in data.items():
+            if key.startswith('_'):
+                continue
+            cleaned[key] = clean_dict_probing(value)
+        return cleaned
+    elif isinstance(data, list):
+        return [clean_dict_probing(item) for item in data]
+    elif isinstance(data, bytes):
+        return f"<bytes:{len(data)}>"
+    elif hasattr(data, 'isoformat'):
+        return data.isoformat()
+    elif hasattr(data, '__dict__'):
+        return clean_dict_probing(data.__dict__)
+    else:
+        try:
+            json.dumps(data)
+            return data
+        except (TypeError, ValueError):
+            return str(data)
+
+
+def safe_telegram_to_dict_probing(obj: Any) -> Any:
+    return clean_dict_probing(obj.to_dict())
+
+
+def make_photo(i: int, date: datetime) -> types.Photo:
+    return types.Photo(
+        id=10_000 + i,
+        access_hash=-(10_000 + i),
+        file_reference=bytes(range(i % 40)),
+        date=date,
+        sizes=[
+            types.PhotoStrippedSize(type="i", bytes=b"\x01\x28\x1e" + bytes(100)),
+            types.PhotoSize(type="m", w=320, h=240, size=15_000 + i),
+            types.PhotoSize(type="x", w=800, h=600, size=60_000 + i),
+        ],
+        dc_id=2,
+    )
+
+
+def make_messages(count: int) -> list[types.Message]:
+    """Build Telethon messages covering the shapes seen in a typical group chat"""
+    started = datetime.now(UTC)
+    messages = []
+    for i in range(1, count + 1):
+        date = started + timedelta(seconds=i)
+        text = f"Message {i} " + "lorem ipsum dolor sit amet " * (1 + i % 8)
+        kwargs: dict[str, Any] = {
+            "id": i,
+            "peer_id": types.PeerChannel(channel_id=CHAT_ID),
+            "date": date,
+            "message": text,
+            "out": False,
+            "mentioned": i % 17 == 0,
+            "from_id": types.PeerUser(user_id=1000 + i % 50),
+            "entities": [types.MessageEntityBold(offset=0, length=7), types.MessageEntityUrl(offset=10, length=20)] if i % 3 == 0 else [],
+            "views": i * 3,
+            "forwards": i % 5,
+        }
+        if i % 4 == 0:
+            kwargs["reply_to"] = types.MessageReplyHeader(reply_to_msg_id=i - 1, quote_text="lorem" if i % 8 == 0 else None)
+        if i % 10 == 0:
+            kwargs["fwd_from"] = types.MessageFwdHeader(date=date - timedelta(days=1), from_id=types.PeerChannel(channel_id=CHAT_ID + 1), channel_post=i)
+        if i % 6 == 0:
+            kwargs["reactions"] = types.MessageReactions(
+                results=[
+                    types.ReactionCount(reaction=types.ReactionEmoji(emoticon="👍"), count=1 + i % 9),
+                    types.ReactionCount(reaction=types.ReactionEmoji(emoticon="🔥"), count=1 + i % 4),
+                ]
+            )
+        if i % 7 == 0:
+            kwargs["media"] = types.MessageMediaPhoto(photo=make_photo(i, date))
+        elif i % 11 == 0:
+            kwargs["media"] = types.MessageMediaWebPage(
+                webpage=types.WebPage(
+                    id=20_000 + i,
+                    url=f"https://example.com/{i}",
+                    display_url=f"example.com/{i}",
+                    hash=i,
+                    type="article",
+                    site_name="Example",
+                    title=f"Article {i}",
+                    description="lorem ipsum " * 20,
+                    photo=make_photo(i, date),
+                )
+            )
+        messages.append(types.Message(**kwargs))
+    return messages
+
+
+def measure(name: str, serialize, messages, rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for message in messages:
+            serialize(message)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:>8}: {best:8.3f}s  {len(messages) / best:10.0f} messages/s  {best / len(messages) * 1e6:8.1f} us/message")
+    return best
+
+
+def main(count: int, rounds: int) -> None:
+    messages = make_messages(count)
+    mismatches = [msg.id for msg in messages if safe_telegram_to_dict(msg) != safe_telegram_to_dict_probing(msg)]
+    if mismatches:
+        raise SystemExit(f"Output differs for {len(mismatches)} messages, first ids: {mismatches[:10]}")
+
+    probing = measure("probing", safe_telegram_to_dict_probing, messages, rounds)
+    dispatch = measure("dispatch", safe_telegram_to_dict, messages, rounds)
+    print(f"speedup: {probing / dispatch:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    main(args.messages, args.rounds)
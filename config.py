@@ -23,6 +23,93 @@ class Config(BaseSettings):
         env="DATABASE_URL",
         description="Database connection URL",
     )
+    database_replica_url: str | None = Field(
+        default=None,
+        env="DATABASE_REPLICA_URL",
+        description="Read replica for the readonly workload and admin panel reads, the primary is used when unset",
+    )
+    # Pools of all workloads together open at most 15 connections by default, the size of the single pool they
+    # replaced. Raising them needs headroom in max_connections of the server for every running app instance
+    db_ingest_pool_size: int = Field(
+        default=1,
+        env="DB_INGEST_POOL_SIZE",
+        description="Connections kept open for realtime Telegram ingest",
+    )
+    db_ingest_max_overflow: int = Field(
+        default=1,
+        env="DB_INGEST_MAX_OVERFLOW",
+        description="Extra connections for realtime Telegram ingest when its pool is exhausted",
+    )
+    db_ingest_pool_timeout_seconds: float = Field(
+        default=5,
+        env="DB_INGEST_POOL_TIMEOUT_SECONDS",
+        description="How long a checkout for realtime Telegram ingest waits for a free connection before failing",
+    )
+    db_jobs_pool_size: int = Field(
+        default=4,
+        env="DB_JOBS_POOL_SIZE",
+        description="Connections kept open for scheduled jobs and enrichment workers",
+    )
+    db_jobs_max_overflow: int = Field(
+        default=4,
+        env="DB_JOBS_MAX_OVERFLOW",
+        description="Extra connections for scheduled jobs and enrichment workers when its pool is exhausted",
+    )
+    db_jobs_pool_timeout_seconds: float = Field(
+        default=30,
+        env="DB_JOBS_POOL_TIMEOUT_SECONDS",
+        description="How long a checkout for scheduled jobs and enrichment workers waits for a free connection before failing",
+    )
+    db_admin_pool_size: int = Field(
+        default=1,
+        env="DB_ADMIN_POOL_SIZE",
+        description="Connections kept open for admin panel writes",
+    )
+    db_admin_max_overflow: int = Field(
+        default=1,
+        env="DB_ADMIN_MAX_OVERFLOW",
+        description="Extra connections for admin panel writes when its pool is exhausted",
+    )
+    db_admin_pool_timeout_seconds: float = Field(
+        default=10,
+        env="DB_ADMIN_POOL_TIMEOUT_SECONDS",
+        description="How long a checkout for admin panel writes waits for a free connection before failing",
+    )
+    db_readonly_pool_size: int = Field(
+        default=1,
+        env="DB_READONLY_POOL_SIZE",
+        description="Connections kept open for admin panel reads and read-only queries",
+    )
+    db_readonly_max_overflow: int = Field(
+        default=2,
+        env="DB_READONLY_MAX_OVERFLOW",
+        description="Extra connections for admin panel reads and read-only queries when its pool is exhausted",
+    )
+    db_readonly_pool_timeout_seconds: float = Field(
+        default=10,
+        env="DB_READONLY_POOL_TIMEOUT_SECONDS",
+        description="How long a checkout for admin panel reads and read-only queries waits for a free connection before failing",
+    )
+    db_pool_pre_ping: bool = Field(
+        default=True,
+        env="DB_POOL_PRE_PING",
+        description="Check connections with a ping on checkout to drop ones closed by the server",
+    )
+    db_pool_recycle_seconds: int = Field(
+        default=1800,
+        env="DB_POOL_RECYCLE_SECONDS",
+        description="Replace connections older than this, -1 keeps them forever",
+    )
+    db_statement_cache_size: int = Field(
+        default=100,
+        env="DB_STATEMENT_CACHE_SIZE",
+        description="asyncpg prepared statement cache per connection, 0 behind a transaction-mode pgbouncer",
+    )
+    db_prepared_statement_cache_size: int = Field(
+        default=100,
+        env="DB_PREPARED_STATEMENT_CACHE_SIZE",
+        description="SQLAlchemy prepared statement cache per asyncpg connection, 0 disables it",
+    )
 
     # Telegram
     telegram_api_id: str | None = Field(
@@ -36,6 +123,231 @@ class Config(BaseSettings):
         description="Telegram session ",
     )
 
+    # Jobs
+    fetch_concurrency: int = Field(
+        default=4,
+        env="FETCH_CONCURRENCY",
+        description="Number of dialogs fetched in parallel by the fetch messages job",
+    )
+    flood_wait_max_retries: int = Field(
+        default=3,
+        env="FLOOD_WAIT_MAX_RETRIES",
+        description="How many times a dialog is retried after a Telegram FloodWait",
+    )
+    ingest_batch_size: int = Field(
+        default=100,
+        env="INGEST_BATCH_SIZE",
+        description="Number of realtime Telegram events that triggers an immediate write",
+    )
+    ingest_flush_interval_ms: int = Field(
+        default=200,
+        env="INGEST_FLUSH_INTERVAL_MS",
+        description="How long realtime Telegram events are buffered before they are written",
+    )
+    ingest_max_attempts: int = Field(
+        default=5,
+        env="INGEST_MAX_ATTEMPTS",
+        description="Writes of a realtime batch failing on its data before its events are written one at a time and the bad ones dropped",
+    )
+    read_ack_interval_seconds: float = Field(
+        default=5,
+        env="READ_ACK_INTERVAL_SECONDS",
+        description="How often chats with new messages are marked as read in Telegram, one request per chat",
+    )
+    participants_refresh_hours: int = Field(
+        default=24,
+        env="PARTICIPANTS_REFRESH_HOURS",
+        description="Refresh interval for participant lists of chats without participants_count",
+    )
+
+    # Enrichment
+    enrich_concurrency: int = Field(
+        default=8,
+        env="ENRICH_CONCURRENCY",
+        description="Maximum number of messages enriched at the same time",
+    )
+    enrich_requests_per_minute: int = Field(
+        default=120,
+        env="ENRICH_REQUESTS_PER_MINUTE",
+        description="Request rate limit for the model provider",
+    )
+    enrich_tokens_per_minute: int = Field(
+        default=200_000,
+        env="ENRICH_TOKENS_PER_MINUTE",
+        description="Token rate limit for the model provider",
+    )
+    enrich_queue_workers: int = Field(
+        default=4,
+        env="ENRICH_QUEUE_WORKERS",
+        description="Number of consumers enriching new messages from the realtime hook",
+    )
+    enrich_queue_poll_seconds: int = Field(
+        default=5,
+        env="ENRICH_QUEUE_POLL_SECONDS",
+        description="How often idle enrichment consumers look for due retries and jobs queued by other replicas",
+    )
+    processing_job_max_attempts: int = Field(
+        default=5,
+        env="PROCESSING_JOB_MAX_ATTEMPTS",
+        description="Attempts before a processing job is moved to the dead state",
+    )
+    processing_job_backoff_seconds: int = Field(
+        default=60,
+        env="PROCESSING_JOB_BACKOFF_SECONDS",
+        description="Delay before the first retry of a failed processing job, doubled on every further attempt",
+    )
+    processing_job_max_backoff_seconds: int = Field(
+        default=6 * 3600,
+        env="PROCESSING_JOB_MAX_BACKOFF_SECONDS",
+        description="Upper bound for the retry delay of a processing job",
+    )
+    processing_job_lease_seconds: int = Field(
+        default=900,
+        env="PROCESSING_JOB_LEASE_SECONDS",
+        description="How long a claimed processing job is reserved before another worker may take it over",
+    )
+    embedding_batch_size: int = Field(
+        default=100,
+        env="EMBEDDING_BATCH_SIZE",
+        description="Maximum number of texts sent in one embeddings request",
+    )
+    embedding_batch_delay_ms: int = Field(
+        default=50,
+        env="EMBEDDING_BATCH_DELAY_MS",
+        description="How long a pending embedding waits for more texts before its batch is sent",
+    )
+    embedding_dimensions: int = Field(
+        default=1024,
+        env="EMBEDDING_DIMENSIONS",
+        description="Leading dimensions of the 4096 dimensional Qwen3 embeddings that are stored and searched, must match the column created by the migrations",
+    )
+    embedding_half_precision: bool = Field(
+        default=True,
+        env="EMBEDDING_HALF_PRECISION",
+        description="Store embeddings as halfvec instead of vector, must match the column created by the migrations, which needs pgvector 0.7 for halfvec",
+    )
+    embedding_keep_full_vectors: bool = Field(
+        default=False,
+        env="EMBEDDING_KEEP_FULL_VECTORS",
+        description="Also keep the full 4096 dimensional embeddings, needed to re-project into more dimensions later",
+    )
+    embedding_reproject_batch_size: int = Field(
+        default=500,
+        env="EMBEDDING_REPROJECT_BATCH_SIZE",
+        description="Full embeddings re-projected into the stored dimensions per transaction",
+    )
+    llm_cache_enabled: bool = Field(
+        default=True,
+        env="LLM_CACHE_ENABLED",
+        description="Reuse LLM responses for requests that were already sent, embeddings are only reused from memory",
+    )
+    llm_cache_memory_size: int = Field(
+        default=2000,
+        env="LLM_CACHE_MEMORY_SIZE",
+        description="Maximum number of LLM responses kept in memory in front of the llm_responses table",
+    )
+    llm_cache_max_entries: int = Field(
+        default=500_000,
+        env="LLM_CACHE_MAX_ENTRIES",
+        description="Stored LLM responses kept by the prune job, the least recently used are removed first",
+    )
+    llm_cache_max_age_days: int = Field(
+        default=90,
+        env="LLM_CACHE_MAX_AGE_DAYS",
+        description="Stored LLM responses unused for this long are removed by the prune job",
+    )
+    username_cache_size: int = Field(
+        default=50_000,
+        env="USERNAME_CACHE_SIZE",
+        description="Maximum number of user display names kept in memory",
+    )
+    username_cache_ttl_seconds: int = Field(
+        default=600,
+        env="USERNAME_CACHE_TTL_SECONDS",
+        description="How long a cached user display name stays valid",
+    )
+
+    # Search
+    search_max_limit: int = Field(
+        default=100,
+        env="SEARCH_MAX_LIMIT",
+        description="Maximum number of messages one semantic search returns",
+    )
+    search_ef_search: int = Field(
+        default=200,
+        env="SEARCH_EF_SEARCH",
+        description="HNSW ef_search for semantic search, raised to the requested limit when that is larger",
+    )
+
+    # External APIs
+    http_connection_limit: int = Field(
+        default=20,
+        env="HTTP_CONNECTION_LIMIT",
+        description="Maximum number of open connections of the shared HTTP session of external API clients",
+    )
+    http_keepalive_seconds: float = Field(
+        default=60,
+        env="HTTP_KEEPALIVE_SECONDS",
+        description="How long an idle connection of the shared HTTP session is kept open for reuse",
+    )
+    http_dns_cache_seconds: int = Field(
+        default=300,
+        env="HTTP_DNS_CACHE_SECONDS",
+        description="How long resolved host addresses are reused by the shared HTTP session",
+    )
+    http_connect_timeout_seconds: float = Field(
+        default=5,
+        env="HTTP_CONNECT_TIMEOUT_SECONDS",
+        description="Timeout for opening a new connection to an external API, including the TLS handshake",
+    )
+    http_request_timeout_seconds: float = Field(
+        default=30,
+        env="HTTP_REQUEST_TIMEOUT_SECONDS",
+        description="Default total timeout of one external API request, clients can pass their own per request",
+    )
+
+    # LLM gateway
+    llm_base_url: str = Field(
+        default="https://api.studio.nebius.com/v1/",
+        env="LLM_BASE_URL",
+        description="OpenAI compatible API that serves the enrichment and embedding models",
+    )
+    llm_initial_concurrency: int = Field(
+        default=8,
+        env="LLM_INITIAL_CONCURRENCY",
+        description="LLM requests allowed in flight at startup, adapted to the provider from there",
+    )
+    llm_min_concurrency: int = Field(
+        default=1,
+        env="LLM_MIN_CONCURRENCY",
+        description="Lower bound of the adaptive LLM concurrency limit",
+    )
+    llm_max_concurrency: int = Field(
+        default=32,
+        env="LLM_MAX_CONCURRENCY",
+        description="Upper bound of the adaptive LLM concurrency limit",
+    )
+    llm_backoff_cooldown_seconds: float = Field(
+        default=5,
+        env="LLM_BACKOFF_COOLDOWN_SECONDS",
+        description="Minimum time between two halvings of the LLM concurrency limit, errors of one burst count once",
+    )
+    llm_max_attempts: int = Field(
+        default=5,
+        env="LLM_MAX_ATTEMPTS",
+        description="Attempts of an LLM request on rate limiting, server errors and connection failures",
+    )
+    llm_retry_base_seconds: float = Field(
+        default=1,
+        env="LLM_RETRY_BASE_SECONDS",
+        description="Backoff before the first LLM retry, doubled on every further attempt and fully jittered",
+    )
+    llm_retry_max_seconds: float = Field(
+        default=60,
+        env="LLM_RETRY_MAX_SECONDS",
+        description="Upper bound for the backoff between LLM retries",
+    )
+
     # Security
     secret_key: str = Field(
         default="your-secret-key-change-this-in-production",
@@ -88,6 +400,125 @@ class Config(BaseSettings):
             raise ValueError("TELEGRAM_API_HASH must be exactly 32 characters")
         return v
 
+    @field_validator("db_ingest_pool_size", "db_jobs_pool_size", "db_admin_pool_size", "db_readonly_pool_size")
+    @classmethod
+    def validate_db_pool_size(cls, v):
+        if v < 1:
+            raise ValueError("Database pool sizes must be at least 1")
+        return v
+
+    @field_validator(
+        "db_ingest_max_overflow",
+        "db_jobs_max_overflow",
+        "db_admin_max_overflow",
+        "db_readonly_max_overflow",
+        "db_statement_cache_size",
+        "db_prepared_statement_cache_size",
+    )
+    @classmethod
+    def validate_db_non_negative(cls, v):
+        if v < 0:
+            raise ValueError("Database pool overflow and cache sizes must not be negative")
+        return v
+
+    @field_validator("fetch_concurrency")
+    @classmethod
+    def validate_fetch_concurrency(cls, v):
+        if v < 1:
+            raise ValueError("FETCH_CONCURRENCY must be at least 1")
+        return v
+
+    @field_validator("ingest_batch_size")
+    @classmethod
+    def validate_ingest_batch_size(cls, v):
+        # A flush writes every buffered message in one statement, keep it well under the bind parameter limit
+        if not 1 <= v <= 1000:
+            raise ValueError("INGEST_BATCH_SIZE must be between 1 and 1000")
+        return v
+
+    @field_validator("ingest_max_attempts")
+    @classmethod
+    def validate_ingest_max_attempts(cls, v):
+        if v < 1:
+            raise ValueError("INGEST_MAX_ATTEMPTS must be at least 1")
+        return v
+
+    @field_validator(
+        "enrich_concurrency",
+        "enrich_requests_per_minute",
+        "enrich_tokens_per_minute",
+        "enrich_queue_workers",
+        "enrich_queue_poll_seconds",
+        "processing_job_max_attempts",
+        "processing_job_lease_seconds",
+        "embedding_batch_size",
+        "embedding_reproject_batch_size",
+        "llm_cache_memory_size",
+        "llm_cache_max_entries",
+        "llm_cache_max_age_days",
+        "username_cache_size",
+    )
+    @classmethod
+    def validate_enrich_limits(cls, v):
+        if v < 1:
+            raise ValueError("Enrichment limits must be at least 1")
+        return v
+
+    @field_validator("embedding_dimensions")
+    @classmethod
+    def validate_embedding_dimensions(cls, v):
+        # Qwen3-Embedding-8B is trained for truncation down to 32 dimensions
+        if not 32 <= v <= 4096:
+            raise ValueError("EMBEDDING_DIMENSIONS must be between 32 and 4096")
+        return v
+
+    @field_validator(
+        "http_connection_limit",
+        "http_keepalive_seconds",
+        "http_dns_cache_seconds",
+        "http_connect_timeout_seconds",
+        "http_request_timeout_seconds",
+    )
+    @classmethod
+    def validate_http_limits(cls, v):
+        if v <= 0:
+            raise ValueError("HTTP session limits and timeouts must be positive")
+        return v
+
+    @field_validator(
+        "llm_initial_concurrency",
+        "llm_min_concurrency",
+        "llm_max_concurrency",
+        "llm_max_attempts",
+    )
+    @classmethod
+    def validate_llm_limits(cls, v):
+        if v < 1:
+            raise ValueError("LLM gateway limits must be at least 1")
+        return v
+
+    @field_validator("llm_backoff_cooldown_seconds", "llm_retry_base_seconds", "llm_retry_max_seconds")
+    @classmethod
+    def validate_llm_backoff(cls, v):
+        if v < 0:
+            raise ValueError("LLM gateway backoff settings cannot be negative")
+        return v
+
+    @field_validator("search_max_limit")
+    @classmethod
+    def validate_search_limits(cls, v):
+        if v < 1:
+            raise ValueError("Search limits must be at least 1")
+        return v
+
+    @field_validator("search_ef_search")
+    @classmethod
+    def validate_search_ef_search(cls, v):
+        # pgvector rejects ef_search outside this range
+        if not 1 <= v <= 1000:
+            raise ValueError("SEARCH_EF_SEARCH must be between 1 and 1000")
+        return v
+
     @field_validator("secret_key")
     @classmethod
     def validate_secret_key(cls, v):
@@ -1,27 +1,88 @@
 import asyncio
 import logging
+from enum import Enum
 from urllib.parse import urlparse, urlunparse
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Delete, Insert, Update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
 from telethon import TelegramClient
 from telethon.sessions import StringSession
 
 from config import config
+from utils.db_pool import InstrumentedPool
+from utils.json_codec import engine_json_options, register_asyncpg_codecs
 
 logger = logging.getLogger("dependency")
 
-# Fix DATABASE_URL to use correct async driver if needed
-database_url = config.database_url
-parsed = urlparse(database_url)
-if parsed.scheme != "postgresql+asyncpg":
-    # Reconstruct URL with correct scheme
-    database_url = urlunparse(("postgresql+asyncpg",) + parsed[1:])
 
-
-engine = create_async_engine(database_url, future=True)
-async_session = sessionmaker(
-    engine, expire_on_commit=False, class_=AsyncSession
+class Workload(str, Enum):
+    """Kinds of database work, each gets its own pool so one cannot starve the others of connections"""
+
+    INGEST = "ingest"
+    JOBS = "jobs"
+    ADMIN = "admin"
+    READONLY = "readonly"
+
+
+def asyncpg_url(url: str) -> str:
+    """Fix a database URL to use the async driver if needed"""
+    parsed = urlparse(url)
+    if parsed.scheme != "postgresql+asyncpg":
+        # Reconstruct URL with correct scheme
+        return urlunparse(("postgresql+asyncpg",) + parsed[1:])
+    return url
+
+
+def create_workload_engine(workload: Workload) -> AsyncEngine:
+    url = config.database_replica_url if workload == Workload.READONLY and config.database_replica_url else config.database_url
+    engine = create_async_engine(
+        asyncpg_url(url),
+        future=True,
+        poolclass=InstrumentedPool,
+        pool_logging_name=workload.value,
+        pool_size=getattr(config, f"db_{workload.value}_pool_size"),
+        max_overflow=getattr(config, f"db_{workload.value}_max_overflow"),
+        pool_timeout=getattr(config, f"db_{workload.value}_pool_timeout_seconds"),
+        pool_pre_ping=config.db_pool_pre_ping,
+        pool_recycle=config.db_pool_recycle_seconds,
+        connect_args={
+            "statement_cache_size": config.db_statement_cache_size,
+            "prepared_statement_cache_size": config.db_prepared_statement_cache_size,
+        },
+        **engine_json_options(),
+    )
+    register_asyncpg_codecs(engine)
+    return engine
+
+
+def replica_routing_session(primary: AsyncEngine, replica: AsyncEngine) -> type[Session]:
+    """
+    Session class that reads from the replica while flushes and DML statements go to the primary.
+    Once a session has written, its later reads go to the primary too, the replica may not have its writes yet.
+    """
+
+    class ReplicaRoutingSession(Session):
+        wrote = False
+
+        def get_bind(self, mapper=None, clause=None, **kwargs):
+            if self._flushing or isinstance(clause, Insert | Update | Delete):
+                self.wrote = True
+            return primary.sync_engine if self.wrote else replica.sync_engine
+
+    return ReplicaRoutingSession
+
+
+engines = {workload: create_workload_engine(workload) for workload in Workload}
+session_makers = {
+    workload: async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    for workload, engine in engines.items()
+}
+# Admin pages are reads apart from saving a form, without a replica both engines point at the primary
+session_makers[Workload.ADMIN] = async_sessionmaker(
+    expire_on_commit=False,
+    class_=AsyncSession,
+    sync_session_class=replica_routing_session(engines[Workload.ADMIN], engines[Workload.READONLY]),
 )
 
 
@@ -34,8 +95,10 @@ class Dependency:
         return cls._instance
 
     def __init__(self):
-        self.engine = engine
-        self.async_session = async_session
+        self.engines = engines
+        self.session_makers = session_makers
+        # Primary engine of scheduled jobs, also the default for code that does not name a workload
+        self.engine = engines[Workload.JOBS]
 
         # Validate required Telegram config
         config.validate_required_telegram_config()
@@ -47,8 +110,12 @@ class Dependency:
             sequential_updates=True,
         )
 
-    async def get_session(self):
-        async with self.async_session() as session:
+    def async_session(self, workload: Workload = Workload.JOBS) -> AsyncSession:
+        """New session on the pool of the given workload"""
+        return self.session_makers[Workload(workload)]()
+
+    async def get_session(self, workload: Workload = Workload.JOBS):
+        async with self.async_session(workload) as session:
             yield session
 
     async def __start_telethon(self):
@@ -0,0 +1,44 @@
+import logging
+import ssl
+
+import aiohttp
+
+from config import config
+
+logger = logging.getLogger("http_session")
+
+
+class SharedHTTPSession:
+    """
+    One aiohttp session for every external API client, so requests reuse kept-alive connections
+    instead of paying TCP and TLS setup each time. Created on first use within the running event loop,
+    closed by the app lifespan.
+    """
+
+    def __init__(self, ssl: ssl.SSLContext | bool = True):
+        # Verification settings of every connection, a context can trust a private CA
+        self.ssl = ssl
+        self._session: aiohttp.ClientSession | None = None
+
+    def get(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=config.http_connection_limit,
+                keepalive_timeout=config.http_keepalive_seconds,
+                ttl_dns_cache=config.http_dns_cache_seconds,
+                ssl=self.ssl,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=config.http_request_timeout_seconds, connect=config.http_connect_timeout_seconds),
+            )
+            logger.info(f"Opened shared HTTP session with up to {config.http_connection_limit} connections")
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_session = SharedHTTPSession()
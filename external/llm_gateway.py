@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from bisect import bisect_left
+from typing import Any
+
+import aiohttp
+
+from config import config
+from external.http_session import http_session
+from utils.rate_limit import RateLimiter, estimate_tokens
+
+logger = logging.getLogger("llm_gateway")
+
+# Upper bounds in seconds of the request latency histogram, the last bucket counts everything slower
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The provider is overloaded or failing, the request is retried and concurrency backs off
+RETRYABLE_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class LLMRequestError(Exception):
+    """LLM request that failed for good, status is None when no response was received"""
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ModelMetrics:
+    """Request, retry, latency and token statistics of one model since the process started"""
+
+    def __init__(self):
+        self.requests = 0
+        self.attempts = 0
+        self.retries = 0
+        self.failures = 0
+        self.coalesced = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency: float, usage: dict[str, Any] | None) -> None:
+        """Record a successful request"""
+        self.requests += 1
+        self.latency_seconds_total += latency
+        self.latency_seconds_max = max(self.latency_seconds_max, latency)
+        self.latency_buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        if usage:
+            self.prompt_tokens += usage.get("prompt_tokens") or 0
+            self.completion_tokens += usage.get("completion_tokens") or 0
+
+    def snapshot(self) -> dict[str, Any]:
+        buckets = {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets[:-1], strict=True)}
+        buckets["inf"] = self.latency_buckets[-1]
+        return {
+            "requests": self.requests,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "failures": self.failures,
+            "coalesced": self.coalesced,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_seconds_avg": round(self.latency_seconds_total / self.requests, 6) if self.requests else 0.0,
+            "latency_seconds_max": round(self.latency_seconds_max, 6),
+            "latency_buckets": buckets,
+        }
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit of requests in flight. Every success raises the limit by 1/limit, about one per round of requests,
+    an overloaded provider halves it. Halving happens at most once per cooldown, the requests that were in flight
+    together when the provider started refusing them count as one signal. Requests that neither succeeded nor
+    overloaded the provider, like rejected or cancelled ones, leave the limit alone.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, cooldown: float):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._decreased_at = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, overloaded: bool, succeeded: bool = True) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            if overloaded:
+                now = time.monotonic()
+                if now - self._decreased_at >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._decreased_at = now
+                    logger.warning(f"LLM provider overloaded, concurrency limit lowered to {int(self.limit)}")
+            elif succeeded:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+def _retry_after(response: aiohttp.ClientResponse) -> float | None:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Single path to the OpenAI compatible LLM API. Identical requests in flight at the same time share one call,
+    calls pass the provider rate limits and the adaptive concurrency limit, and rate limiting, server errors and
+    connection failures are retried with exponential backoff and full jitter, or after Retry-After when given,
+    never longer than retry_max. A timeout covers all attempts of a call together. Latency and token usage are
+    recorded per model.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str | None,
+        concurrency: AdaptiveConcurrency,
+        rate_limiter: RateLimiter | None = None,
+        max_attempts: int = 5,
+        retry_base: float = 1.0,
+        retry_max: float = 60.0,
+        session: aiohttp.ClientSession | None = None,
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.rate_limiter = rate_limiter
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        # Falls back to the shared session, whose lifecycle the app owns
+        self._session = session
+        self.metrics: dict[str, ModelMetrics] = {}
+        self._in_flight: dict[str, asyncio.Task] = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self._session or http_session.get()
+
+    async def chat_completion(self, model: str, messages: list[dict], timeout: float | None = None, **params) -> dict:
+        """Chat completion response, params are added to the request body as they are"""
+        tokens = estimate_tokens(json.dumps(messages, ensure_ascii=False))
+        return await self._request("chat/completions", {"model": model, "messages": messages, **params}, tokens, timeout)
+
+    async def complete(self, model: str, messages: list[dict], timeout: float | None = None, **params) -> str:
+        """Message content of the first choice of a chat completion"""
+        data = await self.chat_completion(model, messages, timeout=timeout, **params)
+        return data["choices"][0]["message"]["content"]
+
+    async def embeddings(self, model: str, texts: list[str], timeout: float | None = None) -> list[list[float]]:
+        """One embedding per text, in the order of the texts"""
+        data = await self._request("embeddings", {"model": model, "input": texts}, sum(estimate_tokens(text) for text in texts), timeout)
+        items = sorted(data["data"], key=lambda item: item["index"])
+        if len(items) != len(texts):
+            raise LLMRequestError(f"{model} returned {len(items)} embeddings for {len(texts)} inputs")
+        return [item["embedding"] for item in items]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "models": {model: metrics.snapshot() for model, metrics in self.metrics.items()},
+        }
+
+    async def _request(self, path: str, payload: dict, tokens: int, timeout: float | None) -> dict:
+        metrics = self.metrics.setdefault(payload["model"], ModelMetrics())
+        key = hashlib.sha256(json.dumps([path, payload], sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+        task = self._in_flight.get(key)
+        if task is None:
+            # Owned by the gateway instead of the first caller, so that no caller can cancel it for the others
+            task = asyncio.create_task(self._send(path, payload, tokens, timeout, metrics))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            metrics.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Marks the exception as retrieved when every caller gave up before the call finished
+        if not task.cancelled():
+            task.exception()
+
+    async def _send(self, path: str, payload: dict, tokens: int, timeout: float | None, metrics: ModelMetrics) -> dict:
+        try:
+            async with asyncio.timeout(timeout):
+                return await self._attempts(path, payload, tokens, metrics)
+        except TimeoutError as e:
+            metrics.failures += 1
+            raise LLMRequestError(f"{payload['model']} {path} timed out after {timeout}s") from e
+
+    async def _attempts(self, path: str, payload: dict, tokens: int, metrics: ModelMetrics) -> dict:
+        model = payload["model"]
+        for attempt in range(1, self.max_attempts + 1):
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(tokens)
+            await self.concurrency.acquire()
+            metrics.attempts += 1
+            overloaded = succeeded = False
+            retry_after = None
+            started = time.perf_counter()
+            try:
+                async with self.session.post(
+                    self.base_url + path,
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    json=payload,
+                ) as resp:
+                    if resp.status in RETRYABLE_STATUSES:
+                        overloaded = True
+                        retry_after = _retry_after(resp)
+                        error = LLMRequestError(f"{model} {path} returned {resp.status}: {await resp.text()}", resp.status)
+                    elif resp.status >= 400:
+                        metrics.failures += 1
+                        raise LLMRequestError(f"{model} {path} returned {resp.status}: {await resp.text()}", resp.status)
+                    else:
+                        data = await resp.json()
+                        succeeded = True
+                        metrics.observe(time.perf_counter() - started, data.get("usage"))
+                        return data
+            except (aiohttp.ClientConnectionError, TimeoutError) as e:
+                overloaded = True
+                error = LLMRequestError(f"{model} {path} failed: {e!r}")
+            finally:
+                await self.concurrency.release(overloaded, succeeded)
+
+            if attempt == self.max_attempts:
+                metrics.failures += 1
+                raise error
+            metrics.retries += 1
+            backoff = min(self.retry_max, self.retry_base * 2 ** (attempt - 1))
+            delay = min(retry_after, self.retry_max) if retry_after is not None else random.uniform(0, backoff)
+            logger.warning(f"{error}, retrying in {delay:.1f}s (attempt {attempt} of {self.max_attempts})")
+            await asyncio.sleep(delay)
+
+
+# Every enrichment and search call goes through this gateway, sharing the provider limits
+llm_gateway = LLMGateway(
+    base_url=config.llm_base_url,
+    api_key=os.environ.get("NEBIUS_STUDIO_API_KEY"),
+    concurrency=AdaptiveConcurrency(
+        initial=config.llm_initial_concurrency,
+        minimum=config.llm_min_concurrency,
+        maximum=config.llm_max_concurrency,
+        cooldown=config.llm_backoff_cooldown_seconds,
+    ),
+    rate_limiter=RateLimiter(config.enrich_requests_per_minute, config.enrich_tokens_per_minute),
+    max_attempts=config.llm_max_attempts,
+    retry_base=config.llm_retry_base_seconds,
+    retry_max=config.llm_retry_max_seconds,
+)
@@ -3,6 +3,9 @@ import os
 
 import aiohttp
 
+from config import config
+from external.llm_gateway import AdaptiveConcurrency, LLMGateway, llm_gateway
+
 logger = logging.getLogger("nebius")
 
 GUIDED_SCHEMA = {
@@ -15,12 +18,34 @@ GUIDED_SCHEMA = {
 
 
 class NebiusAIStudioClient:
+    """Chat client for one model, requests go through the LLM gateway"""
+
     def __init__(
-        self, model_id: str, api_key: str = None, base_url: str = None
+        self,
+        model_id: str,
+        api_key: str = None,
+        base_url: str = None,
+        session: aiohttp.ClientSession = None,
     ):
         self.model_id = model_id
-        self.api_key = api_key or os.environ.get("NEBIUS_STUDIO_API_KEY")
-        self.base_url = base_url or "https://api.studio.nebius.com/v1/"
+        if api_key is None and base_url is None and session is None:
+            self.gateway = llm_gateway
+        else:
+            # Own endpoint or credentials, still with retries and adaptive concurrency
+            self.gateway = LLMGateway(
+                base_url=base_url or config.llm_base_url,
+                api_key=api_key or os.environ.get("NEBIUS_STUDIO_API_KEY"),
+                concurrency=AdaptiveConcurrency(
+                    initial=config.llm_initial_concurrency,
+                    minimum=config.llm_min_concurrency,
+                    maximum=config.llm_max_concurrency,
+                    cooldown=config.llm_backoff_cooldown_seconds,
+                ),
+                max_attempts=config.llm_max_attempts,
+                retry_base=config.llm_retry_base_seconds,
+                retry_max=config.llm_retry_max_seconds,
+                session=session,
+            )
 
     async def chat_completion(
         self,
@@ -29,32 +54,18 @@ class NebiusAIStudioClient:
         temperature: float,
         extra_body=None,
         response_format=None,
+        timeout: float = None,
     ):
-        url = self.base_url + "chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": self.model_id,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-        }
+        """Send a chat completion request, timeout overrides the total timeout of the session"""
+        params = {"max_tokens": max_tokens, "temperature": temperature}
         if extra_body:
-            payload.update(extra_body)
+            params.update(extra_body)
         if response_format:
-            payload["response_format"] = response_format
-        logger.debug(f"Sending async request to Nebius: {payload}")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                url, headers=headers, json=payload, timeout=30
-            ) as resp:
-                logger.debug(f"Nebius response status: {resp.status}")
-                resp.raise_for_status()
-                data = await resp.json()
-                logger.debug(f"Nebius response data: {data}")
-                return data
+            params["response_format"] = response_format
+        logger.debug(f"Sending async request to Nebius: {params}")
+        data = await self.gateway.chat_completion(self.model_id, messages, timeout=timeout, **params)
+        logger.debug(f"Nebius response data: {data}")
+        return data
 
     async def generate(
         self,
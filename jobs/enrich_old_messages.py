@@ -2,67 +2,154 @@ import asyncio
 import logging
 from typing import List
 
+from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from config import config
 from dependency import dependency
 from models.chat_config import ChatConfig
+from models.chat_sync_state import BackfillStatus, ChatSyncState
 from models.message import Message
-from processing.enrich_message import process_message
+from models.messages_enriched import EnrichedMessage
+from models.processing_job import ProcessingJob, ProcessingJobKind
+from processing.executor import EnrichmentExecutor
+from repositories.bulk import bulk_upsert
+from repositories.processing_job_repository import (
+    add_processing_jobs,
+    claim_processing_jobs,
+    complete_processing_jobs,
+    fail_processing_jobs,
+    renew_processing_jobs,
+)
 
 logger = logging.getLogger("enrich_old_messages")
 
+# Shared by the runs of the job, so that the context window of one run is reused by the next
+executor = EnrichmentExecutor(config.enrich_concurrency)
+
+
+def _unenriched_query(chat_id: int, *conditions):
+    """Messages of a chat matching conditions without an enriched row or a processing job"""
+    return (
+        select(Message.message_id)
+        .outerjoin(
+            EnrichedMessage,
+            and_(EnrichedMessage.chat_id == Message.chat_id, EnrichedMessage.message_id == Message.message_id),
+        )
+        .outerjoin(
+            ProcessingJob,
+            and_(
+                ProcessingJob.kind == ProcessingJobKind.ENRICH_MESSAGE,
+                ProcessingJob.chat_id == Message.chat_id,
+                ProcessingJob.message_id == Message.message_id,
+            ),
+        )
+        .where(Message.chat_id == chat_id, *conditions, EnrichedMessage.message_id.is_(None), ProcessingJob.message_id.is_(None))
+    )
+
+
+async def get_unenriched_messages(session: AsyncSession, limit: int = 1000) -> List[tuple[int, int]]:
+    """
+    Return up to limit (chat_id, message_id) pairs without an enriched row or a processing job in chats with
+    enrichment enabled. Every chat keeps the range of message IDs discovery has looked at, so only messages
+    saved since are scanned: newer ones above the range and backfilled history below it. The advanced ranges
+    are saved in the session, commit them together with the processing jobs of the returned messages.
+    """
+    result = await session.execute(
+        select(ChatConfig.chat_id, ChatSyncState.enrich_scanned_low, ChatSyncState.enrich_scanned_high)
+        .outerjoin(ChatSyncState, ChatSyncState.chat_id == ChatConfig.chat_id)
+        .where(ChatConfig.enrich_messages.is_(True))
+        .order_by(ChatConfig.chat_id)
+    )
+    unenriched, scanned = [], []
+    for chat_id, low, high in result.all():
+        if len(unenriched) >= limit:
+            break
+        # Two single row index lookups instead of min() and max(), which may aggregate over the whole chat
+        in_chat = select(Message.message_id).where(Message.chat_id == chat_id).limit(1)
+        bottom = await session.scalar(in_chat.order_by(Message.message_id))
+        top = await session.scalar(in_chat.order_by(Message.message_id.desc()))
+        if top is None:
+            continue
+        if high is None:
+            # Nothing looked at yet, the scan upwards starts at the oldest message
+            low, high = bottom, bottom - 1
+
+        # Only messages up to top are scanned, so messages saved meanwhile stay outside of the range
+        remaining = limit - len(unenriched)
+        newer = await session.scalars(_unenriched_query(chat_id, Message.message_id > high, Message.message_id <= top).order_by(Message.message_id).limit(remaining))
+        newer = newer.all()
+        high = newer[-1] if len(newer) == remaining else top
+        unenriched.extend((chat_id, message_id) for message_id in newer)
+
+        remaining = limit - len(unenriched)
+        if remaining and bottom < low:
+            older = await session.scalars(
+                _unenriched_query(chat_id, Message.message_id >= bottom, Message.message_id < low).order_by(Message.message_id.desc()).limit(remaining)
+            )
+            older = older.all()
+            low = older[-1] if len(older) == remaining else bottom
+            unenriched.extend((chat_id, message_id) for message_id in older)
+        scanned.append({"chat_id": chat_id, "enrich_scanned_low": low, "enrich_scanned_high": high, "backfill_status": BackfillStatus.PENDING})
 
-async def get_unenriched_messages(
-    limit: int = 1000,
-) -> List[tuple[int, int]]:
+    await bulk_upsert(session, ChatSyncState, scanned, index_elements=("chat_id",), update_columns=("enrich_scanned_low", "enrich_scanned_high"))
+    return unenriched
 
-    async for session in dependency.get_session():
-        # Get chat configs with enrich_messages enabled
-        result = await session.execute(select(ChatConfig))
-        chat_configs = result.scalars().all()
-        active_configs = [cfg.chat_id for cfg in chat_configs if cfg.enrich_messages]
 
-        unenriched = []
-        for chat_id in active_configs:
-            # Get unenriched messages for this chat (exclude already enriched)
-            result = await session.execute(
-                select(Message.message_id)
-                .where(Message.chat_id == chat_id)
-                .limit(limit)
-            )
-            msg_ids = result.scalars().all()
-            
-            # Filter out messages that are already enriched
-            from models.messages_enriched import EnrichedMessage
-            for msg_id in msg_ids:
-                # Check if this message is already enriched
-                enriched_result = await session.execute(
-                    select(EnrichedMessage)
-                    .where(
-                        EnrichedMessage.chat_id == chat_id,
-                        EnrichedMessage.message_id == msg_id
-                    )
-                )
-                if not enriched_result.scalar_one_or_none():
-                    unenriched.append((chat_id, msg_id))
-        
-        return unenriched
+async def renew_leases(claimed: list[tuple[int, int]]) -> None:
+    """Renew the lease of claimed jobs every third of the lease time until cancelled"""
+    while True:
+        await asyncio.sleep(config.processing_job_lease_seconds / 3)
+        try:
+            async with dependency.async_session() as session:
+                await renew_processing_jobs(session, claimed)
+                await session.commit()
+        except Exception as e:
+            logger.exception(f"Error renewing the lease of {len(claimed)} processing jobs: {e}")
+
+
+async def enrich_claimed(executor: EnrichmentExecutor, claimed: list[tuple[int, int]]) -> int:
+    """Enrich claimed jobs, acknowledge the ones that succeeded and schedule the rest for a retry"""
+    # Keeps the queue consumers from taking over jobs of a run that outlasts the lease
+    heartbeat = asyncio.create_task(renew_leases(claimed))
+    try:
+        enriched = await executor.run(claimed)
+    except Exception as e:
+        logger.exception(f"Error saving enriched messages: {e}")
+        enriched = []
+        executor.errors = {key: str(e) for key in claimed}
+    finally:
+        heartbeat.cancel()
+
+    failed = {key: executor.errors.get(key, "Not enriched") for key in set(claimed) - set(enriched)}
+    async with dependency.async_session() as session:
+        await complete_processing_jobs(session, enriched)
+        await fail_processing_jobs(session, failed)
+        await session.commit()
+    return len(enriched)
 
 
 async def enrich_old_messages_job(limit: int = 100):
-    """Main job to enrich old messages"""
+    """
+    Main job to enrich old messages.
+    Newly found messages are queued as processing jobs, then due jobs are claimed and enriched,
+    so failures are retried with backoff and messages that keep failing end up dead instead of retried forever.
+    All due jobs are claimed into one executor run, so contexts slide over consecutive messages and embeddings go
+    out in full batches, their leases are renewed until the run is over.
+    """
     logger.info(f"Starting enrichment job for {limit} messages")
 
-    async for session in dependency.get_session():
-        try:
-            unenriched_messages = await get_unenriched_messages(limit)
-
-            for chat_id, msg_id in unenriched_messages:
-                await process_message(session, chat_id, msg_id)
+    async with dependency.async_session() as session:
+        unenriched_messages = await get_unenriched_messages(session, limit)
+        await add_processing_jobs(session, unenriched_messages)
+        await session.commit()
 
-        except Exception as e:
-            logger.exception(f"Error in enrichment job: {e}")
-            raise
+    async with dependency.async_session() as session:
+        claimed = await claim_processing_jobs(session, limit)
+        await session.commit()
+    enriched_count = await enrich_claimed(executor, claimed) if claimed else 0
+    logger.info(f"Enriched {enriched_count} of {len(claimed)} claimed messages, queued {len(unenriched_messages)} new")
 
 
 async def main():
@@ -1,23 +1,26 @@
+import asyncio
 import logging
-from collections.abc import AsyncGenerator
-from typing import TypeVar
+from datetime import UTC, datetime
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from telethon import TelegramClient, types
+from telethon.errors import FloodWaitError
 
+from config import config
 from dependency import dependency
-from models.message import Message
-from utils.telegram_serializer import safe_telegram_to_dict
+from models.chat_sync_state import BackfillStatus, ChatSyncState
+from repositories.message_repository import message_to_row, upsert_messages
+from utils.batching import take_batch
+from utils.flood_wait import flood_wait_gate
 
 logger = logging.getLogger("fetch_messages")
 
-T = TypeVar("T")
 
-
-async def messages_generator(client: TelegramClient, chat_id: int, offset_id: int):
+async def messages_generator(client: TelegramClient, chat_id: int, offset_id: int = 0, min_id: int = 0, reverse: bool = False):
     try:
-        logger.info(f"Fetching messages for chat_id={chat_id}, offset_id={offset_id}")
-        async for msg in client.iter_messages(entity=chat_id, offset_id=offset_id):
+        logger.info(f"Fetching messages for chat_id={chat_id}, offset_id={offset_id}, min_id={min_id}, reverse={reverse}")
+        async for msg in client.iter_messages(entity=chat_id, offset_id=offset_id, min_id=min_id, reverse=reverse):
             yield msg
 
     except Exception as e:
@@ -25,15 +28,81 @@ async def messages_generator(client: TelegramClient, chat_id: int, offset_id: in
         raise
 
 
-async def take_batch(generator: AsyncGenerator[T, None], batch_size: int = 1000) -> AsyncGenerator[list[T], None]:
-    batch = []
-    async for item in generator:
-        batch.append(item)
-        if len(batch) >= batch_size:
-            yield batch
-            batch = []
-    if batch:
-        yield batch
+async def load_sync_states() -> dict[int, int | None]:
+    """Map chat_id to the top_message of its last finished sync, only for completed backfills"""
+    async with dependency.async_session() as session:
+        result = await session.execute(
+            select(ChatSyncState.chat_id, ChatSyncState.top_message).where(ChatSyncState.backfill_status == BackfillStatus.COMPLETED)
+        )
+        return dict(result.all())
+
+
+async def save_batch(session: AsyncSession, chat_id: int, batch: list) -> list[int]:
+    """Save messages batch with a single upsert statement and return saved IDs"""
+    await upsert_messages(session, [message_to_row(msg, chat_id) for msg in batch])
+    logger.info(f"Saved messages batch for chat_id={chat_id}: {len(batch)}")
+    return [msg.id for msg in batch]
+
+
+async def fetch_dialog_messages(client: TelegramClient, chat_id: int, top_message: int | None = None):
+    """
+    Fetch and save messages of a single dialog using its own session.
+    Watermarks are committed together with every batch, so an interrupted run resumes where it stopped.
+    """
+    async with dependency.async_session() as session:
+        state = await session.get(ChatSyncState, chat_id)
+        if state is None:
+            state = ChatSyncState(chat_id=chat_id, backfill_status=BackfillStatus.PENDING)
+            session.add(state)
+
+        # Without a low watermark nothing below the high watermark is known to be complete, the backfill
+        # starts right above it so that gaps between already stored messages are fetched as well
+        backfill_offset = state.low_watermark or (state.high_watermark + 1 if state.high_watermark is not None else 0)
+
+        # New messages above the high watermark, oldest first so the watermark only moves forward
+        if state.high_watermark is not None or state.backfill_status == BackfillStatus.COMPLETED:
+            messages_gen = messages_generator(client, chat_id, min_id=state.high_watermark or 0, reverse=True)
+            async for batch in take_batch(messages_gen):
+                ids = await save_batch(session, chat_id, batch)
+                state.high_watermark = max(state.high_watermark or 0, *ids)
+                await session.commit()
+
+        # History below the low watermark, newest first
+        if state.backfill_status != BackfillStatus.COMPLETED:
+            state.backfill_status = BackfillStatus.IN_PROGRESS
+            messages_gen = messages_generator(client, chat_id, offset_id=backfill_offset)
+            async for batch in take_batch(messages_gen):
+                ids = await save_batch(session, chat_id, batch)
+                state.high_watermark = max(state.high_watermark or 0, *ids)
+                state.low_watermark = min(state.low_watermark or ids[0], *ids)
+                await session.commit()
+            state.backfill_status = BackfillStatus.COMPLETED
+
+        state.top_message = top_message
+        state.last_synced_at = datetime.now(UTC)
+        await session.commit()
+
+
+async def fetch_worker(client: TelegramClient, queue: asyncio.Queue):
+    """Take dialogs from the queue until cancelled, backing off on FloodWait"""
+    while True:
+        chat_id, top_message = await queue.get()
+        try:
+            for attempt in range(config.flood_wait_max_retries + 1):
+                await flood_wait_gate.wait()
+                try:
+                    await fetch_dialog_messages(client, chat_id, top_message)
+                    break
+                except FloodWaitError as e:
+                    flood_wait_gate.pause(e.seconds)
+                    logger.warning(f"FloodWait of {e.seconds}s for chat_id={chat_id}, attempt {attempt + 1}")
+            else:
+                logger.error(f"Giving up on chat_id={chat_id} after {config.flood_wait_max_retries} FloodWait retries")
+        except Exception as e:
+            # One broken dialog must not stop the rest of the pool
+            logger.exception(f"Failed to fetch messages for chat_id={chat_id}: {e}")
+        finally:
+            queue.task_done()
 
 
 async def fetch_all_messages_job():
@@ -43,45 +112,30 @@ async def fetch_all_messages_job():
         return
 
     client = dependency.telegram_client
-    logger.info("Fetch job started")
+    concurrency = config.fetch_concurrency
+    logger.info(f"Fetch job started with {concurrency} workers")
+
+    synced_top_messages = await load_sync_states()
+    skipped = 0
 
-    async for session in dependency.get_session():
+    queue: asyncio.Queue[tuple[int, int | None]] = asyncio.Queue(maxsize=concurrency * 2)
+    workers = [asyncio.create_task(fetch_worker(client, queue)) for _ in range(concurrency)]
+    try:
         async for dialog in client.iter_dialogs():
             dialog: types.Dialog
             chat_id = dialog.entity.id
+            top_message = dialog.message.id if dialog.message else None
 
-            # Get first message ID for this chat
-            result = await session.execute(select(Message.message_id).where(Message.chat_id == chat_id).order_by(Message.message_id.desc()).limit(1))
-            first_msg = result.scalar_one_or_none()
-            offset_id = first_msg if first_msg else 0
-            messages_gen = messages_generator(client, chat_id, offset_id)
+            # Nothing new since the last finished sync, no need to call iter_messages at all
+            if top_message is not None and synced_top_messages.get(chat_id) == top_message:
+                skipped += 1
+                continue
 
-            async for batch in take_batch(messages_gen):
-                # Save messages batch with upsert logic
-                for msg in batch:
-                    # Check if message already exists
-                    result = await session.execute(select(Message).where(Message.message_id == msg.id, Message.chat_id == chat_id))
-                    existing_message = result.scalar_one_or_none()
-
-                    if existing_message:
-                        # Update existing message
-                        existing_message.sender_id = msg.sender_id if msg.sender_id else None
-                        existing_message.date = msg.date
-                        existing_message.message_type = msg.media.__class__.__name__ if msg.media else "text"
-                        existing_message.raw_data = safe_telegram_to_dict(msg)
-                    else:
-                        # Create new message
-                        db_message = Message(
-                            message_id=msg.id,
-                            chat_id=chat_id,
-                            sender_id=msg.sender_id if msg.sender_id else None,
-                            date=msg.date,
-                            message_type=(msg.media.__class__.__name__ if msg.media else "text"),
-                            is_read=False,
-                            is_deleted=False,
-                            raw_data=safe_telegram_to_dict(msg),
-                        )
-                        session.add(db_message)
+            await queue.put((chat_id, top_message))
+        await queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
-                await session.commit()
-                logger.info(f"Saved messages batch: {len(batch)}")
+    logger.info(f"Fetch job completed, {skipped} unchanged dialogs skipped")
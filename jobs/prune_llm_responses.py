@@ -0,0 +1,37 @@
+import logging
+from datetime import UTC, datetime, timedelta
+
+from config import config
+from dependency import dependency
+from repositories.llm_response_repository import llm_responses_surplus_since, prune_llm_responses
+
+logger = logging.getLogger("prune_llm_responses")
+
+# Responses deleted per transaction
+PRUNE_BATCH_SIZE = 10_000
+
+
+async def prune_llm_responses_job():
+    """
+    Job for evicting cached LLM responses.
+    Removes responses unused for LLM_CACHE_MAX_AGE_DAYS and the least recently used ones beyond LLM_CACHE_MAX_ENTRIES.
+    Both cutoffs are found once through the last_used_at index, then rows are deleted in batches.
+    """
+    logger.info("Prune LLM responses job started")
+    deleted = 0
+    async for session in dependency.get_session():
+        try:
+            unused_since = datetime.now(UTC) - timedelta(days=config.llm_cache_max_age_days)
+            surplus_since = await llm_responses_surplus_since(session, config.llm_cache_max_entries)
+            while True:
+                batch = await prune_llm_responses(session, unused_since, surplus_since, PRUNE_BATCH_SIZE)
+                await session.commit()
+                deleted += batch
+                if batch < PRUNE_BATCH_SIZE:
+                    break
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error pruning LLM responses: {e}")
+            return
+
+    logger.info(f"Prune LLM responses job completed: {deleted} responses removed")
@@ -0,0 +1,36 @@
+import logging
+
+from sqlalchemy.future import select
+
+from dependency import dependency
+from models.chat import Chat
+from repositories.chat_repository import reconcile_chat_counters
+
+logger = logging.getLogger("reconcile_chat_counters")
+
+# Chats recounted per transaction, keeps the chats rows locked only briefly
+BATCH_SIZE = 50
+
+
+async def reconcile_chat_counters_job():
+    """
+    Job for recounting messages of every chat.
+    The counters are kept up to date by triggers, this fixes drift from writes that raced a previous run
+    or from tables changed while the triggers were disabled.
+    """
+    logger.info("Reconcile chat counters job started")
+    fixed = 0
+    async for session in dependency.get_session():
+        result = await session.execute(select(Chat.id).order_by(Chat.id))
+        chat_ids = result.scalars().all()
+
+        for start in range(0, len(chat_ids), BATCH_SIZE):
+            batch = chat_ids[start : start + BATCH_SIZE]
+            try:
+                fixed += await reconcile_chat_counters(session, batch)
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Error reconciling counters of chats {batch[0]}..{batch[-1]}: {e}")
+
+    logger.info(f"Reconcile chat counters job completed: {fixed} chats fixed")
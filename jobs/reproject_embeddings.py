@@ -0,0 +1,48 @@
+import logging
+
+from config import config
+from dependency import dependency
+from processing.embedder import reduce_embedding
+from repositories.enriched_message_repository import embeddings_to_reproject, update_embeddings
+
+logger = logging.getLogger("reproject_embeddings")
+
+
+async def reproject_embeddings_job():
+    """
+    Job for filling the stored embedding of enriched messages that only have full 4096 dimensional embeddings,
+    written before EMBEDDING_DIMENSIONS was introduced. Rows are re-projected in batches of
+    EMBEDDING_REPROJECT_BATCH_SIZE, one transaction each, and the full embeddings are dropped unless
+    EMBEDDING_KEEP_FULL_VECTORS is set. Does nothing once every row is re-projected.
+    """
+    dimensions = config.embedding_dimensions
+    keep_full = config.embedding_keep_full_vectors
+    reprojected = 0
+    async for session in dependency.get_session():
+        while True:
+            try:
+                rows = await embeddings_to_reproject(session, config.embedding_reproject_batch_size)
+                if not rows:
+                    break
+                await update_embeddings(
+                    session,
+                    [
+                        {
+                            "chat_id": row.chat_id,
+                            "message_id": row.message_id,
+                            "embedding": reduce_embedding(row.embeddings, dimensions),
+                            **({} if keep_full else {"embeddings": None}),
+                        }
+                        for row in rows
+                    ],
+                )
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Error re-projecting embeddings: {e}")
+                break
+            reprojected += len(rows)
+            logger.info(f"Re-projected {reprojected} embeddings into {dimensions} dimensions")
+
+    if reprojected:
+        logger.info(f"Reproject embeddings job completed: {reprojected} embeddings re-projected")
@@ -0,0 +1,98 @@
+import logging
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlalchemy.future import select
+from telethon import TelegramClient, types
+from telethon.errors import ChatAdminRequiredError
+
+from config import config
+from dependency import dependency
+from models.chat import Chat
+from repositories.user_repository import load_user_hashes, upsert_users, user_to_row, username_cache
+from utils.batching import take_batch
+
+logger = logging.getLogger("sync_participants")
+
+PARTICIPANTS_BATCH_SIZE = 1000
+
+# Chat types that have a participant list, mapped to the peer used to address them
+PEER_TYPES = {
+    "Chat": types.PeerChat,
+    "Channel": types.PeerChannel,
+}
+
+
+def chats_to_refresh_query(now: datetime):
+    """
+    Chats whose participants were never listed or whose participants_count changed.
+    Channels often come without participants_count, those are refreshed after participants_refresh_hours.
+    """
+    stale_before = now - timedelta(hours=config.participants_refresh_hours)
+    return select(Chat.id, Chat.chat_type, Chat.member_count).where(
+        Chat.chat_type.in_(PEER_TYPES),
+        or_(
+            Chat.participants_synced_at.is_(None),
+            Chat.member_count.is_distinct_from(Chat.participants_synced_count),
+            Chat.member_count.is_(None) & (Chat.participants_synced_at < stale_before),
+        ),
+    )
+
+
+async def sync_chat_participants(client: TelegramClient, session, chat_id: int, chat_type: str) -> int:
+    """
+    Stream participants of a single chat in chunks and upsert the changed ones.
+    Every chunk is committed on its own, returns the number of users written.
+    """
+    written = 0
+    participants = client.iter_participants(PEER_TYPES[chat_type](chat_id))
+    async for batch in take_batch(participants, PARTICIPANTS_BATCH_SIZE):
+        rows = [user_to_row(participant) for participant in batch]
+        user_hashes = await load_user_hashes(session, [row["id"] for row in rows])
+        changed = [row for row in rows if user_hashes.get(row["id"]) != row["raw_hash"]]
+        written += await upsert_users(session, changed)
+        await session.commit()
+        username_cache.invalidate(row["id"] for row in changed)
+    return written
+
+
+async def mark_participants_synced(session, chat_id: int, member_count: int | None):
+    await session.execute(
+        update(Chat).where(Chat.id == chat_id).values(participants_synced_count=member_count, participants_synced_at=datetime.now(UTC))
+    )
+
+
+async def sync_participants_job():
+    """
+    Job for listing participants of group chats and saving them as users
+    """
+    # Check Telegram client availability
+    if not dependency.telegram_client:
+        logger.warning("Telegram client not available - sync participants job skipped")
+        return
+
+    client = dependency.telegram_client
+    logger.info("Sync participants job started")
+
+    async for session in dependency.get_session():
+        result = await session.execute(chats_to_refresh_query(datetime.now(UTC)))
+        chats = result.all()
+        logger.info(f"Listing participants of {len(chats)} chats")
+
+        for chat_id, chat_type, member_count in chats:
+            try:
+                written = await sync_chat_participants(client, session, chat_id, chat_type)
+                await mark_participants_synced(session, chat_id, member_count)
+                await session.commit()
+                logger.info(f"Synced participants of chat {chat_id}: {written} users changed")
+            except ChatAdminRequiredError:
+                # Broadcast channels hide participants, retry only when the count changes
+                await session.rollback()
+                await mark_participants_synced(session, chat_id, member_count)
+                await session.commit()
+                logger.info(f"Participants of chat {chat_id} are not visible")
+            except Exception as e:
+                await session.rollback()
+                logger.error(f"Error listing participants of chat {chat_id}: {e}")
+
+        logger.info("Sync participants job completed")
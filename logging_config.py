@@ -72,6 +72,11 @@ def setup_logging():
                 "handlers": ["console"],
                 "propagate": False,
             },
+            "sync_participants": {
+                "level": "INFO",
+                "handlers": ["console"],
+                "propagate": False,
+            },
             "dependency": {
                 "level": "INFO",
                 "handlers": ["console"],
@@ -87,6 +92,16 @@ def setup_logging():
                 "handlers": ["console"],
                 "propagate": False,
             },
+            "llm_gateway": {
+                "level": "INFO",
+                "handlers": ["console"],
+                "propagate": False,
+            },
+            "http_session": {
+                "level": "INFO",
+                "handlers": ["console"],
+                "propagate": False,
+            },
         },
     }
 
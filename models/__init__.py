@@ -1,9 +1,12 @@
 from .base import Base
 from .chat import Chat
 from .chat_config import ChatConfig
+from .chat_sync_state import BackfillStatus, ChatSyncState
+from .llm_response import LLMResponse
 from .media import Media
 from .message import Message
 from .messages_enriched import EnrichedMessage
+from .processing_job import ProcessingJob, ProcessingJobKind, ProcessingJobStatus
 from .user import User
 
-__all__ = ["Base", "Chat", "ChatConfig", "Media", "Message", "EnrichedMessage", "User"]
+__all__ = ["Base", "BackfillStatus", "Chat", "ChatConfig", "ChatSyncState", "LLMResponse", "Media", "Message", "EnrichedMessage", "ProcessingJob", "ProcessingJobKind", "ProcessingJobStatus", "User"]
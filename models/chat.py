@@ -6,15 +6,12 @@ from sqlalchemy import (
     Index,
     Integer,
     String,
-    select,
 )
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import column_property, relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 
 from models.base import Base
-from models.message import Message
-from models.messages_enriched import EnrichedMessage
 
 
 class Chat(Base):
@@ -34,6 +31,11 @@ class Chat(Base):
     member_count = Column(Integer, nullable=True)
 
     raw_data = Column(JSONB, nullable=False)
+    raw_hash = Column(String(64), nullable=True)  # sha256 of raw_data, used to skip unchanged writes
+
+    # Participants sync bookkeeping
+    participants_synced_count = Column(Integer, nullable=True)
+    participants_synced_at = Column(DateTime(timezone=True), nullable=True)
 
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     updated_at = Column(
@@ -43,18 +45,17 @@ class Chat(Base):
         nullable=False,
     )
 
-    # Computed properties for message counts
-    messages_count = column_property(select(func.count()).select_from(Message.__table__).where(Message.chat_id == id).scalar_subquery())
-
-    enriched_messages_count = column_property(
-        select(func.count()).select_from(EnrichedMessage.__table__).where(EnrichedMessage.chat_id == id).scalar_subquery()
-    )
+    # Message counts, maintained by statement-level triggers on messages and messages_enriched and
+    # corrected by reconcile_chat_counters_job. Deferred so lookups of a chat do not load them
+    messages_count = deferred(Column(BigInteger, nullable=False, server_default="0"))
+    enriched_messages_count = deferred(Column(BigInteger, nullable=False, server_default="0"))
 
     # Relationships
     messages = relationship("Message", back_populates="chat", cascade="all, delete-orphan")
     enriched_messages = relationship("EnrichedMessage", back_populates="chat", cascade="all, delete-orphan")
     media = relationship("Media", back_populates="chat", cascade="all, delete-orphan")
     config = relationship("ChatConfig", back_populates="chat", uselist=False)
+    sync_state = relationship("ChatSyncState", back_populates="chat", uselist=False)
 
     __table_args__ = (
         Index("ix_chats_type_verified", "chat_type", "is_verified"),
@@ -0,0 +1,53 @@
+from enum import StrEnum
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, String
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+
+from models.base import Base
+
+
+class BackfillStatus(StrEnum):
+    PENDING = "pending"
+    IN_PROGRESS = "in_progress"
+    COMPLETED = "completed"
+
+
+class ChatSyncState(Base):
+    """Model for storing message fetch and enrichment discovery progress of each chat"""
+
+    __tablename__ = "chat_sync_state"
+
+    chat_id = Column(BigInteger, ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True)
+
+    # Newest and oldest message IDs saved by the fetch job
+    high_watermark = Column(BigInteger, nullable=True)
+    low_watermark = Column(BigInteger, nullable=True)
+
+    # Dialog top_message seen at the last completed sync
+    top_message = Column(BigInteger, nullable=True)
+
+    # Range of message IDs the enrichment discovery has looked at, messages outside of it are new to it
+    enrich_scanned_low = Column(BigInteger, nullable=True)
+    enrich_scanned_high = Column(BigInteger, nullable=True)
+
+    backfill_status = Column(String(20), nullable=False, default=BackfillStatus.PENDING)
+    last_synced_at = Column(DateTime(timezone=True), nullable=True)
+
+    # System fields
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    # Relationships
+    chat = relationship("Chat", back_populates="sync_state")
+
+    def __repr__(self):
+        return (
+            f"<ChatSyncState(chat_id={self.chat_id}, high_watermark={self.high_watermark}, "
+            f"low_watermark={self.low_watermark}, backfill_status='{self.backfill_status}')>"
+        )
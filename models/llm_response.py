@@ -0,0 +1,28 @@
+from sqlalchemy import Column, DateTime, Index, String, Text
+from sqlalchemy.sql import func
+
+from models.base import Base
+
+
+class LLMResponse(Base):
+    """
+    Chat completion stored by the hash of the model and everything sent to it, so identical requests are only paid once.
+    Embeddings are not stored, they are cheap to request again and would take 16 kB per row. Pruned by age and count
+    of the least recently used rows.
+    """
+
+    __tablename__ = "llm_responses"
+
+    key = Column(String(64), primary_key=True)
+    model = Column(String(100), nullable=False)
+    # Message content of a chat completion
+    content = Column(Text, nullable=False)
+
+    # System fields
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_llm_responses_last_used_at", "last_used_at"),)
+
+    def __repr__(self):
+        return f"<LLMResponse(key={self.key}, model={self.model})>"
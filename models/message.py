@@ -50,6 +50,7 @@ class Message(Base):
     # Indexes for performance
     __table_args__ = (
         PrimaryKeyConstraint("message_id", "chat_id"),
+        Index("ix_messages_chat_message", "chat_id", "message_id"),
         Index("ix_messages_chat_date", "chat_id", "date"),
         Index("ix_messages_sender_date", "sender_id", "date"),
         Index("ix_messages_type_date", "message_type", "date"),
@@ -1,7 +1,8 @@
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC, Vector
 from sqlalchemy import BigInteger, Column, ForeignKey, PrimaryKeyConstraint, String
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 
+from config import config
 from models.base import Base
 
 
@@ -12,7 +13,11 @@ class EnrichedMessage(Base):
     message_id = Column(BigInteger, nullable=False)
     context = Column(String, nullable=True)
     meaning = Column(String, nullable=True)
-    embeddings = Column(Vector(4096), nullable=True)
+    # Leading EMBEDDING_DIMENSIONS of the embeddings, stored and searched. The column is created by the migrations,
+    # check_embedding_column stops the app at startup when the config describes a different type
+    embedding = Column((HALFVEC if config.embedding_half_precision else Vector)(config.embedding_dimensions), nullable=True)
+    # Full embeddings, only kept with EMBEDDING_KEEP_FULL_VECTORS or until re-projected into embedding
+    embeddings = deferred(Column(Vector(4096), nullable=True))
 
     # Relationships
     chat = relationship("Chat", back_populates="enriched_messages")
@@ -0,0 +1,59 @@
+from enum import StrEnum
+
+from sqlalchemy import BigInteger, Column, DateTime, ForeignKey, Index, Integer, PrimaryKeyConstraint, String, Text
+from sqlalchemy.sql import func
+
+from models.base import Base
+
+
+class ProcessingJobKind(StrEnum):
+    ENRICH_MESSAGE = "enrich_message"
+
+
+class ProcessingJobStatus(StrEnum):
+    PENDING = "pending"
+    RUNNING = "running"
+    # Gave up after the maximum number of attempts, kept for inspection
+    DEAD = "dead"
+
+
+class ProcessingJob(Base):
+    """
+    Durable queue entry for work on a single message, removed once the work is done.
+    Workers claim rows with FOR UPDATE SKIP LOCKED so several app replicas can share the queue.
+    """
+
+    __tablename__ = "processing_jobs"
+
+    kind = Column(String(20), nullable=False, default=ProcessingJobKind.ENRICH_MESSAGE)
+    chat_id = Column(BigInteger, ForeignKey("chats.id", ondelete="CASCADE"), nullable=False)
+    message_id = Column(BigInteger, nullable=False)
+    status = Column(String(20), nullable=False, default=ProcessingJobStatus.PENDING)
+
+    # Retry state
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # A running job whose lease expired is considered abandoned by a crashed worker
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+
+    # System fields
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        PrimaryKeyConstraint("kind", "chat_id", "message_id"),
+        Index("ix_processing_jobs_claim", "kind", "status", "next_attempt_at"),
+        Index("ix_processing_jobs_chat_message", "chat_id", "message_id"),
+    )
+
+    def __repr__(self):
+        return (
+            f"<ProcessingJob(kind='{self.kind}', chat_id={self.chat_id}, message_id={self.message_id}, "
+            f"status='{self.status}', attempts={self.attempts})>"
+        )
@@ -25,6 +25,7 @@ class User(Base):
 
     # Full data in JSONB
     raw_data = Column(JSONB, nullable=False)  # Full user data
+    raw_hash = Column(String(64), nullable=True)  # sha256 of raw_data, used to skip unchanged writes
 
     # System fields
     created_at = Column(
@@ -0,0 +1,49 @@
+from collections import deque
+
+from sqlalchemy.future import select
+
+from models.message import Message
+from processing.enrich_message import CONTEXT_SIZE, format_message, render_context
+from repositories.user_repository import load_usernames
+
+
+class ContextWindow:
+    """
+    Formatted history of one chat that slides forward as messages are enriched in message_id order.
+    Only messages newer than the last loaded one are queried and formatted, the rest is reused.
+    Produces the same text as collect_message_context.
+    """
+
+    def __init__(self, chat_id: int, size: int = CONTEXT_SIZE):
+        self.chat_id = chat_id
+        self.size = size
+        # (message_id, formatted message) in ascending order, the last entry is the newest loaded message
+        self._messages: deque[tuple[int, str]] = deque(maxlen=size + 1)
+
+    @property
+    def last_message_id(self) -> int | None:
+        return self._messages[-1][0] if self._messages else None
+
+    async def _load(self, session, message_id: int) -> None:
+        query = select(Message).where(Message.chat_id == self.chat_id, Message.message_id <= message_id)
+        if self.last_message_id is not None and self.last_message_id < message_id:
+            query = query.where(Message.message_id > self.last_message_id)
+        else:
+            # First use or moving backwards, load the whole window from scratch
+            self._messages.clear()
+        result = await session.execute(query.order_by(Message.message_id.desc()).limit(self.size + 1))
+        messages = list(reversed(result.scalars().all()))
+
+        usernames = await load_usernames(session, {msg.sender_id for msg in messages})
+        for msg in messages:
+            self._messages.append((msg.message_id, format_message(msg.raw_data, usernames.get(msg.sender_id) or "Unknown")))
+
+    async def context_for(self, session, message_id: int) -> str:
+        """Slide the window to message_id and return its LLM context"""
+        if self.last_message_id != message_id:
+            await self._load(session, message_id)
+        if self.last_message_id != message_id:
+            return "Message not found"
+
+        previous_messages = [formatted for _, formatted in reversed(self._messages)][1:]
+        return render_context(previous_messages, self._messages[-1][1])
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable, Sequence
+
+logger = logging.getLogger("embedder")
+
+EmbedBatch = Callable[[list[str]], Awaitable[list[list[float]]]]
+
+
+def reduce_embedding(vector: Sequence[float], dimensions: int) -> list[float]:
+    """
+    Leading dimensions of a Matryoshka embedding, Qwen3-Embedding is trained so that every prefix is an embedding
+    on its own. The prefix is not renormalized, cosine distance does not depend on the length of the vectors.
+    """
+    return [float(value) for value in vector[:dimensions]]
+
+
+class BatchingEmbedder:
+    """
+    Collects texts from concurrent callers and embeds them in one request per batch.
+    A batch is sent as soon as batch_size texts are pending or max_delay seconds after the first one.
+    """
+
+    def __init__(self, embed_batch: EmbedBatch, batch_size: int = 100, max_delay: float = 0.05):
+        self.embed_batch = embed_batch
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # The event loop keeps only weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> list[float]:
+        """Embed a single text, sharing the request with other callers waiting at the same time"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    async def embed_many(self, texts: list[str]) -> list[list[float]]:
+        """Embed a known list of texts in requests of at most batch_size inputs"""
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(await self._request(texts[start : start + self.batch_size]))
+        return vectors
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending[: self.batch_size], self._pending[self.batch_size :]
+        if self._pending:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        try:
+            vectors = await self._request([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors, strict=True):
+            if not future.done():
+                future.set_result(vector)
+
+    async def _request(self, texts: list[str]) -> list[list[float]]:
+        vectors = await self.embed_batch(texts)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedding provider returned {len(vectors)} vectors for {len(texts)} inputs")
+        logger.debug(f"Embedded batch of {len(texts)} texts")
+        return vectors
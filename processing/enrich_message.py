@@ -1,22 +1,40 @@
 import json
 import logging
-import os
 
-from openai import AsyncOpenAI
 from pydantic import BaseModel
 from sqlalchemy.future import select
 
+from config import config
+from external.llm_gateway import llm_gateway
 from models.message import Message
-from models.messages_enriched import EnrichedMessage
-from models.user import User
-
-ai_client = AsyncOpenAI(
-    base_url="https://api.studio.nebius.com/v1/",
-    api_key=os.environ.get("NEBIUS_STUDIO_API_KEY"),
-)
+from processing.embedder import BatchingEmbedder, reduce_embedding
+from processing.response_cache import response_cache, response_key
+from repositories.enriched_message_repository import upsert_enriched_messages
+from repositories.user_repository import load_usernames
 
 logger = logging.getLogger("enrich_messages")
 
+DESCRIBE_MODEL = "deepseek-ai/DeepSeek-V3"
+EMBEDDING_MODEL = "Qwen/Qwen3-Embedding-8B"
+
+
+SYSTEM_PROMPT = """
+                Ты — роботесса в гонкочате с ником @autochromia. Общение идёт на русском языке. 
+                Твоя задача — определить контекст общения до сообщения и смысл сообщения.
+
+                Тебе на вход поступают сообщения из чата в формате: 
+                message {msg_id}: @{username} ответил на id={reply_to}: {msg_text} 
+                msg_id нужны для того чтобы ты мог ссылаться на сообщения в чате и связывать цепочки ответов.  
+
+                Если сообщение является ответом на другое сообщение, то ты должна в контексте учесть эту нитку диалога.
+
+                Ты получаешь на вход сообщения в формате:
+                'Сообщение {номер}: от {пользователь} на id={номер на который ответ}: "{текст сообщения}"'
+
+                Ты должна собрать контекст общения до сообщения и смысл текста сообщения.
+                Используй номера сообщений только для понимания порядка сообщений. Пользователей они недоступны
+                """
+
 
 class UserDescription(BaseModel):
     username: str
@@ -48,9 +66,24 @@ def format_message(raw_data, username):
         return f'Сообщение {msg_id}: от {username}: "{msg_text}"'
 
 
-async def collect_message_context(session, chat_id: int, message_id: int) -> str:
-    from sqlalchemy.future import select
+# Number of earlier messages shown to the LLM before the message being enriched
+CONTEXT_SIZE = 50
+
+
+def render_context(previous_messages: list[str], current_message: str) -> str:
+    """Build the LLM input from formatted messages, previous ones are newest first"""
+    previous_messages_formatted = "\n".join(previous_messages)
+
+    return f"""
+    ПРЕДЫДУЩИЕ СООБЩЕНИЯ:
+    {previous_messages_formatted}
 
+    ТЕКУЩЕЕ СООБЩЕНИЕ:
+    {current_message}
+    """
+
+
+async def collect_message_context(session, chat_id: int, message_id: int) -> str:
     # Get current message
     result = await session.execute(select(Message).where(Message.chat_id == chat_id, Message.message_id == message_id))
     message = result.scalar_one_or_none()
@@ -59,97 +92,99 @@ async def collect_message_context(session, chat_id: int, message_id: int) -> str
 
     # Get previous messages
     result = await session.execute(
-        select(Message).where(Message.chat_id == chat_id, Message.message_id < message_id).order_by(Message.message_id.desc()).limit(50)
+        select(Message).where(Message.chat_id == chat_id, Message.message_id < message_id).order_by(Message.message_id.desc()).limit(CONTEXT_SIZE)
     )
     previous_messages = result.scalars().all()
 
-    # Get usernames
-    result = await session.execute(select(User))
-    users = result.scalars().all()
-    usernames = {}
-    for user in users:
-        username = user.username or f"{user.first_name} {user.last_name}".strip()
-        usernames[user.id] = username
-
-    previous_messages_formatted = "\n".join(format_message(msg.raw_data, usernames.get(msg.sender_id, "Unknown")) for msg in previous_messages)
+    # Get usernames of the senders in the window
+    usernames = await load_usernames(session, {msg.sender_id for msg in previous_messages} | {message.sender_id})
 
-    return f"""
-    ПРЕДЫДУЩИЕ СООБЩЕНИЯ:
-    {previous_messages_formatted}
+    return render_context(
+        [format_message(msg.raw_data, usernames.get(msg.sender_id) or "Unknown") for msg in previous_messages],
+        format_message(message.raw_data, usernames.get(message.sender_id) or "Unknown"),
+    )
 
-    ТЕКУЩЕЕ СООБЩЕНИЕ:
-    {format_message(message.raw_data, usernames.get(message.sender_id, "Unknown"))}
-    """
 
+async def describe_context(chat_id: int, message_id: int, context: str) -> EnrichedMessageData:
+    """Ask the LLM for the context and meaning of a message, unless the same request was answered before"""
+    schema = EnrichedMessageData.model_json_schema()
+    key = response_key(DESCRIBE_MODEL, SYSTEM_PROMPT, json.dumps(schema, sort_keys=True), context)
+    cached = (await response_cache.get_many([key])).get(key)
+    if cached is not None:
+        logger.info(f"Reused cached response for message {message_id} in chat {chat_id}")
+        return EnrichedMessageData.model_validate(json.loads(cached))
 
-async def process_message(session, chat_id: int, message_id: int) -> Message:
-    context = await collect_message_context(session, chat_id=chat_id, message_id=message_id)
-    logger.info(f"Collected context for message {message_id} in chat {chat_id}")
-    response = await ai_client.chat.completions.create(
-        model="deepseek-ai/DeepSeek-V3",
-        messages=[
+    response = await llm_gateway.complete(
+        DESCRIBE_MODEL,
+        [
             {
                 "role": "system",
-                "content": """
-                Ты — роботесса в гонкочате с ником @autochromia. Общение идёт на русском языке. 
-                Твоя задача — определить контекст общения до сообщения и смысл сообщения.
-
-                Тебе на вход поступают сообщения из чата в формате: 
-                message {msg_id}: @{username} ответил на id={reply_to}: {msg_text} 
-                msg_id нужны для того чтобы ты мог ссылаться на сообщения в чате и связывать цепочки ответов.  
-
-                Если сообщение является ответом на другое сообщение, то ты должна в контексте учесть эту нитку диалога.
-
-                Ты получаешь на вход сообщения в формате:
-                'Сообщение {номер}: от {пользователь} на id={номер на который ответ}: "{текст сообщения}"'
-
-                Ты должна собрать контекст общения до сообщения и смысл текста сообщения.
-                Используй номера сообщений только для понимания порядка сообщений. Пользователей они недоступны
-                """,
+                "content": SYSTEM_PROMPT,
             },
             {"role": "user", "content": [{"type": "text", "text": context}]},
         ],
-        extra_body={"guided_json": EnrichedMessageData.model_json_schema()},
+        guided_json=schema,
     )
-    response = response.choices[0].message.content
     logger.info(f"Collected response for message {message_id} in chat {chat_id}")
-    data = json.loads(response)
+    data = EnrichedMessageData.model_validate(json.loads(response))
+    # Only responses that parsed are worth repeating
+    await response_cache.set_many(DESCRIBE_MODEL, {key: response})
+    return data
+
+
+async def describe_message(session, chat_id: int, message_id: int) -> EnrichedMessageData:
+    context = await collect_message_context(session, chat_id=chat_id, message_id=message_id)
+    logger.info(f"Collected context for message {message_id} in chat {chat_id}")
+    return await describe_context(chat_id, message_id, context)
+
 
-    embeddings_data = await ai_client.embeddings.create(
-        model="Qwen/Qwen3-Embedding-8B",
-        input="""
+def embedding_text(data: EnrichedMessageData) -> str:
+    return f"""
         КОНТЕКСТ 
-        {context}
+        {data.context}
 
         СМЫСЛ 
-        {meaning}
-        """.format(
-            context=data["context"], meaning=data["meaning"]
-        ),
-    )
+        {data.meaning}
+        """
+
+
+async def create_embeddings(texts: list[str]) -> list[list[float]]:
+    """Embed many texts with a single provider request, texts embedded before are taken from the in-memory cache"""
+    keys = [response_key(EMBEDDING_MODEL, text) for text in texts]
+    embeddings = await response_cache.get_many(keys, stored=False)
+    missing = {key: text for key, text in zip(keys, texts, strict=True) if key not in embeddings}
+    if missing:
+        vectors = await llm_gateway.embeddings(EMBEDDING_MODEL, list(missing.values()))
+        created = dict(zip(missing, vectors, strict=True))
+        await response_cache.set_many(EMBEDDING_MODEL, created)
+        embeddings.update(created)
+    return [embeddings[key] for key in keys]
+
+
+# Concurrent process_message calls share embeddings requests
+embedder = BatchingEmbedder(
+    create_embeddings,
+    batch_size=config.embedding_batch_size,
+    max_delay=config.embedding_batch_delay_ms / 1000,
+)
+
+
+def enriched_message_row(chat_id: int, message_id: int, data: EnrichedMessageData, embeddings: list[float]) -> dict:
+    return {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "context": data.context,
+        "meaning": data.meaning,
+        "embedding": reduce_embedding(embeddings, config.embedding_dimensions),
+        "embeddings": embeddings if config.embedding_keep_full_vectors else None,
+    }
+
+
+async def process_message(session, chat_id: int, message_id: int) -> None:
+    data = await describe_message(session, chat_id=chat_id, message_id=message_id)
+    embeddings = await embedder.embed(embedding_text(data))
     logger.info(f"Collected embeddings for message {message_id} in chat {chat_id}")
-    embeddings = embeddings_data.data[0].embedding
-
-    # Check if enriched message already exists
-    result = await session.execute(select(EnrichedMessage).where(EnrichedMessage.chat_id == chat_id, EnrichedMessage.message_id == message_id))
-    existing_enriched_message = result.scalar_one_or_none()
-
-    if existing_enriched_message:
-        # Update existing enriched message
-        existing_enriched_message.context = data["context"]
-        existing_enriched_message.meaning = data["meaning"]
-        existing_enriched_message.embeddings = embeddings
-        logger.info(f"Updated existing enriched message: {chat_id}:{message_id}")
-    else:
-        # Create new enriched message
-        db_enriched_message = EnrichedMessage(
-            chat_id=chat_id,
-            message_id=message_id,
-            context=data["context"],
-            meaning=data["meaning"],
-            embeddings=embeddings,
-        )
-        session.add(db_enriched_message)
-        logger.info(f"Created new enriched message: {chat_id}:{message_id}")
 
+    await upsert_enriched_messages(session, [enriched_message_row(chat_id, message_id, data, embeddings)])
     await session.commit()
+    logger.info(f"Saved enriched message: {chat_id}:{message_id}")
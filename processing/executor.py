@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+from dependency import dependency
+from processing.context_window import ContextWindow
+from processing.enrich_message import EnrichedMessageData, describe_context, embedder, embedding_text, enriched_message_row
+from repositories.enriched_message_repository import upsert_enriched_messages
+
+logger = logging.getLogger("enrichment_executor")
+
+
+class EnrichmentExecutor:
+    """
+    Enriches many messages at once with a bounded number of LLM calls in flight.
+    Contexts are built one after another from a sliding window per chat while the LLM calls run concurrently,
+    embeddings of the whole run are requested in batches once all descriptions are ready. The window is kept
+    between runs, a run that continues the chat where the previous one stopped only loads the new messages.
+    """
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Error of every message that failed during the last run
+        self.errors: dict[tuple[int, int], str] = {}
+        self._window: ContextWindow | None = None
+
+    async def _describe(self, chat_id: int, message_id: int, context: str) -> EnrichedMessageData | None:
+        try:
+            return await describe_context(chat_id, message_id, context)
+        except Exception as e:
+            logger.exception(f"Error enriching message {chat_id}:{message_id}: {e}")
+            self.errors[(chat_id, message_id)] = str(e)
+            return None
+        finally:
+            self._semaphore.release()
+
+    async def _embed(self, described: list[tuple[int, int, EnrichedMessageData]]) -> list[dict]:
+        rows = []
+        for start in range(0, len(described), embedder.batch_size):
+            batch = described[start : start + embedder.batch_size]
+            try:
+                vectors = await embedder.embed_many([embedding_text(data) for _, _, data in batch])
+            except Exception as e:
+                logger.exception(f"Error embedding batch of {len(batch)} messages: {e}")
+                self.errors.update({(chat_id, message_id): str(e) for chat_id, message_id, _ in batch})
+                continue
+            rows.extend(enriched_message_row(chat_id, message_id, data, vector) for (chat_id, message_id, data), vector in zip(batch, vectors, strict=True))
+        return rows
+
+    async def run(self, messages: list[tuple[int, int]]) -> list[tuple[int, int]]:
+        """Enrich (chat_id, message_id) pairs and return the ones that succeeded, failures are left in errors"""
+        self.errors = {}
+        pending = []
+        window = self._window
+        async with dependency.async_session() as session:
+            for chat_id, message_id in sorted(messages):
+                if window is None or window.chat_id != chat_id:
+                    window = ContextWindow(chat_id)
+                try:
+                    context = await window.context_for(session, message_id)
+                except Exception as e:
+                    logger.exception(f"Error collecting context for message {chat_id}:{message_id}: {e}")
+                    self.errors[(chat_id, message_id)] = str(e)
+                    await session.rollback()
+                    window = None
+                    continue
+                # Do not build contexts faster than they can be sent
+                await self._semaphore.acquire()
+                pending.append((chat_id, message_id, asyncio.create_task(self._describe(chat_id, message_id, context))))
+        self._window = window
+
+        results = await asyncio.gather(*(task for _, _, task in pending))
+        described = [(chat_id, message_id, data) for (chat_id, message_id, _), data in zip(pending, results, strict=True) if data is not None]
+
+        rows = await self._embed(described)
+        if not rows:
+            return []
+
+        async with dependency.async_session() as session:
+            await upsert_enriched_messages(session, rows)
+            await session.commit()
+        logger.info(f"Saved {len(rows)} enriched messages")
+        return [(row["chat_id"], row["message_id"]) for row in rows]
@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any
+
+from sqlalchemy.exc import DataError, IntegrityError, StatementError
+from sqlalchemy.future import select
+
+from config import config
+from dependency import Workload, dependency
+from models.chat_config import ChatConfig
+from processing.queue import enrichment_queue
+from processing.read_acks import read_ack_coalescer
+from repositories.chat_repository import chat_to_row
+from repositories.message_repository import mark_messages_deleted, message_to_row, save_incoming_messages, update_messages_raw_data
+from repositories.processing_job_repository import add_processing_jobs
+from repositories.user_repository import user_to_row, username_cache
+from utils.telegram_serializer import safe_telegram_to_dict
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger("ingest_buffer")
+
+# raw_hash of chats and senders written by this process, keyed by ("chat" | "user", id)
+entity_hashes = TTLCache(maxsize=10_000, ttl=3600)
+
+
+def _is_data_error(error: Exception) -> bool:
+    """
+    Errors caused by the events themselves, only these count as failed attempts. Anything else, like a lost
+    connection or a pool checkout timeout, says nothing about the events and is retried for as long as it lasts.
+    """
+    if isinstance(error, DataError | IntegrityError | TypeError | ValueError):
+        return True
+    # Raised by SQLAlchemy itself when a parameter cannot be bound, the driver never saw the statement
+    return type(error) is StatementError
+
+
+@dataclass
+class IngestBatch:
+    """Realtime events collected between two flushes, later events for the same row win"""
+
+    messages: dict[tuple[int, int], dict[str, Any]] = field(default_factory=dict)
+    chats: dict[int, dict[str, Any]] = field(default_factory=dict)
+    users: dict[int, dict[str, Any]] = field(default_factory=dict)
+    edits: dict[tuple[int, int], dict] = field(default_factory=dict)
+    deletions: dict[int | None, set[int]] = field(default_factory=dict)
+    # (chat entity, message) pairs to mark as read once the batch is committed
+    read_acks: list[tuple[Any, Any]] = field(default_factory=list)
+    events: int = 0
+    # Failed writes of the oldest events in the batch
+    attempts: int = 0
+
+    def merge(self, newer: "IngestBatch") -> "IngestBatch":
+        """Combine with a batch of events that arrived later"""
+        merged = IngestBatch(
+            messages=self.messages | newer.messages,
+            chats=self.chats | newer.chats,
+            users=self.users | newer.users,
+            edits=self.edits | newer.edits,
+            deletions={chat_id: set(ids) for chat_id, ids in self.deletions.items()},
+            read_acks=self.read_acks + newer.read_acks,
+            events=self.events + newer.events,
+            attempts=max(self.attempts, newer.attempts),
+        )
+        for chat_id, message_ids in newer.deletions.items():
+            merged.deletions.setdefault(chat_id, set()).update(message_ids)
+        return merged
+
+    def split(self) -> list["IngestBatch"]:
+        """One batch per event, a message keeps its chat and sender rows and its read acknowledgement"""
+        read_acks: dict[tuple[int, int], list[tuple[Any, Any]]] = {}
+        for chat, message in self.read_acks:
+            read_acks.setdefault((chat.id, message.id), []).append((chat, message))
+
+        batches = []
+        for key, row in self.messages.items():
+            chat_id, sender_id = key[0], row.get("sender_id")
+            batches.append(
+                IngestBatch(
+                    messages={key: row},
+                    chats={chat_id: self.chats[chat_id]} if chat_id in self.chats else {},
+                    users={sender_id: self.users[sender_id]} if sender_id in self.users else {},
+                    read_acks=read_acks.get(key, []),
+                    events=1,
+                )
+            )
+        # Edits and deletions come after the messages they may refer to
+        batches.extend(IngestBatch(edits={key: raw_data}, events=1) for key, raw_data in self.edits.items())
+        batches.extend(IngestBatch(deletions={chat_id: message_ids}, events=1) for chat_id, message_ids in self.deletions.items())
+        return batches
+
+
+class IngestBuffer:
+    """
+    Collects realtime Telegram events and writes them in one transaction with bulk statements,
+    once max_events are buffered or max_delay seconds after the first one.
+
+    Handlers return as soon as an event is buffered, with sequential_updates waiting for the commit
+    would cap every batch at a single event. A failed flush keeps its events and is retried, after
+    max_attempts failures caused by the data the events are written one at a time so that a single bad
+    event cannot block the others, the ones that still fail with a data error are logged and dropped. Messages are handed to the read
+    acknowledgement coalescer only after the commit.
+    """
+
+    def __init__(self, max_events: int, max_delay: float, max_attempts: int = 5):
+        self.max_events = max_events
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self._batch = IngestBatch()
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._lock = asyncio.Lock()
+        # The event loop keeps only weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return self._batch.events
+
+    def add_message(self, message, chat, sender) -> None:
+        chat_row = chat_to_row(chat)
+        if entity_hashes.get(("chat", chat.id)) != chat_row["raw_hash"]:
+            self._batch.chats[chat.id] = chat_row
+        if sender:
+            user_row = user_to_row(sender)
+            if entity_hashes.get(("user", sender.id)) != user_row["raw_hash"]:
+                self._batch.users[sender.id] = user_row
+
+        message_row = message_to_row(message, chat.id)
+        message_row["sender_id"] = sender.id if sender else None
+        self._batch.messages[(chat.id, message.id)] = message_row
+        self._batch.read_acks.append((chat, message))
+        self._added()
+
+    def add_edit(self, chat_id: int, message) -> None:
+        self._batch.edits[(chat_id, message.id)] = safe_telegram_to_dict(message)
+        self._added()
+
+    def add_deletion(self, chat_id: int | None, message_ids: list[int]) -> None:
+        self._batch.deletions.setdefault(chat_id, set()).update(message_ids)
+        self._added()
+
+    def _added(self) -> None:
+        self._batch.events += 1
+        if self._batch.events >= self.max_events:
+            self._schedule(0)
+        elif self._flush_handle is None:
+            self._schedule(self.max_delay)
+
+    def _schedule(self, delay: float) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._flush_handle = asyncio.get_running_loop().call_later(delay, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(self, batch: IngestBatch) -> list[tuple[int, int]]:
+        """Write the batch in one transaction and return the messages queued for enrichment"""
+        async with dependency.async_session(Workload.INGEST) as session:
+            await save_incoming_messages(session, list(batch.messages.values()), list(batch.chats.values()), list(batch.users.values()))
+            await update_messages_raw_data(session, batch.edits)
+            await mark_messages_deleted(session, batch.deletions)
+
+            to_enrich = []
+            if batch.messages:
+                result = await session.execute(
+                    select(ChatConfig.chat_id).where(
+                        ChatConfig.chat_id.in_({chat_id for chat_id, _ in batch.messages}),
+                        ChatConfig.enrich_messages.is_(True),
+                    )
+                )
+                enrich_chats = set(result.scalars().all())
+                to_enrich = [key for key in batch.messages if key[0] in enrich_chats]
+                await add_processing_jobs(session, to_enrich)
+
+            await session.commit()
+        return to_enrich
+
+    async def flush(self) -> None:
+        """Write everything buffered so far"""
+        async with self._lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            batch, self._batch = self._batch, IngestBatch()
+            if not batch.events:
+                return
+
+            try:
+                to_enrich = await self._write(batch)
+            except Exception as e:
+                self._forget_entities(batch)
+                if _is_data_error(e):
+                    batch.attempts += 1
+                if batch.attempts < self.max_attempts:
+                    logger.exception(f"Failed to write {batch.events} buffered events, retrying: {e}")
+                    self._retry(batch)
+                    return
+                logger.exception(f"Failed to write {batch.events} buffered events {batch.attempts} times, writing them one at a time: {e}")
+                await self._write_separately(batch)
+                return
+
+            self._committed(batch, to_enrich)
+
+    async def _write_separately(self, batch: IngestBatch) -> None:
+        """Write every event of a batch that keeps failing on its own, dropping the ones that still fail with a data error"""
+        singles = batch.split()
+        for index, single in enumerate(singles):
+            try:
+                to_enrich = await self._write(single)
+            except Exception as e:
+                if not _is_data_error(e):
+                    logger.exception(f"Failed to write events one at a time for a reason other than their data, retrying: {e}")
+                    remaining = IngestBatch(attempts=batch.attempts)
+                    for rest in singles[index:]:
+                        remaining = remaining.merge(rest)
+                    self._retry(remaining)
+                    return
+                event = {
+                    "messages": list(single.messages.values()),
+                    "chats": list(single.chats.values()),
+                    "users": list(single.users.values()),
+                    "edits": [{"chat_id": chat_id, "message_id": message_id, "raw_data": raw_data} for (chat_id, message_id), raw_data in single.edits.items()],
+                    "deletions": [{"chat_id": chat_id, "message_ids": sorted(message_ids)} for chat_id, message_ids in single.deletions.items()],
+                }
+                # The event is kept in the log so that it can be replayed by hand once the cause is fixed
+                logger.error(f"Dropping event that cannot be written: {e!r}: {json.dumps(event, ensure_ascii=False, default=str)}")
+                continue
+            self._committed(single, to_enrich)
+
+    def _forget_entities(self, batch: IngestBatch) -> None:
+        """Chats and senders of a failed batch that were skipped as unchanged may be missing, write them with the retry"""
+        entity_hashes.invalidate([("chat", chat.id) for chat, _ in batch.read_acks])
+        entity_hashes.invalidate([("user", row["sender_id"]) for row in batch.messages.values() if row.get("sender_id")])
+        for chat, _ in batch.read_acks:
+            batch.chats.setdefault(chat.id, chat_to_row(chat))
+
+    def _retry(self, batch: IngestBatch) -> None:
+        self._batch = batch.merge(self._batch)
+        self._schedule(self.max_delay)
+
+    def _committed(self, batch: IngestBatch, to_enrich: list[tuple[int, int]]) -> None:
+        for chat_id, row in batch.chats.items():
+            entity_hashes.set(("chat", chat_id), row["raw_hash"])
+        for user_id, row in batch.users.items():
+            entity_hashes.set(("user", user_id), row["raw_hash"])
+        username_cache.invalidate(batch.users)
+        # Enrichment runs in the consumer pool so it never holds up ingestion
+        if to_enrich:
+            enrichment_queue.notify()
+        # Only committed messages are marked as read, once per chat by the coalescer
+        for chat, message in batch.read_acks:
+            read_ack_coalescer.add(chat, message.id)
+        logger.debug(f"Flushed {batch.events} events: {len(batch.messages)} messages, {len(batch.edits)} edits")
+
+    async def close(self) -> None:
+        """Flush pending events on shutdown, a failed write is retried a few times before the events are dropped"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for _ in range(3):
+            await self.flush()
+            if not self._batch.events:
+                break
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._batch.events:
+            logger.error(f"Dropping {self._batch.events} buffered events on shutdown")
+
+
+ingest_buffer = IngestBuffer(
+    max_events=config.ingest_batch_size,
+    max_delay=config.ingest_flush_interval_ms / 1000,
+    max_attempts=config.ingest_max_attempts,
+)
@@ -0,0 +1,84 @@
+import asyncio
+import contextlib
+import logging
+
+from config import config
+from dependency import dependency
+from processing.enrich_message import collect_message_context, describe_context, embedder, embedding_text, enriched_message_row
+from repositories.enriched_message_repository import upsert_enriched_messages
+from repositories.processing_job_repository import claim_processing_jobs, complete_processing_jobs, fail_processing_jobs
+
+logger = logging.getLogger("enrichment_queue")
+
+
+class EnrichmentQueue:
+    """
+    Pool of consumer tasks draining enrich_message jobs from the processing_jobs table.
+    Jobs are claimed one at a time with FOR UPDATE SKIP LOCKED, so consumers of several app replicas never
+    take the same message. notify() wakes idle consumers right away, otherwise they poll for due retries.
+    Like the executor, a consumer only holds a session to read the context and to write the result, never
+    across the LLM calls.
+    """
+
+    def __init__(self):
+        self._wakeup = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+
+    def notify(self) -> None:
+        """Tell the consumers a committed processing job is waiting"""
+        self._wakeup.set()
+
+    async def _claim(self) -> tuple[int, int] | None:
+        async with dependency.async_session() as session:
+            claimed = await claim_processing_jobs(session, limit=1)
+            await session.commit()
+        return claimed[0] if claimed else None
+
+    async def _process(self, chat_id: int, message_id: int) -> None:
+        try:
+            async with dependency.async_session() as session:
+                context = await collect_message_context(session, chat_id=chat_id, message_id=message_id)
+            data = await describe_context(chat_id, message_id, context)
+            embedding = await embedder.embed(embedding_text(data))
+            async with dependency.async_session() as session:
+                await upsert_enriched_messages(session, [enriched_message_row(chat_id, message_id, data, embedding)])
+                await complete_processing_jobs(session, [(chat_id, message_id)])
+                await session.commit()
+            logger.info(f"Saved enriched message: {chat_id}:{message_id}")
+        except Exception as e:
+            logger.exception(f"Error enriching message {chat_id}:{message_id}: {e}")
+            async with dependency.async_session() as session:
+                await fail_processing_jobs(session, {(chat_id, message_id): str(e)})
+                await session.commit()
+
+    async def _wait(self) -> None:
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), timeout=config.enrich_queue_poll_seconds)
+        self._wakeup.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+                if job is None:
+                    await self._wait()
+                    continue
+                await self._process(*job)
+            except Exception as e:
+                logger.exception(f"Error in enrichment consumer: {e}")
+                await asyncio.sleep(config.enrich_queue_poll_seconds)
+
+    async def start(self, workers: int) -> None:
+        """Start the consumers, jobs left running by a crashed process are taken over after their lease expires"""
+        logger.info(f"Starting {workers} enrichment workers")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    async def stop(self) -> None:
+        """Cancel the consumers, unfinished jobs are retried once their lease expires"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+enrichment_queue = EnrichmentQueue()
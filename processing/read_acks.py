@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Any
+
+from config import config
+from dependency import Workload, dependency
+from repositories.message_repository import mark_messages_read
+
+logger = logging.getLogger("read_acks")
+
+# Messages flagged as read per statement and transaction
+READ_FLAG_BATCH_SIZE = 5_000
+
+
+class ReadAckCoalescer:
+    """
+    Marks chats as read in Telegram with one request per chat instead of one per message.
+    Keeps the highest message_id seen for every chat and acknowledges it every interval seconds.
+    Messages since the last acknowledgement of the chat are flagged as read in the database, on the jobs pool
+    so that ingestion keeps its connections. The first acknowledgement of a chat after a start covers its whole
+    history and is written in chunks.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # chat_id -> (latest chat entity, highest message_id to acknowledge)
+        self._pending: dict[int, tuple[Any, int]] = {}
+        # chat_id -> highest message_id flagged as read in the database
+        self._flagged: dict[int, int] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._lock = asyncio.Lock()
+        # The event loop keeps only weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, chat, message_id: int) -> None:
+        """Remember that chat is read up to message_id, the acknowledgement is sent with the next flush"""
+        _, max_id = self._pending.get(chat.id, (None, message_id))
+        self._pending[chat.id] = (chat, max(max_id, message_id))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.interval, self._start_flush)
+
+    def _start_flush(self) -> None:
+        self._flush_handle = None
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """Acknowledge every pending chat, chats that fail are retried with the next flush"""
+        async with self._lock:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            acknowledged = {}
+            for chat_id, (chat, max_id) in pending.items():
+                try:
+                    await dependency.telegram_client.send_read_acknowledge(chat, max_id=max_id)
+                    acknowledged[chat_id] = max_id
+                except Exception as e:
+                    logger.warning(f"Failed to mark chat {chat_id} as read up to message {max_id}: {e}")
+                    # Newer messages may have arrived for this chat during the flush
+                    _, newer_max_id = self._pending.get(chat_id, (None, max_id))
+                    self._pending[chat_id] = (chat, max(max_id, newer_max_id))
+
+            for chat_id, max_id in acknowledged.items():
+                try:
+                    await self._flag_read(chat_id, max_id)
+                except Exception as e:
+                    logger.exception(f"Failed to flag messages of chat {chat_id} up to {max_id} as read: {e}")
+            logger.debug(f"Acknowledged {len(acknowledged)} of {len(pending)} chats")
+
+            if self._pending and self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.interval, self._start_flush)
+
+    async def _flag_read(self, chat_id: int, max_id: int) -> None:
+        flagged = self._flagged.get(chat_id)
+        while flagged is None or flagged < max_id:
+            async with dependency.async_session(Workload.JOBS) as session:
+                flagged = await mark_messages_read(session, chat_id, after=flagged, up_to=max_id, limit=READ_FLAG_BATCH_SIZE)
+                await session.commit()
+            self._flagged[chat_id] = flagged
+
+    async def close(self) -> None:
+        """Send the pending acknowledgements on shutdown"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.flush()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._pending:
+            logger.warning(f"Dropping read acknowledgements of {len(self._pending)} chats on shutdown")
+
+
+read_ack_coalescer = ReadAckCoalescer(interval=config.read_ack_interval_seconds)
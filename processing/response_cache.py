@@ -0,0 +1,84 @@
+import hashlib
+import logging
+from array import array
+from collections.abc import Iterable
+
+from config import config
+from dependency import dependency
+from repositories.llm_response_repository import load_llm_responses, save_llm_responses
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger("response_cache")
+
+Response = str | list[float]
+
+
+def response_key(model: str, *parts: str) -> str:
+    """Content address of a request, parts are everything besides the model that the response depends on"""
+    digest = hashlib.sha256()
+    for part in (model, *parts):
+        encoded = part.encode()
+        # Length prefixes keep ("ab", "c") and ("a", "bc") apart
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Provider responses by response_key, an in-memory LRU in front of the llm_responses table.
+    Only chat completions are stored in the table, embeddings are kept in memory. Responses never go stale
+    as the key covers the whole request. Storage errors are logged and treated as misses, so the cache can
+    cost a provider call but never fail one.
+    """
+
+    def __init__(self, memory_size: int, ttl: float, enabled: bool = True):
+        self.enabled = enabled
+        self.memory = TTLCache(maxsize=memory_size, ttl=ttl)
+
+    def _remember(self, key: str, response: Response) -> None:
+        # Embeddings as float32 take a quarter of the memory of a list of floats
+        self.memory.set(key, response if isinstance(response, str) else array("f", response))
+
+    async def get_many(self, keys: Iterable[str], stored: bool = True) -> dict[str, Response]:
+        """Cached responses of the keys that have one, the table is only asked for stored kinds of responses"""
+        if not self.enabled:
+            return {}
+        found, missing = self.memory.get_many(keys)
+        found = {key: value if isinstance(value, str) else value.tolist() for key, value in found.items()}
+        if missing and stored:
+            try:
+                async with dependency.async_session() as session:
+                    loaded = await load_llm_responses(session, missing)
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"Error loading {len(missing)} cached responses: {e}")
+                loaded = {}
+            for key, response in loaded.items():
+                self._remember(key, response)
+            found.update(loaded)
+        return found
+
+    async def set_many(self, model: str, responses: dict[str, Response]) -> None:
+        """Remember responses of one model, chat completions are stored in the table as well"""
+        if not self.enabled or not responses:
+            return
+        for key, response in responses.items():
+            self._remember(key, response)
+        rows = [{"key": key, "model": model, "content": response} for key, response in responses.items() if isinstance(response, str)]
+        if not rows:
+            return
+        try:
+            async with dependency.async_session() as session:
+                await save_llm_responses(session, rows)
+                await session.commit()
+        except Exception as e:
+            logger.warning(f"Error storing {len(rows)} responses of {model}: {e}")
+
+
+# Shared by enrichment and search, one process wide LRU
+response_cache = ResponseCache(
+    memory_size=config.llm_cache_memory_size,
+    ttl=config.llm_cache_max_age_days * 86400,
+    enabled=config.llm_cache_enabled,
+)
@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Any
+
+from config import config
+from dependency import Workload, dependency
+from processing.embedder import reduce_embedding
+from processing.enrich_message import create_embeddings
+from repositories.enriched_message_repository import search_enriched_messages
+
+# Qwen3-Embedding expects queries with an instruction, the indexed documents are embedded without one
+QUERY_INSTRUCTION = "Instruct: Given a search query, retrieve Telegram messages relevant to it\nQuery: "
+
+
+async def semantic_search(
+    query: str,
+    limit: int,
+    chat_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+) -> list[dict[str, Any]]:
+    """Enriched messages closest in meaning to the query, best match first"""
+    # Sent at once instead of through the batching embedder, whose delay suits bulk enrichment but not a waiting user
+    [embedding] = await create_embeddings([QUERY_INSTRUCTION + query])
+    query_embedding = reduce_embedding(embedding, config.embedding_dimensions)
+    async with dependency.async_session(Workload.READONLY) as session:
+        rows = await search_enriched_messages(
+            session,
+            query_embedding,
+            limit=limit,
+            ef_search=config.search_ef_search,
+            chat_id=chat_id,
+            date_from=date_from,
+            date_to=date_to,
+        )
+    return [row._asdict() for row in rows]
@@ -0,0 +1,18 @@
+from .bulk import bulk_upsert
+from .chat_repository import chat_to_row, load_chat_hashes, upsert_chats
+from .enriched_message_repository import upsert_enriched_messages
+from .message_repository import message_to_row, upsert_messages
+from .user_repository import load_user_hashes, upsert_users, user_to_row
+
+__all__ = [
+    "bulk_upsert",
+    "chat_to_row",
+    "load_chat_hashes",
+    "load_user_hashes",
+    "message_to_row",
+    "upsert_chats",
+    "upsert_enriched_messages",
+    "upsert_messages",
+    "upsert_users",
+    "user_to_row",
+]
@@ -0,0 +1,86 @@
+import logging
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import func
+
+logger = logging.getLogger("bulk_upsert")
+
+# PostgreSQL wire protocol limits a single statement to 32767 bind parameters
+MAX_BIND_PARAMS = 32767
+
+_INSERT_BY_DIALECT = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def _dedupe(rows: Iterable[dict[str, Any]], index_elements: Sequence[str]) -> list[dict[str, Any]]:
+    """
+    Keep only the last row for every conflict key.
+    ON CONFLICT DO UPDATE cannot touch the same row twice in one statement.
+    """
+    unique = {}
+    for row in rows:
+        unique[tuple(row[key] for key in index_elements)] = row
+    return list(unique.values())
+
+
+def upsert_statement(
+    dialect: str,
+    model,
+    rows: list[dict[str, Any]],
+    index_elements: Sequence[str],
+    update_columns: Sequence[str] | None = None,
+):
+    """
+    Build a single INSERT ... ON CONFLICT (index_elements) statement for already deduplicated rows.
+
+    Columns from update_columns (by default every non-key column present in the rows) are
+    overwritten on conflict, and updated_at is bumped when the model has it.
+    """
+    insert = _INSERT_BY_DIALECT.get(dialect)
+    if insert is None:
+        raise NotImplementedError(f"Bulk upsert is not supported for dialect {dialect}")
+
+    table = model.__table__
+    if update_columns is None:
+        update_columns = [column for column in rows[0] if column not in index_elements]
+
+    stmt = insert(table).values(rows)
+    if update_columns:
+        set_ = {column: stmt.excluded[column] for column in update_columns}
+        if "updated_at" in table.c and "updated_at" not in set_:
+            set_["updated_at"] = func.now()
+        return stmt.on_conflict_do_update(index_elements=list(index_elements), set_=set_)
+    return stmt.on_conflict_do_nothing(index_elements=list(index_elements))
+
+
+async def bulk_upsert(
+    session: AsyncSession,
+    model,
+    rows: Iterable[dict[str, Any]],
+    index_elements: Sequence[str],
+    update_columns: Sequence[str] | None = None,
+) -> int:
+    """
+    Write rows with multi-row INSERT ... ON CONFLICT (index_elements) DO UPDATE.
+
+    All rows must have the same keys. Columns from update_columns (by default every
+    non-key column present in the rows) are overwritten on conflict, and updated_at
+    is bumped when the model has it. Returns the number of rows written.
+    The caller owns the transaction.
+    """
+    rows = _dedupe(rows, index_elements)
+    if not rows:
+        return 0
+
+    dialect = session.get_bind().dialect.name
+    chunk_size = max(1, MAX_BIND_PARAMS // len(rows[0]))
+    for start in range(0, len(rows), chunk_size):
+        await session.execute(upsert_statement(dialect, model, rows[start : start + chunk_size], index_elements, update_columns))
+
+    logger.debug(f"Upserted {len(rows)} rows into {model.__table__.name}")
+    return len(rows)
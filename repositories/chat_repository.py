@@ -0,0 +1,65 @@
+from typing import Any
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models.chat import Chat
+from models.message import Message
+from models.messages_enriched import EnrichedMessage
+from repositories.bulk import bulk_upsert
+from utils.telegram_serializer import entity_hash, safe_telegram_to_dict
+
+
+def chat_to_row(entity) -> dict[str, Any]:
+    """Convert Telethon chat, channel or user entity to a chats table row"""
+    raw_data = safe_telegram_to_dict(entity)
+    return {
+        "id": entity.id,
+        "chat_type": entity.__class__.__name__,
+        "title": getattr(entity, "title", None),
+        "username": getattr(entity, "username", None),
+        "is_verified": getattr(entity, "verified", False),
+        "is_scam": getattr(entity, "scam", False),
+        "is_fake": getattr(entity, "fake", False),
+        "member_count": getattr(entity, "participants_count", 0),
+        "raw_data": raw_data,
+        "raw_hash": entity_hash(raw_data),
+    }
+
+
+async def load_chat_hashes(session: AsyncSession, chat_ids) -> dict[int, str | None]:
+    """Map chat ID to the stored raw_hash for chats that already exist"""
+    if not chat_ids:
+        return {}
+    result = await session.execute(select(Chat.id, Chat.raw_hash).where(Chat.id.in_(chat_ids)))
+    return dict(result.all())
+
+
+async def upsert_chats(session: AsyncSession, rows: list[dict[str, Any]]) -> int:
+    """Insert or update a batch of chat rows in a single statement"""
+    return await bulk_upsert(session, Chat, rows, index_elements=("id",))
+
+
+async def reconcile_chat_counters(session: AsyncSession, chat_ids) -> int:
+    """Recount messages and enriched messages of the given chats and fix drifted counters, returns how many were fixed"""
+    counts = (
+        select(
+            Chat.id.label("chat_id"),
+            select(func.count()).select_from(Message).where(Message.chat_id == Chat.id).scalar_subquery().label("messages"),
+            select(func.count()).select_from(EnrichedMessage).where(EnrichedMessage.chat_id == Chat.id).scalar_subquery().label("enriched"),
+        )
+        .where(Chat.id.in_(chat_ids))
+        .subquery()
+    )
+    result = await session.execute(
+        update(Chat)
+        .where(
+            Chat.id == counts.c.chat_id,
+            or_(Chat.messages_count != counts.c.messages, Chat.enriched_messages_count != counts.c.enriched),
+        )
+        # Counters are not chat data, keep updated_at as it is
+        .values(messages_count=counts.c.messages, enriched_messages_count=counts.c.enriched, updated_at=Chat.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
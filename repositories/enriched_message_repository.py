@@ -0,0 +1,119 @@
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import and_, bindparam, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config import config
+from models.message import Message
+from models.messages_enriched import EnrichedMessage
+from repositories.bulk import bulk_upsert
+
+ENRICHED_MESSAGE_UPDATE_COLUMNS = ("context", "meaning", "embedding", "embeddings")
+
+# HNSW index over the stored embedding by cosine distance
+EMBEDDING_INDEX = "ix_messages_enriched_embedding_hnsw"
+
+
+def embedding_column_type() -> str:
+    """Type of the stored embedding column as Postgres formats it, following the embedding config"""
+    return f"{'halfvec' if config.embedding_half_precision else 'vector'}({config.embedding_dimensions})"
+
+
+async def check_embedding_column(session: AsyncSession) -> None:
+    """Fail when the configured embedding type differs from the column the migrations created, every write would fail"""
+    result = await session.execute(
+        text(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = 'messages_enriched'::regclass AND attname = 'embedding' AND NOT attisdropped"
+        )
+    )
+    actual = result.scalar_one_or_none()
+    if actual != embedding_column_type():
+        raise RuntimeError(
+            f"messages_enriched.embedding is {actual} but EMBEDDING_DIMENSIONS and EMBEDDING_HALF_PRECISION describe "
+            f"{embedding_column_type()}, change them to match or migrate the column"
+        )
+
+
+async def upsert_enriched_messages(session: AsyncSession, rows: list[dict[str, Any]]) -> int:
+    """Insert or update a batch of enrichment results in a single statement"""
+    return await bulk_upsert(
+        session,
+        EnrichedMessage,
+        rows,
+        index_elements=("chat_id", "message_id"),
+        update_columns=ENRICHED_MESSAGE_UPDATE_COLUMNS,
+    )
+
+
+async def embeddings_to_reproject(session: AsyncSession, limit: int) -> list[Any]:
+    """
+    (chat_id, message_id, embeddings) of rows that have full embeddings but no stored embedding yet.
+    The rows stay locked until commit, concurrent runs skip them.
+    """
+    result = await session.execute(
+        select(EnrichedMessage.chat_id, EnrichedMessage.message_id, EnrichedMessage.embeddings)
+        .where(EnrichedMessage.embedding.is_(None), EnrichedMessage.embeddings.is_not(None))
+        .order_by(EnrichedMessage.chat_id, EnrichedMessage.message_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return result.all()
+
+
+async def update_embeddings(session: AsyncSession, rows: list[dict[str, Any]]) -> None:
+    """Update embedding columns of rows given by primary key, in one executemany"""
+    if rows:
+        await session.execute(update(EnrichedMessage), rows)
+
+
+async def search_enriched_messages(
+    session: AsyncSession,
+    query_embedding: list[float],
+    limit: int,
+    ef_search: int,
+    chat_id: int | None = None,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    exact: bool = False,
+) -> list[Any]:
+    """
+    Enriched messages closest to the query embedding by cosine distance, closest first.
+    The query embedding has to be reduced to the stored dimensions. The HNSW index returns up to ef_search rows
+    and filters are applied to those, so very selective filters can return fewer than limit messages.
+    With exact, all embeddings are scanned instead.
+    """
+    query_vector = bindparam("query_embedding", query_embedding, type_=EnrichedMessage.embedding.type)
+    distance = EnrichedMessage.embedding.cosine_distance(query_vector)
+
+    query = (
+        select(
+            EnrichedMessage.chat_id,
+            EnrichedMessage.message_id,
+            Message.sender_id,
+            Message.date,
+            Message.raw_data["message"].astext.label("text"),
+            EnrichedMessage.context,
+            EnrichedMessage.meaning,
+            distance.label("distance"),
+        )
+        .join(Message, and_(Message.chat_id == EnrichedMessage.chat_id, Message.message_id == EnrichedMessage.message_id))
+        .where(EnrichedMessage.embedding.is_not(None), Message.is_deleted.is_not(True))
+    )
+    if chat_id is not None:
+        query = query.where(EnrichedMessage.chat_id == chat_id)
+    if date_from is not None:
+        query = query.where(Message.date >= date_from)
+    if date_to is not None:
+        query = query.where(Message.date < date_to)
+
+    if exact:
+        # Without index scans the planner has to sort every embedding by its distance
+        await session.execute(text("SET LOCAL enable_indexscan = off"))
+    else:
+        # ef_search bounds how many rows an HNSW scan returns
+        await session.execute(text(f"SET LOCAL hnsw.ef_search = {min(max(ef_search, limit), 1000)}"))
+    result = await session.execute(query.order_by(distance).limit(limit))
+    return result.all()
@@ -0,0 +1,49 @@
+from collections.abc import Iterable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import func
+
+from models.llm_response import LLMResponse
+from repositories.bulk import bulk_upsert
+
+# Hits refresh last_used_at at most this often, so most reads stay reads
+TOUCH_INTERVAL = timedelta(days=1)
+
+
+async def load_llm_responses(session: AsyncSession, keys: Iterable[str]) -> dict[str, str]:
+    """Map request key to the stored content, found rows not marked as used within TOUCH_INTERVAL are marked now"""
+    keys = list(keys)
+    if not keys:
+        return {}
+    stale = (LLMResponse.last_used_at < datetime.now(UTC) - TOUCH_INTERVAL).label("stale")
+    result = await session.execute(select(LLMResponse.key, LLMResponse.content, stale).where(LLMResponse.key.in_(keys)))
+    rows = result.all()
+    stale_keys = [row.key for row in rows if row.stale]
+    if stale_keys:
+        await session.execute(update(LLMResponse).where(LLMResponse.key.in_(stale_keys)).values(last_used_at=func.now()))
+    return {row.key: row.content for row in rows}
+
+
+async def save_llm_responses(session: AsyncSession, rows: list[dict[str, Any]]) -> int:
+    """Insert responses, keys stored meanwhile by a concurrent request are left as they are"""
+    return await bulk_upsert(session, LLMResponse, rows, index_elements=("key",), update_columns=())
+
+
+async def llm_responses_surplus_since(session: AsyncSession, max_entries: int) -> datetime | None:
+    """last_used_at of the most recently used response beyond the max_entries kept ones, None when there are fewer"""
+    result = await session.execute(select(LLMResponse.last_used_at).order_by(LLMResponse.last_used_at.desc()).offset(max_entries).limit(1))
+    return result.scalar_one_or_none()
+
+
+async def prune_llm_responses(session: AsyncSession, unused_since: datetime, surplus_since: datetime | None, limit: int) -> int:
+    """Delete up to limit responses last used before unused_since, or at or before surplus_since when given"""
+    condition = LLMResponse.last_used_at < unused_since
+    if surplus_since is not None:
+        condition = or_(condition, LLMResponse.last_used_at <= surplus_since)
+    keys = select(LLMResponse.key).where(condition).limit(limit).scalar_subquery()
+    result = await session.execute(delete(LLMResponse).where(LLMResponse.key.in_(keys)))
+    return result.rowcount
@@ -0,0 +1,104 @@
+from typing import Any
+
+from sqlalchemy import bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models.chat import Chat
+from models.message import Message
+from models.user import User
+from repositories.bulk import bulk_upsert, upsert_statement
+from utils.telegram_serializer import safe_telegram_to_dict
+
+# Read/delete flags are owned by the realtime hook and must survive a re-fetch
+MESSAGE_UPDATE_COLUMNS = ("sender_id", "date", "message_type", "raw_data")
+
+
+def message_to_row(msg, chat_id: int) -> dict[str, Any]:
+    """Convert Telethon message to a messages table row"""
+    return {
+        "message_id": msg.id,
+        "chat_id": chat_id,
+        "sender_id": msg.sender_id if msg.sender_id else None,
+        "date": msg.date,
+        "message_type": msg.media.__class__.__name__ if msg.media else "text",
+        "is_read": False,
+        "is_deleted": False,
+        "raw_data": safe_telegram_to_dict(msg),
+    }
+
+
+async def upsert_messages(session: AsyncSession, rows: list[dict[str, Any]]) -> int:
+    """Insert or update a batch of message rows in a single statement"""
+    return await bulk_upsert(
+        session,
+        Message,
+        rows,
+        index_elements=("message_id", "chat_id"),
+        update_columns=MESSAGE_UPDATE_COLUMNS,
+    )
+
+
+async def save_incoming_messages(
+    session: AsyncSession,
+    message_rows: list[dict[str, Any]],
+    chat_rows: list[dict[str, Any]] = (),
+    user_rows: list[dict[str, Any]] = (),
+) -> None:
+    """
+    Upsert messages together with their chats and senders, every row must be unique by its key.
+    On PostgreSQL the chat and sender upserts ride along as CTEs of the message upsert, one round-trip in total.
+    """
+    dialect = session.get_bind().dialect.name
+    related = [(model, rows) for model, rows in ((Chat, chat_rows), (User, user_rows)) if rows]
+    if not message_rows:
+        for model, rows in related:
+            await bulk_upsert(session, model, rows, index_elements=("id",))
+        return
+
+    message_stmt = upsert_statement(dialect, Message, message_rows, ("message_id", "chat_id"), MESSAGE_UPDATE_COLUMNS)
+    if dialect == "postgresql":
+        # Foreign keys are checked at the end of the statement, so chat rows inserted by the CTE are visible
+        for model, rows in related:
+            message_stmt = message_stmt.add_cte(upsert_statement(dialect, model, rows, ("id",)).cte(f"upsert_{model.__tablename__}"))
+    else:
+        for model, rows in related:
+            await session.execute(upsert_statement(dialect, model, rows, ("id",)))
+    await session.execute(message_stmt)
+
+
+async def update_messages_raw_data(session: AsyncSession, raw_data: dict[tuple[int, int], dict]) -> None:
+    """Replace raw_data of edited messages in one executemany, messages that were never saved are ignored"""
+    if not raw_data:
+        return
+    table = Message.__table__
+    await session.execute(
+        table.update()
+        .where(table.c.chat_id == bindparam("b_chat_id"), table.c.message_id == bindparam("b_message_id"))
+        .values(raw_data=bindparam("b_raw_data")),
+        [{"b_chat_id": chat_id, "b_message_id": message_id, "b_raw_data": data} for (chat_id, message_id), data in raw_data.items()],
+    )
+
+
+async def mark_messages_deleted(session: AsyncSession, deleted: dict[int | None, set[int]]) -> None:
+    """Flag messages as deleted, one statement per chat"""
+    table = Message.__table__
+    for chat_id, message_ids in deleted.items():
+        await session.execute(table.update().where(table.c.chat_id == chat_id, table.c.message_id.in_(message_ids)).values(is_deleted=True))
+
+
+async def mark_messages_read(session: AsyncSession, chat_id: int, after: int | None, up_to: int, limit: int) -> int:
+    """
+    Flag at most limit messages of a chat after the given message_id and up to up_to as read.
+    The range is walked on the (chat_id, message_id) index, so that only these messages are scanned instead of the chat history.
+    Returns the message_id the next chunk continues after, up_to once the whole range is flagged.
+    """
+    table = Message.__table__
+    in_range = [table.c.chat_id == chat_id, table.c.message_id <= up_to]
+    if after is not None:
+        in_range.append(table.c.message_id > after)
+    boundary = await session.scalar(select(table.c.message_id).where(*in_range).order_by(table.c.message_id).offset(limit - 1).limit(1))
+    if boundary is None:
+        boundary = up_to
+    await session.execute(table.update().where(*in_range, table.c.message_id <= boundary, table.c.is_read.is_not(True)).values(is_read=True))
+    return boundary
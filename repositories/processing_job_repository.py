@@ -0,0 +1,133 @@
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import and_, delete, or_, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config import config
+from models.processing_job import ProcessingJob, ProcessingJobKind, ProcessingJobStatus
+from repositories.bulk import bulk_upsert
+
+
+def _job_keys(kind: ProcessingJobKind, keys: list[tuple[int, int]]):
+    return and_(ProcessingJob.kind == kind, tuple_(ProcessingJob.chat_id, ProcessingJob.message_id).in_(keys))
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff after the given number of failed attempts"""
+    seconds = config.processing_job_backoff_seconds * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, config.processing_job_max_backoff_seconds))
+
+
+async def add_processing_job(session: AsyncSession, chat_id: int, message_id: int, kind: ProcessingJobKind = ProcessingJobKind.ENRICH_MESSAGE) -> None:
+    """Queue work for a single message, a dead job is revived with a fresh attempt budget"""
+    await bulk_upsert(
+        session,
+        ProcessingJob,
+        [
+            {
+                "kind": kind,
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "status": ProcessingJobStatus.PENDING,
+                "attempts": 0,
+                "next_attempt_at": datetime.now(UTC),
+                "last_error": None,
+            }
+        ],
+        index_elements=("kind", "chat_id", "message_id"),
+        update_columns=("status", "attempts", "next_attempt_at", "last_error"),
+    )
+
+
+async def add_processing_jobs(session: AsyncSession, keys: list[tuple[int, int]], kind: ProcessingJobKind = ProcessingJobKind.ENRICH_MESSAGE) -> int:
+    """Queue work for many messages, messages that already have a job are left alone"""
+    now = datetime.now(UTC)
+    rows = [
+        {"kind": kind, "chat_id": chat_id, "message_id": message_id, "status": ProcessingJobStatus.PENDING, "attempts": 0, "next_attempt_at": now}
+        for chat_id, message_id in keys
+    ]
+    return await bulk_upsert(session, ProcessingJob, rows, index_elements=("kind", "chat_id", "message_id"), update_columns=())
+
+
+async def claim_processing_jobs(session: AsyncSession, limit: int, kind: ProcessingJobKind = ProcessingJobKind.ENRICH_MESSAGE) -> list[tuple[int, int]]:
+    """
+    Lock up to limit due jobs and mark them running for the lease time.
+    Rows locked by another worker are skipped instead of waited for, commit to release the locks.
+    A job whose lease expired on its last attempt is moved to the dead state instead, its worker never
+    reported back, most likely because the message took the process down.
+    """
+    now = datetime.now(UTC)
+    result = await session.execute(
+        select(ProcessingJob.chat_id, ProcessingJob.message_id, ProcessingJob.status, ProcessingJob.attempts)
+        .where(
+            ProcessingJob.kind == kind,
+            or_(
+                and_(ProcessingJob.status == ProcessingJobStatus.PENDING, ProcessingJob.next_attempt_at <= now),
+                and_(ProcessingJob.status == ProcessingJobStatus.RUNNING, ProcessingJob.locked_until < now),
+            ),
+        )
+        # Jobs queued together are claimed as consecutive messages, so the context window slides over them
+        .order_by(ProcessingJob.next_attempt_at, ProcessingJob.chat_id, ProcessingJob.message_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    keys, exhausted = [], []
+    for chat_id, message_id, status, attempts in result.all():
+        if status == ProcessingJobStatus.RUNNING and attempts >= config.processing_job_max_attempts:
+            exhausted.append((chat_id, message_id))
+        else:
+            keys.append((chat_id, message_id))
+    if exhausted:
+        await session.execute(
+            update(ProcessingJob)
+            .where(_job_keys(kind, exhausted))
+            .values(status=ProcessingJobStatus.DEAD, locked_until=None, last_error="Lease expired on the last attempt")
+        )
+    if keys:
+        await session.execute(
+            update(ProcessingJob)
+            .where(_job_keys(kind, keys))
+            .values(
+                status=ProcessingJobStatus.RUNNING,
+                attempts=ProcessingJob.attempts + 1,
+                locked_until=now + timedelta(seconds=config.processing_job_lease_seconds),
+            )
+        )
+    return keys
+
+
+async def renew_processing_jobs(session: AsyncSession, keys: list[tuple[int, int]], kind: ProcessingJobKind = ProcessingJobKind.ENRICH_MESSAGE) -> None:
+    """Extend the lease of jobs that are still running, so that no other worker takes them over"""
+    if keys:
+        await session.execute(
+            update(ProcessingJob)
+            .where(_job_keys(kind, keys), ProcessingJob.status == ProcessingJobStatus.RUNNING)
+            .values(locked_until=datetime.now(UTC) + timedelta(seconds=config.processing_job_lease_seconds))
+        )
+
+
+async def complete_processing_jobs(session: AsyncSession, keys: list[tuple[int, int]], kind: ProcessingJobKind = ProcessingJobKind.ENRICH_MESSAGE) -> None:
+    """Acknowledge finished jobs by removing them"""
+    if keys:
+        await session.execute(delete(ProcessingJob).where(_job_keys(kind, keys)))
+
+
+async def fail_processing_jobs(
+    session: AsyncSession, errors: dict[tuple[int, int], str], kind: ProcessingJobKind = ProcessingJobKind.ENRICH_MESSAGE
+) -> None:
+    """Schedule a retry with backoff, jobs out of attempts are moved to the dead state"""
+    if not errors:
+        return
+    result = await session.execute(
+        select(ProcessingJob.chat_id, ProcessingJob.message_id, ProcessingJob.attempts).where(_job_keys(kind, list(errors)))
+    )
+    now = datetime.now(UTC)
+    for chat_id, message_id, attempts in result.all():
+        values = {"last_error": errors[(chat_id, message_id)], "locked_until": None}
+        if attempts >= config.processing_job_max_attempts:
+            values["status"] = ProcessingJobStatus.DEAD
+        else:
+            values["status"] = ProcessingJobStatus.PENDING
+            values["next_attempt_at"] = now + retry_delay(attempts)
+        await session.execute(update(ProcessingJob).where(_job_keys(kind, [(chat_id, message_id)])).values(**values))
@@ -0,0 +1,67 @@
+import logging
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config import config
+from models.user import User
+from repositories.bulk import bulk_upsert
+from utils.telegram_serializer import entity_hash, safe_telegram_to_dict
+from utils.ttl_cache import TTLCache
+
+logger = logging.getLogger("user_repository")
+
+# Display names used when building enrichment context, jobs that write users must invalidate it
+username_cache = TTLCache(maxsize=config.username_cache_size, ttl=config.username_cache_ttl_seconds)
+
+
+def user_to_row(entity) -> dict[str, Any]:
+    """Convert Telethon user entity to a users table row"""
+    raw_data = safe_telegram_to_dict(entity)
+    return {
+        "id": entity.id,
+        "first_name": getattr(entity, "first_name", None),
+        "last_name": getattr(entity, "last_name", None),
+        "username": getattr(entity, "username", None),
+        "is_bot": getattr(entity, "bot", False),
+        "is_verified": getattr(entity, "verified", False),
+        "is_scam": getattr(entity, "scam", False),
+        "is_fake": getattr(entity, "fake", False),
+        "is_premium": getattr(entity, "premium", False),
+        "raw_data": raw_data,
+        "raw_hash": entity_hash(raw_data),
+    }
+
+
+async def load_user_hashes(session: AsyncSession, user_ids) -> dict[int, str | None]:
+    """Map user ID to the stored raw_hash for users that already exist"""
+    if not user_ids:
+        return {}
+    result = await session.execute(select(User.id, User.raw_hash).where(User.id.in_(user_ids)))
+    return dict(result.all())
+
+
+async def upsert_users(session: AsyncSession, rows: list[dict[str, Any]]) -> int:
+    """Insert or update a batch of user rows in a single statement"""
+    written = await bulk_upsert(session, User, rows, index_elements=("id",))
+    logger.debug(f"Upserted {written} users")
+    return written
+
+
+def display_name(user) -> str:
+    return user.username or f"{user.first_name} {user.last_name}".strip()
+
+
+async def load_usernames(session: AsyncSession, user_ids) -> dict[int, str | None]:
+    """Map user ID to display name, loading only the IDs missing from username_cache"""
+    usernames, missing = username_cache.get_many(user_id for user_id in user_ids if user_id is not None)
+    if missing:
+        result = await session.execute(select(User).where(User.id.in_(missing)))
+        for user in result.scalars():
+            usernames[user.id] = display_name(user)
+        # Unknown senders are cached too, a later user upsert invalidates them
+        for user_id in missing:
+            usernames.setdefault(user_id, None)
+            username_cache.set(user_id, usernames[user_id])
+    return usernames
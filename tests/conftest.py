@@ -3,6 +3,7 @@ import os
 import uuid
 from datetime import datetime
 from typing import AsyncGenerator, Generator
+from unittest.mock import patch
 
 import pytest
 import pytest_asyncio
@@ -51,6 +52,11 @@ async def test_engine(test_database_url: str):
                 is_fake BOOLEAN,
                 member_count INTEGER,
                 raw_data TEXT,
+                raw_hash VARCHAR(64),
+                participants_synced_count INTEGER,
+                participants_synced_at TIMESTAMP,
+                messages_count BIGINT NOT NULL DEFAULT 0,
+                enriched_messages_count BIGINT NOT NULL DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -68,6 +74,7 @@ async def test_engine(test_database_url: str):
                 is_bot BOOLEAN,
                 is_premium BOOLEAN,
                 raw_data TEXT,
+                raw_hash VARCHAR(64),
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
@@ -95,6 +102,7 @@ async def test_engine(test_database_url: str):
                 message_id BIGINT,
                 context TEXT,
                 meaning TEXT,
+                embedding TEXT,
                 embeddings TEXT,
                 PRIMARY KEY (chat_id, message_id)
             )
@@ -107,12 +115,69 @@ async def test_engine(test_database_url: str):
                 recognize_photo BOOLEAN NOT NULL
             )
         """)))
+
+        await conn.run_sync(lambda sync_conn: sync_conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS chat_sync_state (
+                chat_id BIGINT PRIMARY KEY,
+                high_watermark BIGINT,
+                low_watermark BIGINT,
+                top_message BIGINT,
+                enrich_scanned_low BIGINT,
+                enrich_scanned_high BIGINT,
+                backfill_status VARCHAR(20) NOT NULL,
+                last_synced_at TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)))
+
+        await conn.run_sync(lambda sync_conn: sync_conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS processing_jobs (
+                kind VARCHAR(20) NOT NULL,
+                chat_id BIGINT,
+                message_id BIGINT,
+                status VARCHAR(20) NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                locked_until TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (kind, chat_id, message_id)
+            )
+        """)))
+
+        await conn.run_sync(lambda sync_conn: sync_conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                key VARCHAR(64) PRIMARY KEY,
+                model VARCHAR(100) NOT NULL,
+                content TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)))
     
     yield engine
     
     await engine.dispose()
 
 
+@pytest_asyncio.fixture
+async def response_cache_storage(test_engine):
+    """Point the LLM response cache at the test database, empty in memory and storage"""
+    from processing.response_cache import response_cache
+
+    session_maker = async_sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_maker() as session:
+        await session.execute(text("DELETE FROM llm_responses"))
+        await session.commit()
+    response_cache.memory.clear()
+    with patch("processing.response_cache.dependency") as mock_dependency:
+        mock_dependency.async_session.side_effect = lambda *_: session_maker()
+        yield response_cache
+    response_cache.memory.clear()
+
+
 @pytest_asyncio.fixture
 async def test_session(test_engine) -> AsyncGenerator[AsyncSession, None]:
     """Create test database session."""
@@ -151,43 +216,6 @@ def mock_telegram_client():
     return MockTelegramClient()
 
 
-@pytest.fixture
-def mock_openai_client():
-    """Mock OpenAI client for testing."""
-
-    class MockOpenAIClient:
-        def __init__(self):
-            self.responses = []
-
-        async def chat_completions_create(self, **kwargs):
-            class MockMessage:
-                def __init__(self, content):
-                    self.content = content
-
-            class MockChoice:
-                def __init__(self, content):
-                    self.message = MockMessage(content)
-
-            class MockResponse:
-                def __init__(self, content):
-                    self.choices = [MockChoice(content)]
-
-            return MockResponse('{"context": "test context", "meaning": "test meaning"}')
-
-        async def embeddings_create(self, **kwargs):
-            class MockEmbeddingData:
-                def __init__(self):
-                    self.embedding = [0.1] * 4096
-
-            class MockEmbeddingResponse:
-                def __init__(self):
-                    self.data = [MockEmbeddingData()]
-
-            return MockEmbeddingResponse()
-
-    return MockOpenAIClient()
-
-
 @pytest.fixture
 def sample_chat_data():
     """Sample chat data for testing."""
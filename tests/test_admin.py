@@ -185,12 +185,12 @@ class TestEnrichedMessageAdmin:
 
         # Test with embeddings
         mock_obj = Mock()
-        mock_obj.embeddings = [0.1, 0.2, 0.3]
+        mock_obj.embedding = [0.1, 0.2, 0.3]
         result = admin.has_embeddings(mock_obj)
         assert result == "Yes"
 
         # Test without embeddings
-        mock_obj.embeddings = None
+        mock_obj.embedding = None
         result = admin.has_embeddings(mock_obj)
         assert result == "No"
 
@@ -0,0 +1,218 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from external.http_session import SharedHTTPSession
+from external.llm_gateway import AdaptiveConcurrency, LLMGateway, LLMRequestError
+from external.nebius import NebiusAIStudioClient
+
+
+@pytest_asyncio.fixture
+async def completion_server():
+    """Local chat completions endpoint that records the client port of every request"""
+    peers = []
+
+    async def chat_completions(request):
+        peers.append(request.transport.get_extra_info("peername")[1])
+        return web.json_response({"choices": [{"message": {"content": "pong"}}]})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    server = TestServer(app)
+    await server.start_server()
+    yield server, peers
+    await server.close()
+
+
+@pytest_asyncio.fixture
+async def scripted_server():
+    """
+    Local chat completions endpoint answering with the queued statuses first, then with a completion. A queued
+    status can be a (status, Retry-After) pair, plain statuses ask to retry at once.
+    """
+    statuses = []
+    calls = []
+
+    async def chat_completions(request):
+        calls.append(await request.json())
+        await asyncio.sleep(0.05)
+        if statuses:
+            status, retry_after = statuses.pop(0) if isinstance(statuses[0], tuple) else (statuses.pop(0), "0")
+            return web.json_response({"error": "scripted"}, status=status, headers={"Retry-After": retry_after})
+        usage = {"prompt_tokens": 7, "completion_tokens": 3}
+        return web.json_response({"choices": [{"message": {"content": "pong"}}], "usage": usage})
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    server = TestServer(app)
+    await server.start_server()
+    shared = SharedHTTPSession()
+    gateway = LLMGateway(
+        base_url=str(server.make_url("/v1/")),
+        api_key="key",
+        concurrency=AdaptiveConcurrency(initial=8, minimum=1, maximum=32, cooldown=60),
+        max_attempts=3,
+        retry_base=0.01,
+        session=shared.get(),
+    )
+    yield gateway, statuses, calls
+    await shared.close()
+    await server.close()
+
+
+class TestLLMGateway:
+    """Test retries, coalescing and adaptive concurrency of the LLM gateway."""
+
+    @pytest.mark.asyncio
+    async def test_rate_limited_request_is_retried(self, scripted_server):
+        """Test that a 429 is retried, halves the concurrency limit and the success is counted."""
+        gateway, statuses, calls = scripted_server
+        statuses.append(429)
+
+        answer = await gateway.complete("model", [{"role": "user", "content": "ping"}])
+
+        assert answer == "pong"
+        assert len(calls) == 2
+        assert gateway.concurrency.limit < 8
+        metrics = gateway.stats()["models"]["model"]
+        assert metrics["attempts"] == 2
+        assert metrics["retries"] == 1
+        assert metrics["requests"] == 1
+        assert metrics["prompt_tokens"] == 7
+        assert metrics["completion_tokens"] == 3
+
+    @pytest.mark.asyncio
+    async def test_client_error_is_not_retried(self, scripted_server):
+        """Test that a 400 fails at once with its status."""
+        gateway, statuses, calls = scripted_server
+        statuses.append(400)
+
+        with pytest.raises(LLMRequestError) as error:
+            await gateway.complete("model", [{"role": "user", "content": "ping"}])
+
+        assert error.value.status == 400
+        assert len(calls) == 1
+        assert gateway.stats()["models"]["model"]["failures"] == 1
+        assert gateway.concurrency.limit == 8
+        assert gateway.concurrency.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_retries_give_up_after_max_attempts(self, scripted_server):
+        """Test that a provider that keeps failing raises after the last attempt."""
+        gateway, statuses, calls = scripted_server
+        statuses.extend([503] * 3)
+
+        with pytest.raises(LLMRequestError) as error:
+            await gateway.complete("model", [{"role": "user", "content": "ping"}])
+
+        assert error.value.status == 503
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_identical_requests_are_coalesced(self, scripted_server):
+        """Test that identical requests in flight share one call and different ones do not."""
+        gateway, _, calls = scripted_server
+        messages = [{"role": "user", "content": "ping"}]
+
+        answers = await asyncio.gather(
+            *[gateway.complete("model", messages) for _ in range(5)],
+            gateway.complete("model", [{"role": "user", "content": "other"}]),
+        )
+
+        assert answers == ["pong"] * 6
+        assert len(calls) == 2
+        assert gateway.stats()["models"]["model"]["coalesced"] == 4
+
+    @pytest.mark.asyncio
+    async def test_cancelled_first_caller_does_not_cancel_the_others(self, scripted_server):
+        """Test that the caller that started a shared call can give up while the others still get the answer."""
+        gateway, _, calls = scripted_server
+        messages = [{"role": "user", "content": "ping"}]
+        first = asyncio.create_task(gateway.complete("model", messages))
+        await asyncio.sleep(0.01)
+        others = [asyncio.create_task(gateway.complete("model", messages)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+
+        assert await asyncio.gather(*others) == ["pong"] * 2
+        assert first.cancelled()
+        assert len(calls) == 1
+        assert not gateway._in_flight
+
+    @pytest.mark.asyncio
+    async def test_retry_after_is_capped(self, scripted_server):
+        """Test that a Retry-After longer than retry_max waits retry_max."""
+        gateway, statuses, calls = scripted_server
+        gateway.retry_max = 0.01
+        statuses.append((429, "3600"))
+
+        answer = await asyncio.wait_for(gateway.complete("model", [{"role": "user", "content": "ping"}]), 1)
+
+        assert answer == "pong"
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_timeout_covers_all_attempts(self, scripted_server):
+        """Test that the timeout of a call ends its retries instead of restarting with every attempt."""
+        gateway, statuses, calls = scripted_server
+        statuses.extend([(503, "1")] * 2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        with pytest.raises(LLMRequestError, match="timed out"):
+            await gateway.complete("model", [{"role": "user", "content": "ping"}], timeout=0.2)
+
+        assert loop.time() - started < 0.5
+        assert len(calls) == 1
+        assert gateway.stats()["models"]["model"]["failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit_grows_on_success(self):
+        """Test that successes raise the limit additively up to the maximum."""
+        concurrency = AdaptiveConcurrency(initial=2, minimum=1, maximum=3, cooldown=60)
+
+        for _ in range(20):
+            await concurrency.acquire()
+            await concurrency.release(overloaded=False)
+
+        assert concurrency.limit == 3
+        await concurrency.acquire()
+        await concurrency.release(overloaded=False, succeeded=False)
+        assert concurrency.limit == 3
+        await concurrency.acquire()
+        await concurrency.release(overloaded=True)
+        assert concurrency.limit == 1.5
+
+
+class TestNebiusAIStudioClient:
+    """Test the HTTP session use of the Nebius client."""
+
+    @pytest.mark.asyncio
+    async def test_requests_reuse_one_connection(self, completion_server):
+        """Test that consecutive requests share the session and its kept-alive connection."""
+        server, peers = completion_server
+        shared = SharedHTTPSession()
+        client = NebiusAIStudioClient("model", api_key="key", base_url=str(server.make_url("/v1/")), session=shared.get())
+
+        answers = [await client.generate("system", "ping", []) for _ in range(3)]
+        await shared.close()
+
+        assert answers == ["pong"] * 3
+        assert len(peers) == 3
+        assert len(set(peers)) == 1
+
+    @pytest.mark.asyncio
+    async def test_closed_session_is_recreated(self):
+        """Test that the shared session opens again after the app closed it."""
+        shared = SharedHTTPSession()
+        first = shared.get()
+        await shared.close()
+        second = shared.get()
+
+        assert first.closed
+        assert second is not first and not second.closed
+        await shared.close()
@@ -1,14 +1,36 @@
+import asyncio
 import pytest
-from datetime import datetime
+from datetime import UTC, datetime, timedelta
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch, MagicMock
+from sqlalchemy import delete
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.future import select
+from sqlalchemy.orm import undefer
 from telethon import types
 
+from telethon.errors import FloodWaitError
+
+from config import config
+from jobs.enrich_old_messages import enrich_old_messages_job, get_unenriched_messages
+from jobs.fetch_messages import fetch_all_messages_job, fetch_dialog_messages
+from jobs.prune_llm_responses import prune_llm_responses_job
+from jobs.reconcile_chat_counters import reconcile_chat_counters_job
+from jobs.reproject_embeddings import reproject_embeddings_job
 from jobs.sync_dialogs import sync_dialogs_job
+from jobs.sync_participants import sync_chat_participants, sync_participants_job
 from jobs.telethon_hook import new_message_handler, message_edited_handler, message_deleted_handler
+from processing.ingest_buffer import IngestBatch, IngestBuffer, entity_hashes, ingest_buffer
+from processing.read_acks import read_ack_coalescer
+from repositories.processing_job_repository import claim_processing_jobs
 from models.chat import Chat
 from models.user import User
+from models.llm_response import LLMResponse
 from models.message import Message
+from models.messages_enriched import EnrichedMessage
 from models.chat_config import ChatConfig
+from models.chat_sync_state import BackfillStatus, ChatSyncState
+from models.processing_job import ProcessingJob, ProcessingJobStatus
 
 
 class TestSyncDialogsJob:
@@ -71,79 +93,623 @@ class TestSyncDialogsJob:
         assert saved_chat.username == sample_chat_data["username"]
 
 
+class TestSyncDialogsChangeDetection:
+    """Test that sync dialogs job only writes changed entities."""
+
+    @staticmethod
+    def make_client(entity):
+        mock_client = AsyncMock()
+
+        async def mock_iter_dialogs():
+            dialog = MagicMock()
+            dialog.entity = entity
+            yield dialog
+
+        mock_client.iter_dialogs = mock_iter_dialogs
+        return mock_client
+
+    @pytest.mark.asyncio
+    @patch('jobs.sync_dialogs.dependency')
+    async def test_unchanged_chat_is_not_rewritten(self, mock_dependency, test_session, sample_chat_data):
+        """Test that a chat with the same raw data hash is skipped."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        chat_id = sample_chat_data["id"]
+        entity = SimpleNamespace(id=chat_id, title="Original", username=None, participants_count=5, to_dict=lambda: {"id": chat_id, "title": "Original"})
+        mock_dependency.telegram_client = self.make_client(entity)
+
+        await sync_dialogs_job()
+
+        # A manual change survives the next run because the entity itself did not change
+        await test_session.execute(Chat.__table__.update().where(Chat.id == chat_id).values(title="Manual"))
+        await test_session.commit()
+        await sync_dialogs_job()
+
+        result = await test_session.execute(select(Chat.title).where(Chat.id == chat_id))
+        assert result.scalar_one() == "Manual"
+
+        entity.title = "Renamed"
+        entity.to_dict = lambda: {"id": chat_id, "title": "Renamed"}
+        await sync_dialogs_job()
+
+        result = await test_session.execute(select(Chat.title).where(Chat.id == chat_id))
+        assert result.scalar_one() == "Renamed"
+
+    @pytest.mark.asyncio
+    @patch('jobs.sync_dialogs.dependency')
+    async def test_online_status_is_not_a_change(self, mock_dependency, test_session, sample_user_data):
+        """Test that a user whose only change is the online status is skipped."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        user = types.User(id=sample_user_data["id"], first_name="Alice", status=types.UserStatusOnline(expires=datetime.now()))
+        mock_dependency.telegram_client = self.make_client(user)
+
+        await sync_dialogs_job()
+        await test_session.execute(User.__table__.update().where(User.id == user.id).values(first_name="Manual"))
+        await test_session.commit()
+
+        user.status = types.UserStatusOffline(was_online=datetime.now())
+        await sync_dialogs_job()
+
+        result = await test_session.execute(select(User.first_name).where(User.id == user.id))
+        assert result.scalar_one() == "Manual"
+
+
+class TestSyncParticipantsJob:
+    """Test sync participants job functionality."""
+
+    @pytest.mark.asyncio
+    @patch('jobs.sync_participants.dependency')
+    async def test_sync_participants_job_no_client(self, mock_dependency):
+        """Test sync participants job when telegram client is not available."""
+        mock_dependency.telegram_client = None
+
+        # Should not raise any exception
+        await sync_participants_job()
+
+    @pytest.mark.asyncio
+    @patch('jobs.sync_participants.dependency')
+    async def test_only_chats_with_changed_count_are_listed(self, mock_dependency, test_session, sample_chat_data, sample_user_data):
+        """Test that participants are listed only when participants_count changed."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        changed_id = sample_chat_data["id"]
+        unchanged_id = changed_id + 1
+        test_session.add_all(
+            [
+                Chat(id=changed_id, chat_type="Channel", member_count=2, participants_synced_count=1, participants_synced_at=datetime.now(), raw_data={}),
+                Chat(id=unchanged_id, chat_type="Channel", member_count=2, participants_synced_count=2, participants_synced_at=datetime.now(), raw_data={}),
+            ]
+        )
+        await test_session.commit()
+
+        listed = []
+        participant = SimpleNamespace(id=sample_user_data["id"], first_name="Test", last_name=None, username="testuser", to_dict=lambda: {"id": 1})
+
+        async def mock_iter_participants(peer):
+            listed.append(peer.channel_id)
+            yield participant
+
+        mock_client = AsyncMock()
+        mock_client.iter_participants = mock_iter_participants
+        mock_dependency.telegram_client = mock_client
+
+        await sync_participants_job()
+
+        assert changed_id in listed
+        assert unchanged_id not in listed
+
+        result = await test_session.execute(select(User.username).where(User.id == sample_user_data["id"]))
+        assert result.scalar_one() == "testuser"
+
+        result = await test_session.execute(select(Chat.participants_synced_count).where(Chat.id == changed_id))
+        assert result.scalar_one() == 2
+
+
+class TestSyncChatParticipants:
+    """Test chunked participant upserts."""
+
+    @pytest.mark.asyncio
+    @patch('jobs.sync_participants.PARTICIPANTS_BATCH_SIZE', 2)
+    async def test_chunks_committed_before_failure_are_kept(self, test_session, sample_user_data):
+        """Test that a failure partway through keeps the already committed chunks."""
+        first_id = sample_user_data["id"]
+
+        async def mock_iter_participants(peer):
+            for offset in range(3):
+                yield SimpleNamespace(id=first_id + offset, username=f"user{offset}", to_dict=lambda offset=offset: {"id": first_id + offset})
+            raise ConnectionError("Connection lost")
+
+        mock_client = MagicMock()
+        mock_client.iter_participants = mock_iter_participants
+
+        with pytest.raises(ConnectionError):
+            await sync_chat_participants(mock_client, test_session, 1, "Channel")
+        await test_session.rollback()
+
+        result = await test_session.execute(select(User.id).where(User.id.in_([first_id, first_id + 1, first_id + 2])))
+        assert sorted(result.scalars().all()) == [first_id, first_id + 1]
+
+
+class TestFetchMessagesJob:
+    """Test fetch messages job functionality."""
+
+    @pytest.mark.asyncio
+    @patch('jobs.fetch_messages.dependency')
+    async def test_fetch_all_messages_job_no_client(self, mock_dependency):
+        """Test fetch job when telegram client is not available."""
+        mock_dependency.telegram_client = None
+
+        # Should not raise any exception
+        await fetch_all_messages_job()
+
+    @pytest.mark.asyncio
+    @patch('jobs.fetch_messages.load_sync_states', new_callable=AsyncMock, return_value={})
+    @patch('jobs.fetch_messages.fetch_dialog_messages', new_callable=AsyncMock)
+    @patch('jobs.fetch_messages.dependency')
+    async def test_fetch_all_messages_job_fetches_every_dialog(self, mock_dependency, mock_fetch_dialog, mock_load_states):
+        """Test that every dialog is handed to the worker pool."""
+        mock_client = AsyncMock()
+        mock_dependency.telegram_client = mock_client
+
+        dialogs = []
+        for chat_id in (1, 2, 3, 4, 5):
+            dialog = MagicMock()
+            dialog.entity.id = chat_id
+            dialogs.append(dialog)
+
+        async def mock_iter_dialogs():
+            for dialog in dialogs:
+                yield dialog
+
+        mock_client.iter_dialogs = mock_iter_dialogs
+
+        await fetch_all_messages_job()
+
+        fetched = sorted(call.args[1] for call in mock_fetch_dialog.await_args_list)
+        assert fetched == [1, 2, 3, 4, 5]
+
+    @pytest.mark.asyncio
+    @patch('jobs.fetch_messages.load_sync_states', new_callable=AsyncMock, return_value={})
+    @patch('jobs.fetch_messages.flood_wait_gate')
+    @patch('jobs.fetch_messages.fetch_dialog_messages', new_callable=AsyncMock)
+    @patch('jobs.fetch_messages.dependency')
+    async def test_fetch_job_retries_after_flood_wait(self, mock_dependency, mock_fetch_dialog, mock_gate, mock_load_states):
+        """Test that a FloodWait pauses the pool and retries the dialog."""
+        mock_client = AsyncMock()
+        mock_dependency.telegram_client = mock_client
+        mock_gate.wait = AsyncMock()
+        mock_fetch_dialog.side_effect = [FloodWaitError(None, capture=7), None]
+
+        dialog = MagicMock()
+        dialog.entity.id = 42
+
+        async def mock_iter_dialogs():
+            yield dialog
+
+        mock_client.iter_dialogs = mock_iter_dialogs
+
+        await fetch_all_messages_job()
+
+        assert mock_fetch_dialog.await_count == 2
+        mock_gate.pause.assert_called_once_with(7)
+
+    @pytest.mark.asyncio
+    @patch('jobs.fetch_messages.load_sync_states', new_callable=AsyncMock)
+    @patch('jobs.fetch_messages.fetch_dialog_messages', new_callable=AsyncMock)
+    @patch('jobs.fetch_messages.dependency')
+    async def test_fetch_job_skips_unchanged_dialogs(self, mock_dependency, mock_fetch_dialog, mock_load_states):
+        """Test that dialogs with the same top message are not fetched."""
+        mock_client = AsyncMock()
+        mock_dependency.telegram_client = mock_client
+        mock_load_states.return_value = {1: 100, 2: 200}
+
+        dialogs = []
+        for chat_id, top_message in ((1, 100), (2, 201), (3, 300)):
+            dialog = MagicMock()
+            dialog.entity.id = chat_id
+            dialog.message.id = top_message
+            dialogs.append(dialog)
+
+        async def mock_iter_dialogs():
+            for dialog in dialogs:
+                yield dialog
+
+        mock_client.iter_dialogs = mock_iter_dialogs
+
+        await fetch_all_messages_job()
+
+        fetched = sorted(call.args[1:] for call in mock_fetch_dialog.await_args_list)
+        assert fetched == [(2, 201), (3, 300)]
+
+
+class FakeHistoryClient:
+    """Telegram client serving a fixed chat history from iter_messages."""
+
+    def __init__(self, message_ids):
+        self.message_ids = list(message_ids)
+        self.calls = []
+
+    async def iter_messages(self, entity, offset_id=0, min_id=0, reverse=False):
+        self.calls.append({"offset_id": offset_id, "min_id": min_id, "reverse": reverse})
+        ids = sorted(self.message_ids, reverse=not reverse)
+        for message_id in ids:
+            if offset_id and (message_id >= offset_id if not reverse else message_id <= offset_id):
+                continue
+            if message_id <= min_id:
+                continue
+            yield SimpleNamespace(
+                id=message_id,
+                sender_id=None,
+                date=datetime.now(),
+                media=None,
+                to_dict=lambda message_id=message_id: {"id": message_id},
+            )
+
+
+class TestFetchDialogMessages:
+    """Test watermark based fetching of a single dialog."""
+
+    @pytest.mark.asyncio
+    @patch('jobs.fetch_messages.dependency')
+    async def test_backfill_then_incremental_sync(self, mock_dependency, test_session, sample_chat_data):
+        """Test that the first run backfills and the next one only asks for new messages."""
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        chat_id = sample_chat_data["id"]
+        client = FakeHistoryClient(range(1, 6))
+
+        await fetch_dialog_messages(client, chat_id, top_message=5)
+
+        state = await test_session.get(ChatSyncState, chat_id)
+        assert state.high_watermark == 5
+        assert state.low_watermark == 1
+        assert state.top_message == 5
+        assert state.backfill_status == BackfillStatus.COMPLETED
+
+        client.message_ids.extend([6, 7])
+        client.calls.clear()
+        await fetch_dialog_messages(client, chat_id, top_message=7)
+
+        assert client.calls == [{"offset_id": 0, "min_id": 5, "reverse": True}]
+        assert state.high_watermark == 7
+
+        result = await test_session.execute(select(Message.message_id).where(Message.chat_id == chat_id))
+        assert sorted(result.scalars().all()) == [1, 2, 3, 4, 5, 6, 7]
+
+    @pytest.mark.asyncio
+    @patch('jobs.fetch_messages.dependency')
+    async def test_interrupted_backfill_resumes_below_low_watermark(self, mock_dependency, test_session, sample_chat_data):
+        """Test that an unfinished backfill continues from the low watermark."""
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        chat_id = sample_chat_data["id"]
+        test_session.add(ChatSyncState(chat_id=chat_id, high_watermark=10, low_watermark=8, backfill_status=BackfillStatus.IN_PROGRESS))
+        await test_session.commit()
+        client = FakeHistoryClient(range(1, 11))
+
+        await fetch_dialog_messages(client, chat_id, top_message=10)
+
+        assert client.calls == [
+            {"offset_id": 0, "min_id": 10, "reverse": True},
+            {"offset_id": 8, "min_id": 0, "reverse": False},
+        ]
+        state = await test_session.get(ChatSyncState, chat_id)
+        assert state.low_watermark == 1
+        assert state.backfill_status == BackfillStatus.COMPLETED
+
+    @pytest.mark.asyncio
+    @patch('jobs.fetch_messages.dependency')
+    async def test_seeded_chat_backfills_below_high_watermark(self, mock_dependency, test_session, sample_chat_data):
+        """Test that a chat seeded with only a high watermark fetches new messages and then verifies the whole history below."""
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        chat_id = sample_chat_data["id"]
+        test_session.add(ChatSyncState(chat_id=chat_id, high_watermark=5, backfill_status=BackfillStatus.PENDING))
+        await test_session.commit()
+        client = FakeHistoryClient(range(1, 8))
+
+        await fetch_dialog_messages(client, chat_id, top_message=7)
+
+        assert client.calls == [
+            {"offset_id": 0, "min_id": 5, "reverse": True},
+            {"offset_id": 6, "min_id": 0, "reverse": False},
+        ]
+        result = await test_session.execute(select(Message.message_id).where(Message.chat_id == chat_id))
+        assert sorted(result.scalars().all()) == [1, 2, 3, 4, 5, 6, 7]
+        state = await test_session.get(ChatSyncState, chat_id)
+        assert (state.high_watermark, state.low_watermark) == (7, 1)
+
+
+class TestReconcileChatCountersJob:
+    """Test recounting of chat message counters."""
+
+    @pytest.mark.asyncio
+    @patch('jobs.reconcile_chat_counters.dependency')
+    async def test_drifted_counters_are_fixed(self, mock_dependency, test_session, sample_chat_data):
+        """Test that counters are set to the actual number of messages and enriched messages."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        chat_id = sample_chat_data["id"] + 20
+        test_session.add(Chat(id=chat_id, chat_type="Channel", title="Counted", raw_data={}, messages_count=7))
+        await test_session.commit()
+        for message_id in (1, 2):
+            test_session.add(Message(message_id=message_id, chat_id=chat_id, date=datetime.now(), raw_data={}))
+        test_session.add(EnrichedMessage(chat_id=chat_id, message_id=1, context="c", meaning="m"))
+        await test_session.commit()
+
+        await reconcile_chat_counters_job()
+
+        test_session.expire_all()
+        result = await test_session.execute(
+            select(Chat).options(undefer(Chat.messages_count), undefer(Chat.enriched_messages_count)).where(Chat.id == chat_id)
+        )
+        chat = result.scalar_one()
+        assert (chat.messages_count, chat.enriched_messages_count) == (2, 1)
+
+
+class TestPruneLLMResponsesJob:
+    """Test eviction of cached LLM responses."""
+
+    @pytest.mark.asyncio
+    @patch('jobs.prune_llm_responses.dependency')
+    async def test_old_and_least_recently_used_are_removed(self, mock_dependency, test_session):
+        """Test that responses past the age limit go first, then the oldest beyond the count limit."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        await test_session.execute(delete(LLMResponse))
+        now = datetime.now(UTC)
+        for key, days in (("expired", 40), ("old", 3), ("recent", 2), ("new", 1)):
+            test_session.add(LLMResponse(key=key, model="m", content="{}", last_used_at=now - timedelta(days=days)))
+        await test_session.commit()
+
+        with patch('jobs.prune_llm_responses.config') as mock_config:
+            mock_config.llm_cache_max_age_days = 30
+            mock_config.llm_cache_max_entries = 2
+            await prune_llm_responses_job()
+
+        result = await test_session.execute(select(LLMResponse.key).order_by(LLMResponse.key))
+        assert result.scalars().all() == ["new", "recent"]
+
+
+class TestReprojectEmbeddingsJob:
+    """Test re-projection of full embeddings into the stored dimensions."""
+
+    @pytest.mark.asyncio
+    @patch('jobs.reproject_embeddings.dependency')
+    async def test_full_embeddings_are_reprojected_in_batches(self, mock_dependency, test_session, sample_chat_data):
+        """Test that every row gets its leading dimensions and loses the full embeddings."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        chat_id = sample_chat_data["id"] + 21
+        test_session.add(Chat(id=chat_id, chat_type="Channel", raw_data={}))
+        await test_session.commit()
+        for message_id in range(1, 4):
+            test_session.add(
+                EnrichedMessage(chat_id=chat_id, message_id=message_id, context="c", meaning="m", embeddings=[float(message_id)] * 4096)
+            )
+        await test_session.commit()
+
+        with patch('jobs.reproject_embeddings.config') as mock_config:
+            mock_config.embedding_dimensions = config.embedding_dimensions
+            mock_config.embedding_keep_full_vectors = False
+            mock_config.embedding_reproject_batch_size = 2
+            await reproject_embeddings_job()
+
+        test_session.expire_all()
+        result = await test_session.execute(
+            select(EnrichedMessage.message_id, EnrichedMessage.embedding, EnrichedMessage.embeddings)
+            .where(EnrichedMessage.chat_id == chat_id)
+            .order_by(EnrichedMessage.message_id)
+        )
+        rows = result.all()
+        assert [row.embedding.to_list() for row in rows] == [[float(message_id)] * config.embedding_dimensions for message_id in range(1, 4)]
+        assert all(row.embeddings is None for row in rows)
+
+
+class TestEnrichOldMessagesJob:
+    """Test discovery of messages that still need enrichment."""
+
+    @staticmethod
+    async def create_chat_with_messages(session, chat_id, message_ids, enriched_ids):
+        session.add(Chat(id=chat_id, chat_type="Channel", raw_data={}))
+        session.add(ChatConfig(chat_id=chat_id, enrich_messages=True, recognize_photo=False))
+        for message_id in message_ids:
+            session.add(
+                Message(message_id=message_id, chat_id=chat_id, date=datetime.now(), message_type="text", raw_data={"id": message_id})
+            )
+        for message_id in enriched_ids:
+            session.add(EnrichedMessage(chat_id=chat_id, message_id=message_id, context="c", meaning="m"))
+        await session.commit()
+
+    @pytest.mark.asyncio
+    async def test_get_unenriched_messages(self, test_session, sample_chat_data):
+        """Test that enriched messages are excluded and the rest come in key order."""
+        chat_id = sample_chat_data["id"]
+        await self.create_chat_with_messages(test_session, chat_id, range(1, 8), enriched_ids=[2, 4])
+
+        first_page = [item for item in await get_unenriched_messages(test_session, limit=1000) if item[0] == chat_id]
+        assert first_page == [(chat_id, 1), (chat_id, 3), (chat_id, 5), (chat_id, 6), (chat_id, 7)]
+
+    @pytest.mark.asyncio
+    async def test_discovery_resumes_where_it_stopped(self, test_session, sample_chat_data):
+        """Test that later runs only look at messages above or below the range scanned before."""
+        chat_id = sample_chat_data["id"]
+        await self.create_chat_with_messages(test_session, chat_id, range(10, 15), enriched_ids=[])
+
+        async def discover(limit):
+            found = await get_unenriched_messages(test_session, limit=limit)
+            await test_session.commit()
+            return [message_id for found_chat_id, message_id in found if found_chat_id == chat_id]
+
+        async def scanned_range():
+            test_session.expire_all()
+            state = await test_session.get(ChatSyncState, chat_id)
+            return state.enrich_scanned_low, state.enrich_scanned_high
+
+        # Chats of other tests would take part of the limit
+        await test_session.execute(delete(ChatConfig).where(ChatConfig.chat_id != chat_id))
+        await test_session.commit()
+        assert await discover(limit=3) == [10, 11, 12]
+        assert await scanned_range() == (10, 12)
+        # Returned messages are inside the scanned range now, the next run continues after them
+        assert await discover(limit=3) == [13, 14]
+        assert await scanned_range() == (10, 14)
+        assert await discover(limit=3) == []
+
+        for message_id in (5, 6, 20):
+            test_session.add(Message(message_id=message_id, chat_id=chat_id, date=datetime.now(), message_type="text", raw_data={"id": message_id}))
+        await test_session.commit()
+        assert await discover(limit=10) == [20, 6, 5]
+        assert await scanned_range() == (5, 20)
+        assert await discover(limit=10) == []
+
+    @pytest.mark.asyncio
+    @patch('jobs.enrich_old_messages.executor')
+    @patch('jobs.enrich_old_messages.dependency')
+    async def test_failing_messages_are_retried_then_dead(self, mock_dependency, mock_executor, test_session, sample_chat_data):
+        """Test that failed jobs back off, give up after the attempt limit and are not rediscovered."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        chat_id = sample_chat_data["id"]
+        await self.create_chat_with_messages(test_session, chat_id, [1, 2], enriched_ids=[])
+
+        async def fake_run(keys):
+            mock_executor.errors = {key: "AI API error" for key in keys if key != (chat_id, 1)}
+            enriched = [key for key in keys if key == (chat_id, 1)]
+            for key in enriched:
+                test_session.add(EnrichedMessage(chat_id=key[0], message_id=key[1], context="c", meaning="m"))
+            await test_session.commit()
+            return enriched
+
+        mock_executor.run = AsyncMock(side_effect=fake_run)
+
+        async def job_state():
+            test_session.expire_all()
+            result = await test_session.execute(
+                select(ProcessingJob.message_id, ProcessingJob.status, ProcessingJob.attempts).where(ProcessingJob.chat_id == chat_id)
+            )
+            return {message_id: (status, attempts) for message_id, status, attempts in result.all()}
+
+        def claimed_in_last_run():
+            claimed = [[key for key in call.args[0] if key[0] == chat_id] for call in mock_executor.run.await_args_list]
+            mock_executor.run.reset_mock()
+            return [slice_ for slice_ in claimed if slice_]
+
+        with patch.object(config, "processing_job_max_attempts", 2), patch.object(config, "enrich_concurrency", 1):
+            await enrich_old_messages_job(limit=1000)
+            # All due jobs go into one run, whatever the concurrency
+            assert claimed_in_last_run() == [[(chat_id, 1), (chat_id, 2)]]
+            assert await job_state() == {2: (ProcessingJobStatus.PENDING, 1)}
+
+            # Backoff keeps the failed job out of the next run
+            await enrich_old_messages_job(limit=1000)
+            assert claimed_in_last_run() == []
+
+            await test_session.execute(
+                ProcessingJob.__table__.update()
+                .where(ProcessingJob.chat_id == chat_id)
+                .values(next_attempt_at=datetime.now(UTC) - timedelta(minutes=1))
+            )
+            await test_session.commit()
+            await enrich_old_messages_job(limit=1000)
+            assert claimed_in_last_run() == [[(chat_id, 2)]]
+            assert await job_state() == {2: (ProcessingJobStatus.DEAD, 2)}
+
+            await enrich_old_messages_job(limit=1000)
+            assert claimed_in_last_run() == []
+
+    @pytest.mark.asyncio
+    @patch('jobs.enrich_old_messages.executor')
+    @patch('jobs.enrich_old_messages.dependency')
+    async def test_leases_are_renewed_during_a_run(self, mock_dependency, mock_executor, test_session, sample_chat_data):
+        """Test that jobs of a run outlasting the lease stay leased and are not claimed again."""
+        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        chat_id = sample_chat_data["id"]
+        await self.create_chat_with_messages(test_session, chat_id, [1], enriched_ids=[])
+        claimed_again = []
+
+        async def slow_run(keys):
+            await asyncio.sleep(0.14)
+            claimed_again.extend(await claim_processing_jobs(test_session, 10))
+            await test_session.commit()
+            return []
+
+        mock_executor.run = AsyncMock(side_effect=slow_run)
+        mock_executor.errors = {}
+
+        with patch.object(config, "processing_job_lease_seconds", 0.12):
+            await enrich_old_messages_job(limit=1000)
+
+        assert (chat_id, 1) not in claimed_again
+
+
+@pytest.fixture(autouse=True)
+def reset_ingest_buffer():
+    """Do not let events of a failed flush leak into the next test."""
+    yield
+    if ingest_buffer._flush_handle is not None:
+        ingest_buffer._flush_handle.cancel()
+        ingest_buffer._flush_handle = None
+    ingest_buffer._batch = IngestBatch()
+    entity_hashes.clear()
+    if read_ack_coalescer._flush_handle is not None:
+        read_ack_coalescer._flush_handle.cancel()
+        read_ack_coalescer._flush_handle = None
+    read_ack_coalescer._pending = {}
+    read_ack_coalescer._flagged = {}
+
+
+def make_message_event(message_id, chat, sender, text="Test message"):
+    """NewMessage event carrying real telethon chat and sender entities"""
+    message = SimpleNamespace(
+        id=message_id,
+        sender_id=sender.id if sender else None,
+        date=datetime.now(),
+        media=None,
+        to_dict=lambda: {"id": message_id, "message": text},
+        get_chat=AsyncMock(return_value=chat),
+        get_sender=AsyncMock(return_value=sender),
+    )
+    return SimpleNamespace(message=message)
+
+
 class TestTelethonHook:
     """Test telethon hook functionality."""
     
     @pytest.mark.asyncio
-    @patch('jobs.telethon_hook.dependency')
+    @patch('processing.ingest_buffer.dependency')
     async def test_new_message_handler(self, mock_dependency, test_session, sample_chat_data, sample_user_data):
-        """Test new message handler."""
-        # Setup mock dependency
-        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        """Test that a new message is written with its chat and sender by the next flush."""
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
         mock_dependency.telegram_client = AsyncMock()
-        
-        # Create mock event
-        mock_event = MagicMock()
-        mock_message = MagicMock()
-        mock_message.id = 123
-        mock_message.date = datetime.now()
-        mock_message.media = None
-        mock_message.raw_data = {"id": 123, "message": "Test message"}
-        mock_message.to_dict = MagicMock(return_value={"id": 123, "message": "Test message"})
-        mock_message.to_dict.return_value = {"id": 123, "message": "Test message"}
-        mock_event.message = mock_message
-        
-        # Create mock chat
-        mock_chat = MagicMock()
-        mock_chat.id = sample_chat_data["id"]
-        mock_chat.__class__.__name__ = "Channel"
-        mock_chat.title = sample_chat_data["title"]
-        mock_chat.username = sample_chat_data["username"]
-        mock_chat.verified = sample_chat_data["is_verified"]
-        mock_chat.scam = sample_chat_data["is_scam"]
-        mock_chat.fake = sample_chat_data["is_fake"]
-        mock_chat.participants_count = sample_chat_data["member_count"]
-        
-        # Create mock user
-        mock_user = MagicMock()
-        mock_user.id = sample_user_data["id"]
-        mock_user.first_name = sample_user_data["first_name"]
-        mock_user.last_name = sample_user_data["last_name"]
-        mock_user.username = sample_user_data["username"]
-        mock_user.bot = sample_user_data["is_bot"]
-        mock_user.verified = sample_user_data["is_verified"]
-        mock_user.scam = sample_user_data["is_scam"]
-        mock_user.fake = sample_user_data["is_fake"]
-        mock_user.premium = sample_user_data["is_premium"]
-        
-        # Setup async methods
-        mock_message.get_chat = AsyncMock(return_value=mock_chat)
-        mock_message.get_sender = AsyncMock(return_value=mock_user)
-        
-        # Run handler
-        await new_message_handler(mock_event)
-        
-        # Verify message was saved
-        from sqlalchemy.future import select
-        result = await test_session.execute(
-            select(Message).where(
-                Message.message_id == 123,
-                Message.chat_id == sample_chat_data["id"]
-            )
+        chat = types.Channel(
+            id=sample_chat_data["id"],
+            title=sample_chat_data["title"],
+            photo=types.ChatPhotoEmpty(),
+            date=datetime.now(),
+            username=sample_chat_data["username"],
+            participants_count=sample_chat_data["member_count"],
         )
-        saved_message = result.scalar_one_or_none()
-        
+        user = types.User(
+            id=sample_user_data["id"],
+            first_name=sample_user_data["first_name"],
+            last_name=sample_user_data["last_name"],
+            username=sample_user_data["username"],
+        )
+
+        await new_message_handler(make_message_event(123, chat, user))
+        await ingest_buffer.flush()
+
+        test_session.expire_all()
+        saved_message = await test_session.get(Message, (123, chat.id))
         assert saved_message is not None
-        assert saved_message.message_id == 123
-        assert saved_message.chat_id == sample_chat_data["id"]
-        assert saved_message.sender_id == sample_user_data["id"]
-    
+        assert saved_message.sender_id == user.id
+        assert saved_message.raw_data["message"] == "Test message"
+        saved_chat = await test_session.get(Chat, chat.id)
+        assert saved_chat.title == sample_chat_data["title"]
+        saved_user = await test_session.get(User, user.id)
+        assert saved_user.first_name == sample_user_data["first_name"]
+        assert len(ingest_buffer) == 0
+
     @pytest.mark.asyncio
-    @patch('jobs.telethon_hook.dependency')
+    @patch('processing.ingest_buffer.dependency')
     async def test_message_edited_handler(self, mock_dependency, test_session, sample_chat_data, sample_user_data):
         """Test message edited handler."""
         # Setup mock dependency
-        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
         
         # Create existing message
         message_data = {
@@ -171,6 +737,8 @@ class TestTelethonHook:
         
         # Run handler
         await message_edited_handler(mock_event)
+        await ingest_buffer.flush()
+        test_session.expire_all()
         
         # Verify message was updated
         from sqlalchemy.future import select
@@ -185,11 +753,11 @@ class TestTelethonHook:
         assert updated_message.raw_data["message"] == "Updated message"
     
     @pytest.mark.asyncio
-    @patch('jobs.telethon_hook.dependency')
+    @patch('processing.ingest_buffer.dependency')
     async def test_message_deleted_handler(self, mock_dependency, test_session, sample_chat_data, sample_user_data):
         """Test message deleted handler."""
         # Setup mock dependency
-        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
         
         # Create existing messages
         message1_data = {
@@ -227,31 +795,189 @@ class TestTelethonHook:
         
         # Run handler
         await message_deleted_handler(mock_event)
+        await ingest_buffer.flush()
+        test_session.expire_all()
         
         # Verify messages were marked as deleted
-        from sqlalchemy.future import select
         result = await test_session.execute(
-            select(Message).where(
+            select(Message.message_id, Message.is_deleted).where(
                 Message.chat_id == sample_chat_data["id"],
                 Message.message_id.in_([123, 124])
+            ).order_by(Message.message_id)
+        )
+        assert result.all() == [(123, True), (124, True)]
+
+
+class TestNewMessageEntityCache:
+    """Test that unchanged chats and senders are not written again."""
+
+    @pytest.mark.asyncio
+    @patch('processing.ingest_buffer.dependency')
+    @patch('processing.ingest_buffer.save_incoming_messages', new_callable=AsyncMock)
+    async def test_unchanged_entities_are_skipped(self, mock_save, mock_dependency, test_session, sample_chat_data, sample_user_data):
+        """Test that only the message is written when chat and sender did not change."""
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        mock_dependency.telegram_client = AsyncMock()
+        chat = types.Channel(id=sample_chat_data["id"], title="Test", photo=types.ChatPhotoEmpty(), date=datetime.now())
+        user = types.User(id=sample_user_data["id"], first_name="Alice")
+
+        def make_event(message_id):
+            message = SimpleNamespace(
+                id=message_id,
+                sender_id=user.id,
+                date=datetime.now(),
+                media=None,
+                to_dict=lambda: {"id": message_id},
+                get_chat=AsyncMock(return_value=chat),
+                get_sender=AsyncMock(return_value=user),
             )
+            return SimpleNamespace(message=message)
+
+        await new_message_handler(make_event(1))
+        await ingest_buffer.flush()
+        await new_message_handler(make_event(2))
+        await ingest_buffer.flush()
+        user.first_name = "Bob"
+        await new_message_handler(make_event(3))
+        await ingest_buffer.flush()
+
+        written = [([row["message_id"] for row in call.args[1]], len(call.args[2]), len(call.args[3])) for call in mock_save.await_args_list]
+        assert written == [([1], 1, 1), ([2], 0, 0), ([3], 0, 1)]
+
+
+class TestIngestBuffer:
+    """Test batching of realtime events."""
+
+    @staticmethod
+    def make_message(message_id, text):
+        return SimpleNamespace(id=message_id, sender_id=None, date=datetime.now(), media=None, to_dict=lambda: {"id": message_id, "message": text})
+
+    @pytest.mark.asyncio
+    @patch('processing.ingest_buffer.read_ack_coalescer')
+    @patch('processing.ingest_buffer.dependency')
+    async def test_events_are_written_in_one_flush(self, mock_dependency, mock_coalescer, test_session, sample_chat_data):
+        """Test that new, edited and deleted messages of a burst end up in the database together."""
+        mock_dependency.async_session = MagicMock()
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        mock_dependency.telegram_client = AsyncMock()
+        chat = types.Channel(id=sample_chat_data["id"], title="Test", photo=types.ChatPhotoEmpty(), date=datetime.now())
+        buffer = IngestBuffer(max_events=100, max_delay=60)
+
+        for message_id in (1, 2, 3):
+            buffer.add_message(self.make_message(message_id, "Original"), chat, None)
+        buffer.add_edit(chat.id, self.make_message(2, "Edited"))
+        buffer.add_deletion(chat.id, [3])
+        assert len(buffer) == 5
+
+        await buffer.close()
+
+        assert mock_dependency.async_session.call_count == 1
+        assert [call.args[1] for call in mock_coalescer.add.call_args_list] == [1, 2, 3]
+        result = await test_session.execute(
+            select(Message.message_id, Message.raw_data, Message.is_deleted).where(Message.chat_id == chat.id).order_by(Message.message_id)
         )
-        deleted_messages = result.scalars().all()
-        
-        for message in deleted_messages:
-            assert message.is_deleted is True
+        assert [(row.message_id, row.raw_data["message"], row.is_deleted) for row in result.all()] == [
+            (1, "Original", False),
+            (2, "Edited", False),
+            (3, "Original", True),
+        ]
+
+    @pytest.mark.asyncio
+    @patch('processing.ingest_buffer.dependency')
+    async def test_batch_size_triggers_flush(self, mock_dependency):
+        """Test that a full buffer is written without waiting for the interval."""
+        buffer = IngestBuffer(max_events=2, max_delay=60)
+        buffer._write = AsyncMock(return_value=[])
+        mock_dependency.telegram_client = AsyncMock()
+
+        buffer.add_deletion(1, [1])
+        buffer.add_deletion(1, [2])
+        await asyncio.sleep(0.01)
+
+        buffer._write.assert_awaited_once()
+        assert buffer._write.await_args.args[0].deletions == {1: {1, 2}}
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_keeps_events(self):
+        """Test that events of a failed write are retried with the ones buffered later."""
+        buffer = IngestBuffer(max_events=100, max_delay=60)
+        buffer._write = AsyncMock(side_effect=[Exception("database is down"), []])
+
+        buffer.add_deletion(1, [1])
+        await buffer.flush()
+        buffer.add_deletion(1, [2])
+        await buffer.flush()
+
+        assert buffer._write.await_count == 2
+        assert buffer._write.await_args.args[0].deletions == {1: {1, 2}}
+        assert len(buffer) == 0
+
+    @pytest.mark.asyncio
+    async def test_bad_event_is_dropped_after_max_attempts(self):
+        """Test that a batch that keeps failing is written one event at a time and only the bad event is dropped."""
+        buffer = IngestBuffer(max_events=100, max_delay=60, max_attempts=2)
+
+        async def write(batch):
+            if 666 in batch.deletions:
+                raise ValueError("bad event")
+            return []
+
+        buffer._write = AsyncMock(side_effect=write)
+        buffer.add_deletion(1, [1])
+        buffer.add_deletion(666, [1])
+        await buffer.flush()
+        assert len(buffer) == 2
+        await buffer.flush()
+
+        assert [call.args[0].deletions for call in buffer._write.await_args_list] == [
+            {1: {1}, 666: {1}},
+            {1: {1}, 666: {1}},
+            {1: {1}},
+            {666: {1}},
+        ]
+        assert len(buffer) == 0
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error", [ConnectionRefusedError(), PoolTimeoutError("QueuePool limit reached"), Exception("database is down")])
+    async def test_other_errors_do_not_count_as_attempts(self, error):
+        """Test that a database outage or a pool stall keeps the batch together instead of dropping its events."""
+        buffer = IngestBuffer(max_events=100, max_delay=60, max_attempts=1)
+        buffer._write = AsyncMock(side_effect=[error, error, []])
+
+        buffer.add_deletion(1, [1])
+        buffer.add_deletion(2, [1])
+        for _ in range(3):
+            await buffer.flush()
+
+        assert [call.args[0].deletions for call in buffer._write.await_args_list] == [{1: {1}, 2: {1}}] * 3
+        assert len(buffer) == 0
+
+    @pytest.mark.asyncio
+    async def test_events_written_one_at_a_time_survive_an_outage(self):
+        """Test that an outage while writing events one at a time puts them back instead of dropping them."""
+        buffer = IngestBuffer(max_events=100, max_delay=60, max_attempts=1)
+        buffer._write = AsyncMock(side_effect=[ValueError("bad event"), PoolTimeoutError("QueuePool limit reached"), []])
+
+        buffer.add_deletion(1, [1])
+        buffer.add_deletion(2, [1])
+        await buffer.flush()
+        assert len(buffer) == 2
+        await buffer.flush()
+
+        assert buffer._write.await_args.args[0].deletions == {1: {1}, 2: {1}}
+        assert len(buffer) == 0
 
 
 class TestChatConfigIntegration:
     """Test chat config integration with message processing."""
     
     @pytest.mark.asyncio
-    @patch('jobs.telethon_hook.dependency')
-    @patch('jobs.telethon_hook.process_message')
-    async def test_message_enrichment_enabled(self, mock_process_message, mock_dependency, test_session, sample_chat_data):
+    @patch('processing.ingest_buffer.dependency')
+    @patch('processing.ingest_buffer.enrichment_queue')
+    async def test_message_enrichment_enabled(self, mock_enrichment_queue, mock_dependency, test_session, sample_chat_data):
         """Test message enrichment when enabled in chat config."""
         # Setup mock dependency
-        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
         mock_dependency.telegram_client = AsyncMock()
         
         # Create chat and config
@@ -267,36 +993,28 @@ class TestChatConfigIntegration:
         test_session.add(chat_config)
         await test_session.commit()
         
-        # Create mock event
-        mock_event = MagicMock()
-        mock_message = MagicMock()
-        mock_message.id = 123
-        mock_message.date = datetime.now()
-        mock_message.media = None
-        mock_event.message = mock_message
-        
-        mock_chat = MagicMock()
-        mock_chat.id = sample_chat_data["id"]
-        mock_message.get_chat = AsyncMock(return_value=mock_chat)
-        mock_message.get_sender = AsyncMock(return_value=None)
+        chat = types.Channel(id=sample_chat_data["id"], title=sample_chat_data["title"], photo=types.ChatPhotoEmpty(), date=datetime.now())
         
         # Run handler
-        await new_message_handler(mock_event)
+        await new_message_handler(make_message_event(123, chat, None))
+        await ingest_buffer.flush()
+        test_session.expire_all()
+        assert await test_session.get(Message, (123, chat.id)) is not None
         
-        # Verify process_message was called
-        mock_process_message.assert_called_once_with(
-            test_session,
-            chat_id=sample_chat_data["id"],
-            message_id=123
+        # Verify the enrichment job was stored and queued instead of run inline
+        mock_enrichment_queue.notify.assert_called_once_with()
+        result = await test_session.execute(
+            select(ProcessingJob).where(ProcessingJob.chat_id == sample_chat_data["id"], ProcessingJob.message_id == 123)
         )
+        assert result.scalar_one().status == ProcessingJobStatus.PENDING
     
     @pytest.mark.asyncio
-    @patch('jobs.telethon_hook.dependency')
-    @patch('jobs.telethon_hook.process_message')
-    async def test_message_enrichment_disabled(self, mock_process_message, mock_dependency, test_session, sample_chat_data):
+    @patch('processing.ingest_buffer.dependency')
+    @patch('processing.ingest_buffer.enrichment_queue')
+    async def test_message_enrichment_disabled(self, mock_enrichment_queue, mock_dependency, test_session, sample_chat_data):
         """Test message enrichment when disabled in chat config."""
         # Setup mock dependency
-        mock_dependency.get_session.return_value.__aiter__.return_value = [test_session]
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
         mock_dependency.telegram_client = AsyncMock()
         
         # Create chat and config with enrichment disabled
@@ -312,21 +1030,15 @@ class TestChatConfigIntegration:
         test_session.add(chat_config)
         await test_session.commit()
         
-        # Create mock event
-        mock_event = MagicMock()
-        mock_message = MagicMock()
-        mock_message.id = 123
-        mock_message.date = datetime.now()
-        mock_message.media = None
-        mock_event.message = mock_message
-        
-        mock_chat = MagicMock()
-        mock_chat.id = sample_chat_data["id"]
-        mock_message.get_chat = AsyncMock(return_value=mock_chat)
-        mock_message.get_sender = AsyncMock(return_value=None)
+        chat = types.Channel(id=sample_chat_data["id"], title=sample_chat_data["title"], photo=types.ChatPhotoEmpty(), date=datetime.now())
         
         # Run handler
-        await new_message_handler(mock_event)
+        await new_message_handler(make_message_event(123, chat, None))
+        await ingest_buffer.flush()
+        test_session.expire_all()
+        assert await test_session.get(Message, (123, chat.id)) is not None
         
-        # Verify process_message was not called
-        mock_process_message.assert_not_called() 
\ No newline at end of file
+        # Verify nothing was queued
+        mock_enrichment_queue.notify.assert_not_called()
+        result = await test_session.execute(select(ProcessingJob).where(ProcessingJob.chat_id == sample_chat_data["id"]))
+        assert result.scalars().all() == [] 
\ No newline at end of file
@@ -1,18 +1,39 @@
+import asyncio
 import json
 import pytest
-from datetime import datetime
-from unittest.mock import AsyncMock, patch
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy import delete, update
+from sqlalchemy.future import select
 
 from processing.enrich_message import (
     EnrichedMessageData,
     format_message,
     collect_message_context,
+    create_embeddings,
+    describe_context,
     process_message
 )
+from processing.context_window import ContextWindow
+from config import config
+from dependency import Workload
+from processing.embedder import BatchingEmbedder, reduce_embedding
+from processing.executor import EnrichmentExecutor
+from processing.queue import EnrichmentQueue
+from processing.read_acks import ReadAckCoalescer
+from processing.response_cache import response_key
+from processing.search import QUERY_INSTRUCTION, semantic_search
 from models.chat import Chat
 from models.message import Message
 from models.user import User
 from models.messages_enriched import EnrichedMessage
+from models.llm_response import LLMResponse
+from models.processing_job import ProcessingJob, ProcessingJobStatus
+from repositories.enriched_message_repository import check_embedding_column
+from repositories.llm_response_repository import load_llm_responses
+from repositories.processing_job_repository import add_processing_job, add_processing_jobs, claim_processing_jobs
 
 
 class TestEnrichedMessageData:
@@ -141,20 +162,12 @@ class TestProcessMessage:
     """Test message processing functionality."""
     
     @pytest.mark.asyncio
-    @patch('processing.enrich_message.ai_client')
-    async def test_process_message_success(self, mock_ai_client, test_session, sample_chat_data, sample_user_data):
+    @patch('processing.enrich_message.llm_gateway')
+    async def test_process_message_success(self, mock_gateway, test_session, sample_chat_data, sample_user_data, response_cache_storage):
         """Test successful message processing."""
-        # Setup mock AI client
-        mock_response = AsyncMock()
-        mock_response.choices = [AsyncMock()]
-        mock_response.choices[0].message.content = '{"context": "test context", "meaning": "test meaning"}'
-        
-        mock_embeddings_response = AsyncMock()
-        mock_embeddings_response.data = [AsyncMock()]
-        mock_embeddings_response.data[0].embedding = [0.1] * 4096
-        
-        mock_ai_client.chat.completions.create = AsyncMock(return_value=mock_response)
-        mock_ai_client.embeddings.create = AsyncMock(return_value=mock_embeddings_response)
+        # Setup mock LLM gateway
+        mock_gateway.complete = AsyncMock(return_value='{"context": "test context", "meaning": "test meaning"}')
+        mock_gateway.embeddings = AsyncMock(return_value=[[0.1] * 4096])
         
         # Create chat and user
         chat = Chat(**sample_chat_data)
@@ -198,14 +211,14 @@ class TestProcessMessage:
         assert enriched_message is not None
         assert enriched_message.context == "test context"
         assert enriched_message.meaning == "test meaning"
-        assert len(enriched_message.embeddings) == 4096
+        assert len(enriched_message.embedding.to_list()) == config.embedding_dimensions
     
     @pytest.mark.asyncio
-    @patch('processing.enrich_message.ai_client')
-    async def test_process_message_ai_error(self, mock_ai_client, test_session, sample_chat_data, sample_user_data):
+    @patch('processing.enrich_message.llm_gateway')
+    async def test_process_message_ai_error(self, mock_gateway, test_session, sample_chat_data, sample_user_data, response_cache_storage):
         """Test message processing with AI client error."""
-        # Setup mock AI client to raise exception
-        mock_ai_client.chat.completions.create.side_effect = Exception("AI API error")
+        # Setup mock LLM gateway to raise exception
+        mock_gateway.complete = AsyncMock(side_effect=Exception("AI API error"))
         
         # Create chat and user
         chat = Chat(**sample_chat_data)
@@ -235,4 +248,481 @@ class TestProcessMessage:
         
         # Process message should raise exception
         with pytest.raises(Exception):
-            await process_message(test_session, chat_id=sample_chat_data["id"], message_id=100) 
\ No newline at end of file
+            await process_message(test_session, chat_id=sample_chat_data["id"], message_id=100)
+
+
+class TestResponseCache:
+    """Test reuse of LLM and embedding responses."""
+
+    def test_response_key_separates_parts(self):
+        """Test that keys depend on the model and on the boundaries between parts."""
+        assert response_key("m", "ab", "c") != response_key("m", "a", "bc")
+        assert response_key("m", "text") != response_key("n", "text")
+        assert response_key("m", "text") == response_key("m", "text")
+
+    @pytest.mark.asyncio
+    @patch('processing.enrich_message.llm_gateway')
+    async def test_repeated_context_is_described_once(self, mock_gateway, response_cache_storage):
+        """Test that the same context is answered from memory and, after a restart, from the table."""
+        mock_gateway.complete = AsyncMock(return_value='{"context": "trip", "meaning": "plans"}')
+
+        first = await describe_context(1, 10, "same context")
+        second = await describe_context(1, 10, "same context")
+        response_cache_storage.memory.clear()
+        third = await describe_context(1, 10, "same context")
+
+        assert first == second == third == EnrichedMessageData(context="trip", meaning="plans")
+        mock_gateway.complete.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_hits_refresh_last_used_at_once_a_day(self, test_session):
+        """Test that only hits on responses not used for a day write last_used_at."""
+        now = datetime.now(UTC)
+        for key, last_used_at in (("fresh", now - timedelta(hours=1)), ("stale", now - timedelta(days=2))):
+            test_session.add(LLMResponse(key=key, model="m", content=key, last_used_at=last_used_at))
+        await test_session.commit()
+
+        with patch('repositories.llm_response_repository.update', wraps=update) as mock_update:
+            assert await load_llm_responses(test_session, ["fresh", "stale", "missing"]) == {"fresh": "fresh", "stale": "stale"}
+            await test_session.commit()
+            assert await load_llm_responses(test_session, ["fresh"]) == {"fresh": "fresh"}
+
+        assert mock_update.call_count == 1
+        test_session.expire_all()
+        result = await test_session.execute(select(LLMResponse.key, LLMResponse.last_used_at).order_by(LLMResponse.key))
+        last_used = dict(result.all())
+        assert last_used["fresh"].replace(tzinfo=None) < (now - timedelta(minutes=30)).replace(tzinfo=None)
+        assert last_used["stale"].replace(tzinfo=None) > (now - timedelta(days=1)).replace(tzinfo=None)
+        await test_session.execute(delete(LLMResponse))
+        await test_session.commit()
+
+    @pytest.mark.asyncio
+    @patch('processing.enrich_message.llm_gateway')
+    async def test_only_new_texts_are_embedded(self, mock_gateway, response_cache_storage, test_session):
+        """Test that a batch only sends the texts without a cached embedding, once each, and embeddings stay out of the table."""
+        async def fake_embeddings(model, texts):
+            return [[float(len(text))] * 4096 for text in texts]
+
+        mock_gateway.embeddings = AsyncMock(side_effect=fake_embeddings)
+
+        await create_embeddings(["a"])
+        vectors = await create_embeddings(["bb", "a", "bb"])
+
+        assert [vector[0] for vector in vectors] == [2.0, 1.0, 2.0]
+        assert mock_gateway.embeddings.await_args.args[1] == ["bb"]
+        result = await test_session.execute(select(LLMResponse.key))
+        assert result.scalars().all() == []
+
+
+class TestEnrichmentExecutor:
+    """Test concurrent enrichment executor."""
+
+    @pytest.mark.asyncio
+    @patch('processing.executor.upsert_enriched_messages', new_callable=AsyncMock)
+    @patch('processing.executor.embedder')
+    @patch('processing.executor.dependency')
+    @patch('processing.executor.ContextWindow')
+    @patch('processing.executor.describe_context')
+    async def test_concurrency_limit(self, mock_describe_context, mock_context_window, mock_dependency, mock_embedder, mock_upsert):
+        """Test that no more than the configured number of messages are in flight."""
+        mock_dependency.async_session = MagicMock()
+        mock_context_window.return_value.context_for = AsyncMock(return_value="context")
+        mock_embedder.batch_size = 100
+        mock_embedder.embed_many = AsyncMock(side_effect=lambda texts: [[0.1]] * len(texts))
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_describe_context(chat_id, message_id, context):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return EnrichedMessageData(context="context", meaning=f"meaning {message_id}")
+
+        mock_describe_context.side_effect = fake_describe_context
+
+        executor = EnrichmentExecutor(concurrency=3)
+        enriched = await executor.run([(1, message_id) for message_id in range(10)])
+
+        assert len(enriched) == 10
+        assert max_in_flight == 3
+        # One session builds the contexts, one saves the results
+        assert mock_dependency.async_session.call_count == 2
+
+    @pytest.mark.asyncio
+    @patch('processing.executor.upsert_enriched_messages', new_callable=AsyncMock)
+    @patch('processing.executor.embedder')
+    @patch('processing.executor.dependency')
+    @patch('processing.executor.ContextWindow')
+    @patch('processing.executor.describe_context')
+    async def test_embeddings_are_batched(self, mock_describe_context, mock_context_window, mock_dependency, mock_embedder, mock_upsert):
+        """Test that embeddings are requested in batches and failures are skipped."""
+        mock_dependency.async_session = MagicMock()
+        mock_context_window.return_value.context_for = AsyncMock(return_value="context")
+        mock_embedder.batch_size = 2
+        mock_embedder.embed_many = AsyncMock(side_effect=lambda texts: [[float(len(text))] for text in texts])
+        mock_describe_context.side_effect = [
+            EnrichedMessageData(context="a", meaning="1"),
+            Exception("AI API error"),
+            EnrichedMessageData(context="b", meaning="2"),
+            EnrichedMessageData(context="c", meaning="3"),
+        ]
+
+        executor = EnrichmentExecutor(concurrency=1)
+        enriched = await executor.run([(1, 3), (1, 1), (1, 4), (1, 2)])
+
+        assert enriched == [(1, 1), (1, 3), (1, 4)]
+        assert executor.errors == {(1, 2): "AI API error"}
+        assert [len(call.args[0]) for call in mock_embedder.embed_many.await_args_list] == [2, 1]
+        rows = mock_upsert.await_args.args[1]
+        assert [(row["message_id"], row["meaning"]) for row in rows] == [(1, "1"), (3, "2"), (4, "3")]
+
+    @pytest.mark.asyncio
+    @patch('processing.executor.upsert_enriched_messages', new_callable=AsyncMock)
+    @patch('processing.executor.embedder')
+    @patch('processing.executor.dependency')
+    @patch('processing.executor.ContextWindow')
+    @patch('processing.executor.describe_context')
+    async def test_window_is_kept_between_runs(self, mock_describe_context, mock_context_window, mock_dependency, mock_embedder, mock_upsert):
+        """Test that a run continuing the chat of the previous run slides the same window."""
+        mock_dependency.async_session = MagicMock()
+        mock_context_window.return_value.chat_id = 1
+        mock_context_window.return_value.context_for = AsyncMock(return_value="context")
+        mock_embedder.batch_size = 100
+        mock_embedder.embed_many = AsyncMock(side_effect=lambda texts: [[0.1]] * len(texts))
+        mock_describe_context.return_value = EnrichedMessageData(context="context", meaning="meaning")
+
+        executor = EnrichmentExecutor(concurrency=2)
+        await executor.run([(1, 1), (1, 2)])
+        await executor.run([(1, 3), (1, 4)])
+
+        mock_context_window.assert_called_once_with(1)
+        assert [call.args[1] for call in mock_context_window.return_value.context_for.await_args_list] == [1, 2, 3, 4]
+
+
+class TestContextWindow:
+    """Test sliding context window."""
+
+    @pytest.mark.asyncio
+    async def test_matches_collect_message_context(self, test_session, sample_chat_data, sample_user_data):
+        """Test that the window produces the same context while reusing loaded history."""
+        chat = Chat(**sample_chat_data)
+        user = User(**sample_user_data)
+        test_session.add(chat)
+        test_session.add(user)
+        for message_id in range(1, 61):
+            test_session.add(
+                Message(
+                    message_id=message_id,
+                    chat_id=sample_chat_data["id"],
+                    sender_id=sample_user_data["id"],
+                    date=datetime.now(),
+                    message_type="text",
+                    is_read=False,
+                    is_deleted=False,
+                    raw_data={"id": message_id, "message": f"Message {message_id}", "reply_to": {"reply_to_msg_id": max(1, message_id - 1)}},
+                )
+            )
+        await test_session.commit()
+
+        window = ContextWindow(sample_chat_data["id"])
+        for message_id in (5, 6, 7, 55, 56, 60):
+            expected = await collect_message_context(test_session, chat_id=sample_chat_data["id"], message_id=message_id)
+            assert await window.context_for(test_session, message_id) == expected
+
+        # Going backwards reloads the window
+        expected = await collect_message_context(test_session, chat_id=sample_chat_data["id"], message_id=10)
+        assert await window.context_for(test_session, 10) == expected
+
+    @pytest.mark.asyncio
+    async def test_message_not_found(self, test_session, sample_chat_data):
+        """Test missing message."""
+        window = ContextWindow(sample_chat_data["id"])
+
+        assert await window.context_for(test_session, 999) == "Message not found"
+
+
+class TestBatchingEmbedder:
+    """Test micro-batching of embeddings requests."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_request(self):
+        """Test that concurrent embed calls are sent together."""
+        embed_batch = AsyncMock(side_effect=lambda texts: [[float(i)] for i, _ in enumerate(texts)])
+        embedder = BatchingEmbedder(embed_batch, batch_size=3, max_delay=0.01)
+
+        vectors = await asyncio.gather(*(embedder.embed(f"text {i}") for i in range(5)))
+
+        assert vectors == [[0.0], [1.0], [2.0], [0.0], [1.0]]
+        assert [len(call.args[0]) for call in embed_batch.await_args_list] == [3, 2]
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        """Test that a failed request fails all of its callers."""
+        embed_batch = AsyncMock(side_effect=Exception("API error"))
+        embedder = BatchingEmbedder(embed_batch, batch_size=10, max_delay=0.01)
+
+        results = await asyncio.gather(embedder.embed("a"), embedder.embed("b"), return_exceptions=True)
+
+        assert all(isinstance(result, Exception) for result in results)
+        assert embed_batch.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_embed_many_checks_vector_count(self):
+        """Test that a short provider response is rejected."""
+        embedder = BatchingEmbedder(AsyncMock(return_value=[[0.1]]), batch_size=10)
+
+        with pytest.raises(ValueError):
+            await embedder.embed_many(["a", "b"])
+
+    def test_reduce_embedding_keeps_leading_dimensions(self):
+        """Test that embeddings are truncated to plain floats without renormalization."""
+        assert reduce_embedding([0.5, 0.25, 2.0, 1.0], 2) == [0.5, 0.25]
+
+
+class TestEnrichmentQueue:
+    """Test durable enrichment queue."""
+
+    @staticmethod
+    async def add_jobs(session, chat_id, message_ids):
+        # The queue drains every due job, start from an empty table
+        await session.execute(ProcessingJob.__table__.delete())
+        session.add(Chat(id=chat_id, chat_type="Channel", title="Test"))
+        await session.commit()
+        for message_id in message_ids:
+            await add_processing_job(session, chat_id, message_id)
+        await session.commit()
+
+    @staticmethod
+    async def job_states(session, chat_id):
+        session.expire_all()
+        result = await session.execute(
+            select(ProcessingJob.message_id, ProcessingJob.status, ProcessingJob.attempts, ProcessingJob.last_error).where(
+                ProcessingJob.chat_id == chat_id
+            )
+        )
+        return {message_id: (status, attempts, last_error) for message_id, status, attempts, last_error in result.all()}
+
+    @pytest.mark.asyncio
+    @patch('processing.queue.dependency')
+    @patch('processing.queue.embedder')
+    @patch('processing.queue.describe_context', new_callable=AsyncMock)
+    async def test_jobs_are_claimed_acked_and_retried(self, mock_describe_context, mock_embedder, mock_dependency, test_session, sample_chat_data):
+        """Test that finished jobs are removed, failed ones scheduled for a retry and no session is held during LLM calls."""
+        open_sessions = 0
+        sessions_during_llm_calls = []
+
+        @asynccontextmanager
+        async def session_scope(*args):
+            nonlocal open_sessions
+            open_sessions += 1
+            try:
+                yield test_session
+            finally:
+                open_sessions -= 1
+
+        mock_dependency.async_session.side_effect = session_scope
+        chat_id = sample_chat_data["id"]
+        await self.add_jobs(test_session, chat_id, [1, 2])
+
+        async def fake_describe_context(chat_id, message_id, context):
+            sessions_during_llm_calls.append(open_sessions)
+            if message_id == 2:
+                raise Exception("AI API error")
+            return EnrichedMessageData(context="test context", meaning="test meaning")
+
+        mock_describe_context.side_effect = fake_describe_context
+        mock_embedder.embed = AsyncMock(return_value=[0.1] * 4096)
+
+        queue = EnrichmentQueue()
+        idle = asyncio.Event()
+
+        async def fake_wait():
+            idle.set()
+            await asyncio.sleep(3600)
+
+        queue._wait = fake_wait
+        await queue.start(workers=1)
+        await asyncio.wait_for(idle.wait(), timeout=1)
+        await queue.stop()
+
+        assert [call.args[1] for call in mock_describe_context.await_args_list] == [1, 2]
+        assert sessions_during_llm_calls == [0, 0]
+        assert await self.job_states(test_session, chat_id) == {2: (ProcessingJobStatus.PENDING, 1, "AI API error")}
+
+    @pytest.mark.asyncio
+    async def test_expired_lease_on_last_attempt_is_dead(self, test_session, sample_chat_data):
+        """Test that a job whose worker died on every attempt is not claimed forever."""
+        chat_id = sample_chat_data["id"]
+        await self.add_jobs(test_session, chat_id, [1, 2])
+        expired = datetime.now(UTC) - timedelta(minutes=1)
+        for message_id, attempts in ((1, config.processing_job_max_attempts), (2, 1)):
+            await test_session.execute(
+                ProcessingJob.__table__.update()
+                .where(ProcessingJob.chat_id == chat_id, ProcessingJob.message_id == message_id)
+                .values(status=ProcessingJobStatus.RUNNING, attempts=attempts, locked_until=expired)
+            )
+        await test_session.commit()
+
+        claimed = await claim_processing_jobs(test_session, limit=10)
+        await test_session.commit()
+
+        assert claimed == [(chat_id, 2)]
+        assert await self.job_states(test_session, chat_id) == {
+            1: (ProcessingJobStatus.DEAD, config.processing_job_max_attempts, "Lease expired on the last attempt"),
+            2: (ProcessingJobStatus.RUNNING, 2, None),
+        }
+
+    @pytest.mark.asyncio
+    async def test_batch_is_claimed_in_message_order(self, test_session, sample_chat_data):
+        """Test that jobs queued together are claimed as consecutive messages of a chat."""
+        chat_id = sample_chat_data["id"]
+        await self.add_jobs(test_session, chat_id, [])
+        await add_processing_jobs(test_session, [(chat_id, message_id) for message_id in (5, 2, 6, 1, 4, 3)])
+        await test_session.commit()
+
+        claimed = await claim_processing_jobs(test_session, limit=3)
+        await test_session.commit()
+
+        assert claimed == [(chat_id, 1), (chat_id, 2), (chat_id, 3)]
+
+    @pytest.mark.asyncio
+    async def test_dead_job_is_revived(self, test_session, sample_chat_data):
+        """Test that adding a dead job again resets its attempts."""
+        chat_id = sample_chat_data["id"]
+        await self.add_jobs(test_session, chat_id, [1])
+        await test_session.execute(
+            ProcessingJob.__table__.update().where(ProcessingJob.chat_id == chat_id).values(status=ProcessingJobStatus.DEAD, attempts=5)
+        )
+        await test_session.commit()
+
+        await add_processing_job(test_session, chat_id, 1)
+        await test_session.commit()
+
+        assert await self.job_states(test_session, chat_id) == {1: (ProcessingJobStatus.PENDING, 0, None)}
+
+
+class TestReadAckCoalescer:
+    """Test batching of read acknowledgements."""
+
+    @pytest.mark.asyncio
+    @patch('processing.read_acks.dependency')
+    async def test_one_acknowledgement_per_chat(self, mock_dependency, test_session, sample_chat_data):
+        """Test that a chat is acknowledged once up to its newest message and flagged as read in the database."""
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        mock_dependency.telegram_client = AsyncMock()
+        chat_id = sample_chat_data["id"]
+        test_session.add(Chat(id=chat_id, chat_type="Channel", title="Test"))
+        for message_id in (1, 2, 3, 4):
+            test_session.add(Message(message_id=message_id, chat_id=chat_id, date=datetime.now(), raw_data={}, is_read=False))
+        await test_session.commit()
+        chat = MagicMock(id=chat_id)
+        coalescer = ReadAckCoalescer(interval=60)
+
+        for message_id in (1, 3, 2):
+            coalescer.add(chat, message_id)
+        assert len(coalescer) == 1
+        await coalescer.close()
+
+        mock_dependency.telegram_client.send_read_acknowledge.assert_awaited_once_with(chat, max_id=3)
+        test_session.expire_all()
+        result = await test_session.execute(select(Message.message_id, Message.is_read).where(Message.chat_id == chat_id).order_by(Message.message_id))
+        assert result.all() == [(1, True), (2, True), (3, True), (4, False)]
+        assert {call.args[0] for call in mock_dependency.async_session.call_args_list} == {Workload.JOBS}
+
+    @pytest.mark.asyncio
+    @patch('processing.read_acks.READ_FLAG_BATCH_SIZE', 2)
+    @patch('processing.read_acks.dependency')
+    async def test_only_new_messages_are_flagged_in_chunks(self, mock_dependency, test_session, sample_chat_data):
+        """Test that the history is flagged in chunks and later flushes start after the last acknowledged message."""
+        mock_dependency.async_session.return_value.__aenter__.return_value = test_session
+        mock_dependency.telegram_client = AsyncMock()
+        chat_id = sample_chat_data["id"]
+        test_session.add(Chat(id=chat_id, chat_type="Channel", title="Test"))
+        for message_id in range(1, 8):
+            test_session.add(Message(message_id=message_id, chat_id=chat_id, date=datetime.now(), raw_data={}, is_read=False))
+        await test_session.commit()
+        chat = MagicMock(id=chat_id)
+        coalescer = ReadAckCoalescer(interval=60)
+
+        coalescer.add(chat, 5)
+        await coalescer.flush()
+        assert mock_dependency.async_session.call_count == 3
+        # Flagged before, so the next flush leaves it alone
+        await test_session.execute(Message.__table__.update().where(Message.chat_id == chat_id, Message.message_id == 1).values(is_read=False))
+        await test_session.commit()
+        coalescer.add(chat, 7)
+        await coalescer.close()
+
+        test_session.expire_all()
+        result = await test_session.execute(select(Message.message_id).where(Message.chat_id == chat_id, Message.is_read.is_(True)))
+        assert sorted(result.scalars().all()) == [2, 3, 4, 5, 6, 7]
+
+    @pytest.mark.asyncio
+    @patch('processing.read_acks.dependency')
+    async def test_failed_chat_is_retried(self, mock_dependency):
+        """Test that a failed acknowledgement is kept and merged with newer messages of the chat."""
+        mock_dependency.telegram_client = AsyncMock()
+        mock_dependency.telegram_client.send_read_acknowledge.side_effect = [Exception("FloodWait"), None]
+        chat = MagicMock(id=1)
+        coalescer = ReadAckCoalescer(interval=60)
+
+        coalescer.add(chat, 5)
+        await coalescer.flush()
+        assert len(coalescer) == 1
+        coalescer.add(chat, 7)
+        await coalescer.close()
+
+        assert mock_dependency.telegram_client.send_read_acknowledge.await_args.kwargs == {"max_id": 7}
+        assert len(coalescer) == 0
+
+
+class TestSemanticSearch:
+    """Test semantic search over enriched messages."""
+
+    @pytest.mark.asyncio
+    @patch('processing.search.dependency')
+    @patch('processing.search.search_enriched_messages', new_callable=AsyncMock)
+    @patch('processing.search.create_embeddings', new_callable=AsyncMock)
+    async def test_query_is_embedded_and_reduced(self, mock_create_embeddings, mock_search, mock_dependency):
+        """Test that the query is embedded without the batching delay, reduced to the stored dimensions and searched on the read-only pool."""
+        mock_create_embeddings.return_value = [[0.1, 0.2, 0.3]]
+        row = MagicMock()
+        row._asdict.return_value = {"chat_id": 1, "message_id": 2, "distance": 0.3}
+        mock_search.return_value = [row]
+
+        with patch('processing.search.config') as mock_config:
+            mock_config.embedding_dimensions = 2
+            mock_config.search_ef_search = 200
+            results = await semantic_search("planned trips", limit=5, chat_id=1)
+
+        assert results == [{"chat_id": 1, "message_id": 2, "distance": 0.3}]
+        mock_create_embeddings.assert_awaited_once_with([QUERY_INSTRUCTION + "planned trips"])
+        mock_dependency.async_session.assert_called_once_with("readonly")
+        assert mock_search.await_args.args[1] == [0.1, 0.2]
+        assert mock_search.await_args.kwargs["limit"] == 5
+        assert mock_search.await_args.kwargs["chat_id"] == 1
+
+
+class TestEmbeddingColumnCheck:
+    """Test the startup check of the stored embedding type."""
+
+    @staticmethod
+    def session_with_column(column_type):
+        session = MagicMock()
+        session.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=MagicMock(return_value=column_type)))
+        return session
+
+    @pytest.mark.asyncio
+    async def test_matching_column_passes(self):
+        """Test that the column created by the migrations is accepted with the default config."""
+        with patch.object(config, "embedding_half_precision", True), patch.object(config, "embedding_dimensions", 1024):
+            await check_embedding_column(self.session_with_column("halfvec(1024)"))
+
+    @pytest.mark.asyncio
+    async def test_mismatch_fails_with_both_types(self):
+        """Test that a config that disagrees with the column stops the app with a clear message."""
+        with patch.object(config, "embedding_half_precision", True), patch.object(config, "embedding_dimensions", 1024):
+            with pytest.raises(RuntimeError, match=r"is vector\(1024\) but .* describe halfvec\(1024\)"):
+                await check_embedding_column(self.session_with_column("vector(1024)"))
@@ -0,0 +1,137 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.future import select
+
+from models.chat import Chat
+from models.message import Message
+from models.user import User
+from repositories.message_repository import message_to_row, save_incoming_messages, upsert_messages
+from repositories.user_repository import load_usernames, username_cache
+
+
+def make_telethon_message(message_id, text, sender_id=42):
+    """Build a minimal Telethon-like message."""
+    return SimpleNamespace(
+        id=message_id,
+        sender_id=sender_id,
+        date=datetime.now(),
+        media=None,
+        to_dict=lambda: {"id": message_id, "message": text},
+    )
+
+
+class TestMessageRepository:
+    """Test bulk message upserts."""
+
+    def test_message_to_row(self):
+        """Test converting a Telethon message to a row."""
+        row = message_to_row(make_telethon_message(1, "Hello"), chat_id=10)
+
+        assert row["message_id"] == 1
+        assert row["chat_id"] == 10
+        assert row["sender_id"] == 42
+        assert row["message_type"] == "text"
+        assert row["raw_data"] == {"id": 1, "message": "Hello"}
+
+    @pytest.mark.asyncio
+    async def test_upsert_messages_inserts_and_updates(self, test_session, sample_chat_data):
+        """Test that a second upsert updates rows without touching read flags."""
+        chat_id = sample_chat_data["id"]
+        rows = [message_to_row(make_telethon_message(i, f"Message {i}"), chat_id) for i in (1, 2, 3)]
+        assert await upsert_messages(test_session, rows) == 3
+        await test_session.commit()
+
+        await test_session.execute(Message.__table__.update().where(Message.chat_id == chat_id).values(is_read=True))
+        await test_session.commit()
+
+        rows = [message_to_row(make_telethon_message(i, f"Edited {i}"), chat_id) for i in (2, 3, 4)]
+        await upsert_messages(test_session, rows)
+        await test_session.commit()
+
+        result = await test_session.execute(
+            select(Message.message_id, Message.raw_data, Message.is_read).where(Message.chat_id == chat_id).order_by(Message.message_id)
+        )
+        saved = result.all()
+
+        assert [row.message_id for row in saved] == [1, 2, 3, 4]
+        assert saved[0].raw_data["message"] == "Message 1"
+        assert saved[1].raw_data["message"] == "Edited 2"
+        assert [row.is_read for row in saved] == [True, True, True, False]
+
+    @pytest.mark.asyncio
+    async def test_upsert_messages_deduplicates_batch(self, test_session, sample_chat_data):
+        """Test that duplicate keys in one batch keep the last row."""
+        chat_id = sample_chat_data["id"]
+        rows = [
+            message_to_row(make_telethon_message(1, "First"), chat_id),
+            message_to_row(make_telethon_message(1, "Second"), chat_id),
+        ]
+
+        assert await upsert_messages(test_session, rows) == 1
+        await test_session.commit()
+
+        result = await test_session.execute(select(Message.raw_data).where(Message.chat_id == chat_id))
+        assert result.scalar_one()["message"] == "Second"
+
+    @pytest.mark.asyncio
+    async def test_upsert_messages_empty(self, test_session):
+        """Test that an empty batch is a no-op."""
+        assert await upsert_messages(test_session, []) == 0
+
+
+class TestSaveIncomingMessage:
+    """Test combined message, chat and sender upsert."""
+
+    @staticmethod
+    def chat_row(chat_id, title):
+        return {"id": chat_id, "chat_type": "Channel", "title": title, "raw_data": {"title": title}, "raw_hash": title}
+
+    @staticmethod
+    def user_row(user_id, first_name):
+        return {"id": user_id, "first_name": first_name, "is_bot": False, "raw_data": {}, "raw_hash": first_name}
+
+    @pytest.mark.asyncio
+    async def test_upserts_message_chat_and_sender(self, test_session, sample_chat_data, sample_user_data):
+        """Test that all rows are written and chats left out are not touched."""
+        chat_id = sample_chat_data["id"]
+        user_id = sample_user_data["id"]
+        message_row = message_to_row(make_telethon_message(1, "Hello", sender_id=user_id), chat_id)
+
+        await save_incoming_messages(test_session, [message_row], [self.chat_row(chat_id, "First")], [self.user_row(user_id, "Alice")])
+        await test_session.commit()
+
+        message_row = message_to_row(make_telethon_message(1, "Edited", sender_id=user_id), chat_id)
+        await save_incoming_messages(test_session, [message_row], [], [self.user_row(user_id, "Bob")])
+        await test_session.commit()
+
+        result = await test_session.execute(
+            select(Chat.title, User.first_name, Message.raw_data)
+            .join(Chat, Chat.id == Message.chat_id)
+            .join(User, User.id == Message.sender_id)
+            .where(Message.chat_id == chat_id)
+        )
+        assert result.one() == ("First", "Bob", {"id": 1, "message": "Edited"})
+
+
+class TestUserRepository:
+    """Test cached username lookups."""
+
+    @pytest.mark.asyncio
+    async def test_load_usernames_uses_cache(self, test_session, sample_user_data):
+        """Test that cached names are served without a query until invalidated."""
+        test_session.add(User(**sample_user_data))
+        await test_session.commit()
+        user_id = sample_user_data["id"]
+        unknown_id = user_id + 1
+
+        usernames = await load_usernames(test_session, [user_id, unknown_id, None])
+        assert usernames == {user_id: "testuser", unknown_id: None}
+
+        await test_session.execute(User.__table__.update().where(User.id == user_id).values(username="renamed"))
+        await test_session.commit()
+        assert (await load_usernames(test_session, [user_id]))[user_id] == "testuser"
+
+        username_cache.invalidate([user_id])
+        assert (await load_usernames(test_session, [user_id]))[user_id] == "renamed"
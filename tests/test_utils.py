@@ -0,0 +1,248 @@
+import time
+from datetime import UTC, date, datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import exc, insert, select, text, update
+from sqlalchemy.ext.asyncio import create_async_engine
+from telethon.tl import types
+
+from dependency import replica_routing_session
+from models.chat_config import ChatConfig
+from utils import json_codec
+from utils.db_pool import InstrumentedPool, PoolMetrics, pool_stats
+from utils.rate_limit import RateLimiter, TokenBucket, estimate_tokens
+from utils.telegram_serializer import safe_telegram_to_dict
+from utils.ttl_cache import TTLCache
+
+
+class TestTokenBucket:
+    """Test token bucket rate limiting."""
+
+    @pytest.mark.asyncio
+    async def test_acquire_within_capacity_does_not_wait(self):
+        """Test that a full bucket serves requests immediately."""
+        bucket = TokenBucket(rate_per_minute=60, capacity=5)
+
+        started = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+
+        assert time.monotonic() - started < 0.05
+
+    @pytest.mark.asyncio
+    async def test_acquire_waits_for_refill(self):
+        """Test that an empty bucket waits for the refill rate."""
+        # 100 tokens per second
+        bucket = TokenBucket(rate_per_minute=6000, capacity=1)
+        await bucket.acquire()
+
+        started = time.monotonic()
+        await bucket.acquire()
+
+        assert time.monotonic() - started >= 0.009
+
+    @pytest.mark.asyncio
+    async def test_oversized_request_is_clamped(self):
+        """Test that a request above capacity still passes."""
+        bucket = TokenBucket(rate_per_minute=60, capacity=10)
+
+        await bucket.acquire(1000)
+
+    @pytest.mark.asyncio
+    async def test_rate_limiter_counts_requests_and_tokens(self):
+        """Test that the limiter takes one request and the given tokens."""
+        limiter = RateLimiter(requests_per_minute=100, tokens_per_minute=1000)
+
+        await limiter.acquire(400)
+
+        assert limiter.requests._tokens == pytest.approx(99, abs=0.1)
+        assert limiter.tokens._tokens == pytest.approx(600, abs=1)
+
+    def test_estimate_tokens(self):
+        """Test rough token estimate."""
+        assert estimate_tokens("") == 1
+        assert estimate_tokens("a" * 300) == 101
+
+
+class TestTTLCache:
+    """Test TTL/LRU cache."""
+
+    def test_get_and_set(self):
+        """Test storing and reading values."""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set(1, "alice")
+
+        assert cache.get(1) == "alice"
+        assert cache.get(2, "missing") == "missing"
+
+    def test_least_recently_used_is_evicted(self):
+        """Test that the oldest unused entry goes first."""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set(1, "alice")
+        cache.set(2, "bob")
+        cache.get(1)
+        cache.set(3, "carol")
+
+        assert cache.get(1) == "alice"
+        assert cache.get(2) is None
+        assert len(cache) == 2
+
+    def test_entries_expire(self):
+        """Test that entries are dropped after the TTL."""
+        cache = TTLCache(maxsize=10, ttl=0)
+        cache.set(1, "alice")
+
+        assert cache.get(1) is None
+        assert len(cache) == 0
+
+    def test_get_many_and_invalidate(self):
+        """Test bulk lookup including cached None values and invalidation."""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set(1, "alice")
+        cache.set(2, None)
+
+        found, missing = cache.get_many([1, 2, 3])
+        assert found == {1: "alice", 2: None}
+        assert missing == {3}
+
+        cache.invalidate([1, 3])
+        assert cache.get_many([1, 2])[1] == {1}
+
+
+class TestTelegramSerializer:
+    """Test conversion of Telegram objects to JSON-compatible dicts."""
+
+    def test_telethon_message(self):
+        """Test that nested TL objects, bytes and datetimes are converted."""
+        sent = datetime(2026, 1, 2, 3, 4, 5, tzinfo=UTC)
+        message = types.Message(
+            id=1,
+            peer_id=types.PeerChannel(channel_id=2),
+            date=sent,
+            message="Hello",
+            entities=[types.MessageEntityBold(offset=0, length=5)],
+            media=types.MessageMediaPhoto(
+                photo=types.Photo(id=3, access_hash=4, file_reference=b"\x00\x01", date=sent, sizes=[types.PhotoStrippedSize(type="i", bytes=b"abc")], dc_id=2)
+            ),
+        )
+
+        data = safe_telegram_to_dict(message)
+
+        assert data["date"] == "2026-01-02T03:04:05+00:00"
+        assert data["peer_id"] == {"channel_id": 2}
+        assert data["entities"] == [{"offset": 0, "length": 5}]
+        assert data["media"]["photo"]["file_reference"] == "<bytes:2>"
+        assert data["media"]["photo"]["sizes"] == [{"type": "i", "bytes": "<bytes:3>"}]
+        assert "_" not in data
+
+    def test_plain_values(self):
+        """Test private keys, custom objects and values json cannot encode."""
+
+        class Tagged(int):
+            pass
+
+        raw = {
+            "_private": 1,
+            "text": "hi",
+            "flags": [True, None, 1.5],
+            "day": date(2026, 1, 2),
+            "obj": SimpleNamespace(visible=b"xy", _hidden=1),
+            "pair": (1, "a"),
+            "bad_pair": (1, b"a"),
+            "blob": bytearray(b"a"),
+            "tagged": Tagged(3),
+            "keys": {1, 2},
+        }
+
+        assert safe_telegram_to_dict(SimpleNamespace(to_dict=lambda: raw)) == {
+            "text": "hi",
+            "flags": [True, None, 1.5],
+            "day": "2026-01-02",
+            "obj": {"visible": "<bytes:2>"},
+            "pair": (1, "a"),
+            "bad_pair": "(1, b'a')",
+            "blob": "bytearray(b'a')",
+            "tagged": {},
+            "keys": "{1, 2}",
+        }
+
+
+class TestJsonCodec:
+    """Test JSON column encoding."""
+
+    @pytest.mark.parametrize("orjson", [json_codec.orjson, None], ids=["orjson", "json"])
+    def test_round_trip(self, orjson):
+        """Test that values survive encoding with either library."""
+        value = {"text": "Привет 👍", 1: [True, None, 1.5], "access_hash": -(2**63)}
+
+        with patch.object(json_codec, "orjson", orjson):
+            encoded = json_codec.dumps(value)
+            assert isinstance(encoded, str)
+            assert json_codec.loads(encoded) == {"text": "Привет 👍", "1": [True, None, 1.5], "access_hash": -(2**63)}
+            assert json_codec.loads(encoded.encode()) == json_codec.loads(encoded)
+
+    def test_values_orjson_refuses_fall_back_to_json(self):
+        """Test that integers wider than 64 bits are still encoded."""
+        assert json_codec.dumps({"id": 2**70}) == '{"id": 1180591620717411303424}'
+
+
+class TestDbPool:
+    """Test connection pool checkout metrics."""
+
+    def test_wait_histogram(self):
+        """Test that waits are counted in the bucket of their upper bound."""
+        metrics = PoolMetrics()
+        for wait in (0.0005, 0.001, 0.2, 10):
+            metrics.observe(wait)
+
+        snapshot = metrics.snapshot()
+        assert snapshot["checkouts"] == 4
+        assert snapshot["wait_seconds_max"] == 10
+        assert snapshot["wait_buckets"]["le_0.001"] == 2
+        assert snapshot["wait_buckets"]["le_0.5"] == 1
+        assert snapshot["wait_buckets"]["inf"] == 1
+
+    @pytest.mark.asyncio
+    async def test_checkouts_and_timeouts_are_recorded(self):
+        """Test that an exhausted pool reports the failed checkout."""
+        engine = create_async_engine(
+            "sqlite+aiosqlite:///:memory:", poolclass=InstrumentedPool, pool_logging_name="test_pool", pool_size=1, max_overflow=0, pool_timeout=0.05
+        )
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+                with pytest.raises(exc.TimeoutError):
+                    async with engine.connect():
+                        pass
+
+            stats = pool_stats()["test_pool"]
+            assert stats["checkouts"] == 1
+            assert stats["timeouts"] == 1
+            assert stats["checked_out"] == 0
+        finally:
+            await engine.dispose()
+
+    def test_replica_routing_session(self):
+        """Test that reads go to the replica while writes and flushes go to the primary."""
+        primary = create_async_engine("sqlite+aiosqlite:///:memory:")
+        replica = create_async_engine("sqlite+aiosqlite:///:memory:")
+        session = replica_routing_session(primary, replica)()
+
+        assert session.get_bind(clause=select(ChatConfig)) is replica.sync_engine
+        assert session.get_bind(clause=insert(ChatConfig)) is primary.sync_engine
+        assert session.get_bind(clause=update(ChatConfig).values(enrich_messages=True)) is primary.sync_engine
+        session._flushing = True
+        assert session.get_bind(mapper=ChatConfig.__mapper__) is primary.sync_engine
+
+    def test_reads_after_a_write_stay_on_primary(self):
+        """Test that a session reads its own writes from the primary instead of a lagging replica."""
+        primary = create_async_engine("sqlite+aiosqlite:///:memory:")
+        replica = create_async_engine("sqlite+aiosqlite:///:memory:")
+        session = replica_routing_session(primary, replica)()
+        other = replica_routing_session(primary, replica)()
+
+        assert session.get_bind(clause=update(ChatConfig).values(enrich_messages=True)) is primary.sync_engine
+        assert session.get_bind(clause=select(ChatConfig)) is primary.sync_engine
+        assert other.get_bind(clause=select(ChatConfig)) is replica.sync_engine
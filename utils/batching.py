@@ -0,0 +1,15 @@
+from collections.abc import AsyncGenerator
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+async def take_batch(generator: AsyncGenerator[T, None], batch_size: int = 1000) -> AsyncGenerator[list[T], None]:
+    batch = []
+    async for item in generator:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,81 @@
+import time
+from bisect import bisect_left
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Upper bounds in seconds of the checkout wait histogram, the last bucket counts everything slower
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+    """Checkout wait statistics of one connection pool since the process started"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def observe(self, wait: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.wait_buckets[bisect_left(WAIT_BUCKETS, wait)] += 1
+
+    def snapshot(self) -> dict[str, Any]:
+        buckets = {f"le_{bound}": count for bound, count in zip(WAIT_BUCKETS, self.wait_buckets[:-1], strict=True)}
+        buckets["inf"] = self.wait_buckets[-1]
+        return {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_seconds_total": round(self.wait_seconds_total, 6),
+            "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+            "wait_seconds_max": round(self.wait_seconds_max, 6),
+            "wait_buckets": buckets,
+        }
+
+
+# Pools and their metrics by pool_logging_name, a pool recreated after invalidation keeps counting
+pools: dict[str, "InstrumentedPool"] = {}
+pool_metrics: dict[str, PoolMetrics] = {}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long every checkout waits for a connection.
+    The wait includes opening overflow connections and the pre-ping, a pool sized right keeps it near zero.
+    Pass pool_logging_name to create_async_engine to tell the pools of several engines apart.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = self._orig_logging_name or "default"
+        pools[self.name] = self
+        self.metrics = pool_metrics.setdefault(self.name, PoolMetrics())
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.observe(time.perf_counter() - started)
+        return connection
+
+
+def pool_stats() -> dict[str, dict[str, Any]]:
+    """Current usage and checkout wait statistics of every instrumented pool"""
+    return {
+        name: {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            **pool.metrics.snapshot(),
+        }
+        for name, pool in pools.items()
+    }
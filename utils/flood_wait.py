@@ -0,0 +1,36 @@
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger("flood_wait")
+
+
+class FloodWaitGate:
+    """
+    Shared pause for every Telegram API caller.
+    FloodWait is issued per account, so once one worker hits it all of them must wait.
+    """
+
+    def __init__(self, jitter: float = 1.0):
+        self.jitter = jitter
+        self._resume_at = 0.0
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self._resume_at - time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """Block callers for at least the given number of seconds"""
+        resume_at = time.monotonic() + seconds + random.uniform(0, self.jitter)
+        if resume_at > self._resume_at:
+            self._resume_at = resume_at
+            logger.warning(f"Telegram FloodWait: pausing API calls for {seconds}s")
+
+    async def wait(self) -> None:
+        """Sleep until the current pause is over"""
+        while (delay := self.remaining) > 0:
+            await asyncio.sleep(delay)
+
+
+flood_wait_gate = FloodWaitGate()
@@ -0,0 +1,67 @@
+import json
+import logging
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("json_codec")
+
+
+def dumps(value: Any) -> str:
+    """Encode a JSON column value, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+        except orjson.JSONEncodeError:
+            # Integers wider than 64 bits and other values orjson refuses, json handles them or raises
+            pass
+    return json.dumps(value)
+
+
+def loads(value: str | bytes) -> Any:
+    """Decode a JSON column value, both libraries accept the UTF-8 bytes sent by PostgreSQL as they are"""
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+
+def _jsonb_encoder(value: str | bytes) -> bytes:
+    # \x01 is the jsonb binary format version PostgreSQL expects in front of the text
+    return b"\x01" + (value if isinstance(value, bytes) else value.encode())
+
+
+def _jsonb_decoder(value: bytes) -> Any:
+    return loads(value[1:])
+
+
+def _json_encoder(value: str | bytes) -> bytes:
+    return value if isinstance(value, bytes) else value.encode()
+
+
+async def _set_type_codecs(connection) -> None:
+    await connection.set_type_codec("json", encoder=_json_encoder, decoder=loads, schema="pg_catalog", format="binary")
+    await connection.set_type_codec("jsonb", encoder=_jsonb_encoder, decoder=_jsonb_decoder, schema="pg_catalog", format="binary")
+
+
+def engine_json_options() -> dict[str, Any]:
+    """create_async_engine arguments that encode and decode JSON columns with this codec"""
+    return {"json_serializer": dumps, "json_deserializer": loads}
+
+
+def register_asyncpg_codecs(engine: AsyncEngine) -> None:
+    """
+    Replace the json and jsonb codecs SQLAlchemy installs on every new asyncpg connection.
+    Its decoders turn the received bytes into str before parsing, these hand the bytes to the parser directly.
+    """
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_type_codecs(dbapi_connection, connection_record):
+        dbapi_connection.run_async(_set_type_codecs)
+
+    logger.info(f"JSON columns are encoded with {'orjson' if orjson is not None else 'json'}")
@@ -1,5 +1,6 @@
+import hashlib
 import json
-from typing import Any, Dict
+from typing import Any, Callable, Dict
 
 
 def safe_telegram_to_dict(obj: Any) -> Dict[str, Any]:
@@ -18,18 +19,35 @@ def _clean_dict(data: Any) -> Any:
     """
     Recursively clean dictionary to make it JSON serializable
     """
-    if isinstance(data, dict):
-        cleaned = {}
-        for key, value in data.items():
-            if key.startswith('_'):
-                continue  # Skip private attributes
-            cleaned[key] = _clean_dict(value)
-        return cleaned
-    elif isinstance(data, list):
-        return [_clean_dict(item) for item in data]
-    elif isinstance(data, bytes):
-        return f"<bytes:{len(data)}>"
-    elif hasattr(data, 'isoformat'):  # datetime objects
+    handler = _handlers.get(type(data))
+    if handler is None:
+        handler = _handlers[type(data)] = _handler_for(type(data))
+    return handler(data)
+
+
+def _clean_mapping(data: dict) -> dict:
+    return {key: _clean_dict(value) for key, value in data.items() if not key.startswith('_')}  # Skip private attributes
+
+
+def _clean_list(data: list) -> list:
+    return [_clean_dict(item) for item in data]
+
+
+def _clean_bytes(data: bytes) -> str:
+    return f"<bytes:{len(data)}>"
+
+
+def _clean_isoformat(data: Any) -> str:
+    return data.isoformat()
+
+
+def _keep(data: Any) -> Any:
+    return data
+
+
+def _clean_object(data: Any) -> Any:
+    """Types without a dedicated handler, what they have can differ between instances"""
+    if hasattr(data, 'isoformat'):
         return data.isoformat()
     elif hasattr(data, '__dict__'):  # custom objects
         return _clean_dict(data.__dict__)
@@ -38,4 +56,61 @@ def _clean_dict(data: Any) -> Any:
             json.dumps(data)  # Test if serializable
             return data
         except (TypeError, ValueError):
-            return str(data) 
\ No newline at end of file
+            return str(data)
+
+
+def _handler_for(cls: type) -> Callable[[Any], Any]:
+    """Pick the handler for a type once, in the order the checks of _clean_object would match"""
+    if issubclass(cls, dict):
+        return _clean_mapping
+    elif issubclass(cls, list):
+        return _clean_list
+    elif issubclass(cls, bytes):
+        return _clean_bytes
+    elif hasattr(cls, 'isoformat'):  # datetime objects
+        return _clean_isoformat
+    return _clean_object
+
+
+# Top level fields of serialized entities that change on their own, like the online status of a user
+# or the read state of a dialog. They are stored with the rest of raw_data but do not trigger a write
+VOLATILE_FIELDS = frozenset(
+    {
+        "status",
+        "stories_max_id",
+        "top_message",
+        "read_inbox_max_id",
+        "read_outbox_max_id",
+        "unread_count",
+        "unread_mentions_count",
+        "unread_reactions_count",
+    }
+)
+
+# Handler per exact type, JSON scalars are returned as they are without serializing them to check
+_handlers: Dict[type, Callable[[Any], Any]] = {
+    dict: _clean_mapping,
+    list: _clean_list,
+    bytes: _clean_bytes,
+    str: _keep,
+    int: _keep,
+    float: _keep,
+    bool: _keep,
+    type(None): _keep,
+}
+
+
+def raw_data_hash(data: Any) -> str:
+    """
+    Stable sha256 of serialized Telegram data, used to detect unchanged entities
+    """
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def entity_hash(raw_data: dict[str, Any]) -> str:
+    """
+    raw_data_hash of a serialized chat or user without the fields that change all the time,
+    so that an entity only counts as changed when something worth storing changed
+    """
+    return raw_data_hash({key: value for key, value in raw_data.items() if key not in VOLATILE_FIELDS})